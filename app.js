@@ -15,13 +15,19 @@ import { Simple3D } from './libraries/Simple3D.js';
 import { CharacterSelectScene } from './libraries/CharacterSelectScene.js';
 import { InventoryUi } from './libraries/InventoryUi.js';
 
-const CLIENT_PROTOCOL_VERSION = '1.1.0';
+const CLIENT_PROTOCOL_VERSION = '1.2.0';
+// Capacidades declaradas en login (ver docs/WS_PROTOCOL.md).
+const CLIENT_CAPABILITIES = ['supports_chunk_patch', 'supports_player_aoi', 'supports_players_snapshot'];
 const DEFAULT_HOTBAR_SLOTS = 8;
 
 let ws = null;
 let simple3D = new Simple3D();
 let clientState = 'AUTH';
 let worldData = null;
+// Versiones de chunk voxel de la ultima entrada al mundo (resync delta en reconexion).
+let voxelSyncState = null;
+// Capacidades aceptadas por el servidor en el ultimo login.
+let serverCapabilities = new Set();
 let rootLayout = null;
 let authRoot = null;
 
@@ -2603,6 +2609,7 @@ function hideWorldPanel() {
     setWorldUiMode(false);
     hideDeathOverlay();
     worldData = null;
+    if (voxelSyncState) voxelSyncState.snapshot = simple3D.exportWorldVoxelOverridesByChunk?.() || null;
     simple3D.dispose();
     if (rootLayout && rootLayout.refresh) rootLayout.refresh();
 }
@@ -2698,6 +2705,11 @@ async function ensureConnected(url) {
         ws.on('world_player_joined', (msg) => {
             const p = msg?.payload || {};
             if (p.id == null) return;
+            // Con AOI el avatar llega por world_player_aoi_enter solo si esta cerca.
+            if (serverCapabilities.has('supports_player_aoi')) {
+                if (p.username) addChatLine(`${p.username} entro al mundo.`, 'system');
+                return;
+            }
             simple3D.upsertRemotePlayer({
                 id: p.id,
                 username: p.username || `P${p.id}`,
@@ -2722,7 +2734,7 @@ async function ensureConnected(url) {
             const username = p.username;
             if (username) addChatLine(`${username} entro al mundo.`, 'system');
         });
-        ws.on('world_player_moved', (msg) => {
+        const onRemotePlayerState = (msg) => {
             const p = msg?.payload || {};
             if (p?.id != null && !simple3D.remotePlayers?.has(String(p.id))) {
                 simple3D.upsertRemotePlayer({
@@ -2749,6 +2761,16 @@ async function ensureConnected(url) {
             }
             if (p.position) simple3D.setRemotePlayerTarget(p.id, p.position);
             if (p.animation_state) simple3D.setRemotePlayerAnimationState?.(p.id, p.animation_state);
+        };
+        ws.on('world_player_moved', onRemotePlayerState);
+        ws.on('world_players_snapshot', (msg) => {
+            const players = Array.isArray(msg?.payload?.players) ? msg.payload.players : [];
+            players.forEach((p) => onRemotePlayerState({ payload: p }));
+        });
+        ws.on('world_player_aoi_enter', onRemotePlayerState);
+        ws.on('world_player_aoi_leave', (msg) => {
+            const p = msg?.payload || {};
+            if (p.id != null) simple3D.removeRemotePlayer(p.id);
         });
         ws.on('world_player_class_changed', (msg) => {
             const p = msg?.payload || {};
@@ -2857,12 +2879,16 @@ async function ensureConnected(url) {
             const change = p?.change || null;
             if (!change) return;
             simple3D.applyServerVoxelChange?.(change);
+            applyVoxelChunkVersions(p?.chunk_versions);
         });
         ws.on('world_chunk_patch', (msg) => {
             const p = msg?.payload || {};
             const changes = Array.isArray(p?.changes) ? p.changes : [];
-            if (changes.length <= 0) return;
-            simple3D.applyServerVoxelChanges?.(changes);
+            const resetChunks = Array.isArray(p?.reset_chunks) ? p.reset_chunks : [];
+            if (changes.length <= 0 && resetChunks.length <= 0) return;
+            if (resetChunks.length > 0) simple3D.resetServerVoxelChunks?.(resetChunks);
+            if (changes.length > 0) simple3D.applyServerVoxelChanges?.(changes);
+            applyVoxelChunkVersions(p?.chunk_versions);
         });
         ws.on('world_chat_message', (msg) => {
             const p = msg?.payload || {};
@@ -3153,6 +3179,73 @@ async function playEnterWorldConfirmFx() {
     await new Promise((resolve) => setTimeout(resolve, 240));
 }
 
+const VOXEL_BLOCK_DEFS_STORAGE_KEY = 'mmo_voxel_block_defs_v1';
+
+function loadCachedVoxelBlockDefs() {
+    try {
+        const raw = localStorage.getItem(VOXEL_BLOCK_DEFS_STORAGE_KEY);
+        if (!raw) return null;
+        const parsed = JSON.parse(raw);
+        if (!parsed || typeof parsed.version !== 'string' || !Array.isArray(parsed.defs)) return null;
+        return parsed;
+    } catch (_) {
+        return null;
+    }
+}
+
+// El servidor omite voxel_block_defs (null) si la version que enviamos coincide.
+function resolveVoxelBlockDefs(payload, cached) {
+    const version = String(payload?.voxel_block_defs_version || '');
+    if (Array.isArray(payload?.voxel_block_defs)) {
+        if (version) {
+            try {
+                localStorage.setItem(VOXEL_BLOCK_DEFS_STORAGE_KEY, JSON.stringify({ version, defs: payload.voxel_block_defs }));
+            } catch (_) {
+                // noop
+            }
+        }
+        return;
+    }
+    if (cached && cached.version === version) {
+        payload.voxel_block_defs = cached.defs;
+    }
+}
+
+function buildVoxelSyncRequest() {
+    if (!voxelSyncState?.snapshot) return null;
+    return { epoch: voxelSyncState.epoch, world_id: voxelSyncState.worldId, chunks: voxelSyncState.versions };
+}
+
+// mode=delta: el servidor solo envia overrides de chunks con version distinta;
+// el resto sale de la copia guardada al salir del mundo.
+function resolveVoxelSync(payload) {
+    const sync = payload?.voxel_sync;
+    const prev = voxelSyncState;
+    voxelSyncState = null;
+    if (!sync || typeof sync.epoch !== 'string') return;
+    const changed = (sync.chunks && typeof sync.chunks === 'object') ? sync.chunks : {};
+    let versions = { ...changed };
+    if (sync.mode === 'delta' && prev?.snapshot) {
+        const byChunk = prev.snapshot;
+        Object.keys(changed).forEach((key) => byChunk.delete(key));
+        (Array.isArray(sync.removed) ? sync.removed : []).forEach((key) => byChunk.delete(key));
+        const merged = Array.isArray(payload.voxel_overrides) ? payload.voxel_overrides.slice() : [];
+        byChunk.forEach((rows) => { for (const row of rows) merged.push(row); });
+        payload.voxel_overrides = merged;
+        versions = { ...prev.versions, ...changed };
+        (Array.isArray(sync.removed) ? sync.removed : []).forEach((key) => { delete versions[key]; });
+    }
+    voxelSyncState = { epoch: sync.epoch, worldId: Number(sync.world_id) || 0, versions, snapshot: null };
+}
+
+function applyVoxelChunkVersions(chunkVersions) {
+    if (!voxelSyncState || !chunkVersions || typeof chunkVersions !== 'object') return;
+    for (const [key, value] of Object.entries(chunkVersions)) {
+        const v = Number(value) | 0;
+        if (!(key in voxelSyncState.versions) || voxelSyncState.versions[key] < v) voxelSyncState.versions[key] = v;
+    }
+}
+
 async function enterWorld(characterId = null) {
     if (!ws || !ws.socket || ws.socket.readyState !== WebSocket.OPEN) {
         UIToast.show('No hay conexion activa', 'error');
@@ -3166,7 +3259,12 @@ async function enterWorld(characterId = null) {
     await playEnterWorldConfirmFx();
     setClientState('LOADING_WORLD');
     try {
-        const resp = await new NetMessage('enter_world').set('character_id', charIdNum).send();
+        const cachedDefs = loadCachedVoxelBlockDefs();
+        const resp = await new NetMessage('enter_world')
+            .set('character_id', charIdNum)
+            .set('voxel_block_defs_version', cachedDefs?.version || '')
+            .set('voxel_sync', buildVoxelSyncRequest())
+            .send();
         if (!resp?.payload?.ok) {
             resetCharacterEnterFxStyles();
             setClientState('CHAR_SELECT', 'No se pudo entrar al mundo');
@@ -3174,6 +3272,8 @@ async function enterWorld(characterId = null) {
             return false;
         }
         applyNetworkConfig(resp?.payload?.network_config);
+        resolveVoxelBlockDefs(resp.payload, cachedDefs);
+        resolveVoxelSync(resp.payload);
         hideCharacterSelect();
         showWorldPanel(resp.payload);
         UIToast.show(`Entraste a ${resp.payload.world.world_name}`, 'success');
@@ -3267,9 +3367,12 @@ export function setup() {
             const resp = await new NetMessage('login')
                 .set('username', username)
                 .set('password', password)
+                .set('protocol_version', CLIENT_PROTOCOL_VERSION)
+                .set('capabilities', CLIENT_CAPABILITIES)
                 .send();
             if (resp?.payload?.ok) {
                 applyNetworkConfig(resp?.payload?.network_config);
+                serverCapabilities = new Set(Array.isArray(resp?.payload?.capabilities) ? resp.payload.capabilities : []);
                 const user = resp.payload.user || {};
                 setCurrentUser(`Usuario actual: ${user.username || username}`, 0x2ecc71);
                 UIToast.show('Login correcto', 'success');
@@ -3832,6 +3935,7 @@ export function main(delta) {
                 handleVoxelBatchResults(results, reconciled);
                 const changes = Array.isArray(resp?.payload?.changes) ? resp.payload.changes : [];
                 if (changes.length > 0) simple3D.applyServerVoxelChanges?.(changes);
+                applyVoxelChunkVersions(resp?.payload?.chunk_versions);
             })
             .catch(() => {
                 const reverted = simple3D.rollbackVoxelActions?.(voxelActions) || 0;
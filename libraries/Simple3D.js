@@ -6553,6 +6553,20 @@ export class Simple3D {
         }
     }
 
+    // Overrides confirmados por el servidor agrupados por chunk (resync delta).
+    exportWorldVoxelOverridesByChunk() {
+        const out = new Map();
+        this.worldVoxelOverridesByChunk.forEach((bucket, chunkKey) => {
+            const rows = [];
+            bucket.forEach((blockId, worldKey) => {
+                const [x, y, z] = worldKey.split(',').map((v) => Number(v) | 0);
+                rows.push({ x, y, z, block_id: blockId });
+            });
+            out.set(chunkKey, rows);
+        });
+        return out;
+    }
+
     _setWorldVoxelOverrideCache(x, y, z, blockId) {
         const ix = Number(x) | 0;
         const iy = Number(y) | 0;
@@ -8255,6 +8269,37 @@ export class Simple3D {
         return true;
     }
 
+    resetServerVoxelChunks(chunkKeys) {
+        // Puesta al dia de chunks lejanos: el mismo parche trae todos sus
+        // overrides, asi que se descartan los cacheados y los chunks cargados
+        // se regeneran (base + overrides nuevos).
+        const keys = Array.isArray(chunkKeys) ? chunkKeys : [];
+        for (const rawKey of keys) {
+            const key = (rawKey || '').toString();
+            if (!key) continue;
+            const bucket = this.worldVoxelOverridesByChunk.get(key);
+            if (bucket) {
+                for (const worldKey of bucket.keys()) this.worldVoxelOverrides.delete(worldKey);
+                this.worldVoxelOverridesByChunk.delete(key);
+            }
+            let requeue = null;
+            for (const [reqId, pending] of this.chunkWorkerPending.entries()) {
+                if (pending?.key !== key) continue;
+                this.chunkWorkerPending.delete(reqId);
+                requeue = pending;
+            }
+            const chunk = this.chunks.get(key);
+            if (chunk) {
+                this.chunks.delete(key);
+                this._removeVoxelChunkMesh(key);
+                this.voxelDirtyChunkKeys.delete(key);
+                this.terrainDirty = true;
+                requeue = chunk;
+            }
+            if (requeue) this.enqueueChunk(requeue.cx, requeue.cz);
+        }
+    }
+
     applyServerVoxelChanges(changes) {
         const rows = Array.isArray(changes) ? changes : [];
         let any = false;
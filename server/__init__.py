@@ -2,6 +2,7 @@ from .auth import utc_now, hash_password, verify_password
 from .database import DbConfig, DatabaseManager
 from .decor import build_world_decor_slots
 from .terrain import build_fixed_world_terrain
+from .voxel_terrain import TerrainContext, generate_base_chunk
 from .ws_server import SimpleWsServer
 from .gui import ServerGui, main
 
@@ -13,6 +14,8 @@ __all__ = [
     "DatabaseManager",
     "build_world_decor_slots",
     "build_fixed_world_terrain",
+    "TerrainContext",
+    "generate_base_chunk",
     "SimpleWsServer",
     "ServerGui",
     "main",
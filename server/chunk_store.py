@@ -0,0 +1,146 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+
+from .voxel_terrain import BASE_CHUNK_GENERATOR_VERSION, HAS_NUMPY, VOXEL_LAYER_SIZE, TerrainContext, np
+
+DEFAULT_CHUNK_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chunk_cache")
+
+# Fichero de region: cabecera fija + 1 byte de presencia por slot + slots de
+# tamano fijo (un chunk uint16 LE por slot) a partir de REGION_DATA_OFFSET.
+REGION_CHUNKS = 16
+REGION_SLOTS = REGION_CHUNKS * REGION_CHUNKS
+REGION_MAGIC = b"VXRG"
+REGION_HEADER = struct.Struct("<4sHHH")
+REGION_PRESENCE_OFFSET = 64
+REGION_DATA_OFFSET = 4096
+
+
+def base_chunk_cache_key(ctx: TerrainContext, top_blocks: dict | None) -> str:
+    # El terreno base depende solo de la version del generador, semilla, altura,
+    # mundos_terrain y los bloques de superficie del catalogo: cualquier cambio
+    # produce otra clave (y por tanto otro directorio).
+    payload = {
+        "generator": BASE_CHUNK_GENERATOR_VERSION,
+        "seed": ctx.world_seed,
+        "height": int(ctx.height),
+        "terrain_config": ctx.terrain_config,
+        "terrain_cells": ctx.terrain_cells,
+        "top_blocks": top_blocks or {},
+    }
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+class BaseChunkDiskCache:
+    """Chunks base ya generados en disco, agrupados en ficheros de region de
+    REGION_CHUNKS x REGION_CHUNKS chunks dentro de un directorio por clave (ver
+    base_chunk_cache_key).
+
+    Cada region se mapea una vez con mmap y get() devuelve vistas NumPy de solo
+    lectura sobre el mapeo, sin copiar el chunk. put() escribe el slot y
+    despues marca su byte de presencia, asi que varios procesos pueden
+    rellenar la misma region a la vez (cada uno escribe slots distintos).
+    close() suelta los mapeos.
+    """
+
+    def __init__(self, root_dir: str, key: str, height: int):
+        self.key = str(key)
+        self.height = int(height)
+        self.chunk_bytes = self.height * VOXEL_LAYER_SIZE * 2
+        self.region_bytes = REGION_DATA_OFFSET + (REGION_SLOTS * self.chunk_bytes)
+        self.dir = os.path.join(root_dir, self.key)
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self._maps: dict[tuple[int, int], mmap.mmap] = {}
+
+    def _region_path(self, rx: int, rz: int) -> str:
+        return os.path.join(self.dir, f"r.{int(rx)}.{int(rz)}.bin")
+
+    def _slot(self, chunk_x: int, chunk_z: int):
+        cx = int(chunk_x)
+        cz = int(chunk_z)
+        rx = cx // REGION_CHUNKS
+        rz = cz // REGION_CHUNKS
+        return (rx, rz), (cx - (rx * REGION_CHUNKS)) + ((cz - (rz * REGION_CHUNKS)) * REGION_CHUNKS)
+
+    def _header(self) -> bytes:
+        return REGION_HEADER.pack(REGION_MAGIC, BASE_CHUNK_GENERATOR_VERSION, self.height, REGION_CHUNKS)
+
+    def _region_map(self, region: tuple[int, int]):
+        mm = self._maps.get(region)
+        if mm is not None:
+            return mm
+        try:
+            with open(self._region_path(*region), "rb") as fh:
+                if os.fstat(fh.fileno()).st_size == self.region_bytes:
+                    mm = mmap.mmap(fh.fileno(), self.region_bytes, access=mmap.ACCESS_READ)
+                    if mm[: REGION_HEADER.size] != self._header():
+                        mm.close()
+                        mm = None
+        except OSError:
+            mm = None
+        # Solo se recuerdan las regiones abiertas; una ausente puede crearla put().
+        if mm is not None:
+            self._maps[region] = mm
+        return mm
+
+    def get(self, chunk_x: int, chunk_z: int):
+        if not HAS_NUMPY:
+            return None
+        region, slot = self._slot(chunk_x, chunk_z)
+        mm = self._region_map(region)
+        if mm is None or mm[REGION_PRESENCE_OFFSET + slot] != 1:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return np.frombuffer(
+            mm,
+            dtype="<u2",
+            count=self.height * VOXEL_LAYER_SIZE,
+            offset=REGION_DATA_OFFSET + (slot * self.chunk_bytes),
+        )
+
+    def put(self, chunk_x: int, chunk_z: int, blocks) -> None:
+        data = np.asarray(blocks, dtype="<u2").tobytes()
+        if len(data) != self.chunk_bytes:
+            raise ValueError(f"Chunk de tamano invalido: {len(data)} bytes (esperado {self.chunk_bytes})")
+        region, slot = self._slot(chunk_x, chunk_z)
+        os.makedirs(self.dir, exist_ok=True)
+        # seek + read/write en lugar de os.pread/os.pwrite (no existen en Windows).
+        fd = os.open(self._region_path(*region), os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644)
+        with os.fdopen(fd, "r+b") as fh:
+            if fh.seek(0, os.SEEK_END) != self.region_bytes:
+                # Region nueva (fichero disperso). La cabecera va antes que el
+                # tamano final: una region de tamano completo siempre la tiene.
+                fh.seek(0)
+                fh.write(self._header())
+                fh.flush()
+                fh.truncate(self.region_bytes)
+            else:
+                fh.seek(0)
+                if fh.read(REGION_HEADER.size) != self._header():
+                    return
+            fh.seek(REGION_DATA_OFFSET + (slot * self.chunk_bytes))
+            fh.write(data)
+            fh.flush()
+            fh.seek(REGION_PRESENCE_OFFSET + slot)
+            fh.write(b"\x01")
+        self.writes += 1
+
+    def close(self) -> None:
+        # Un mapeo con vistas NumPy aun vivas no se puede cerrar (BufferError);
+        # se suelta y lo libera el GC con la ultima vista.
+        maps = self._maps
+        self._maps = {}
+        for mm in maps.values():
+            try:
+                mm.close()
+            except BufferError:
+                pass
+
+    def stats(self) -> dict:
+        return {"key": self.key, "hits": self.hits, "misses": self.misses, "writes": self.writes}
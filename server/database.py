@@ -1,6 +1,8 @@
+from array import array
 from dataclasses import dataclass
 from datetime import datetime
 import json
+import sys
 import zlib
 
 import mysql.connector
@@ -8,6 +10,69 @@ from mysql.connector import errorcode
 
 from .auth import hash_password, utc_now
 
+VOXEL_CHUNK_BLOB_V2_MAGIC = b"VXC\x02"
+
+
+def encode_voxel_chunk_blob(overrides: dict[int, int]) -> bytes:
+    # v2: cabecera + indices locales uint16 ordenados + block_id uint16 (LE).
+    # El indice local es x + z*16 + y*256, igual que los chunks base.
+    keys = sorted(overrides)
+    indices = array("H", keys)
+    block_ids = array("H", [max(0, int(overrides[k])) for k in keys])
+    if sys.byteorder != "little":
+        indices.byteswap()
+        block_ids.byteswap()
+    raw = VOXEL_CHUNK_BLOB_V2_MAGIC + indices.tobytes() + block_ids.tobytes()
+    return zlib.compress(raw, level=6)
+
+
+def decode_voxel_chunk_blob(blob: bytes | bytearray | memoryview | None) -> dict[int, int]:
+    if blob is None:
+        return {}
+    try:
+        raw = zlib.decompress(blob)
+    except Exception:
+        return {}
+    if raw.startswith(VOXEL_CHUNK_BLOB_V2_MAGIC):
+        body = memoryview(raw)[len(VOXEL_CHUNK_BLOB_V2_MAGIC):]
+        count = len(body) // 4
+        indices = array("H")
+        block_ids = array("H")
+        indices.frombytes(body[: count * 2])
+        block_ids.frombytes(body[count * 2 : count * 4])
+        if sys.byteorder != "little":
+            indices.byteswap()
+            block_ids.byteswap()
+        return dict(zip(indices, block_ids))
+    return _decode_voxel_chunk_blob_v1(raw)
+
+
+def _decode_voxel_chunk_blob_v1(raw: bytes) -> dict[int, int]:
+    # Formato legacy: JSON {"v":1,"o":[[lx, y, lz, block_id], ...]}.
+    try:
+        payload = json.loads(raw.decode("utf-8"))
+    except Exception:
+        return {}
+    rows = payload.get("o") if isinstance(payload, dict) else []
+    if not isinstance(rows, list):
+        return {}
+    out = {}
+    for row in rows:
+        if not isinstance(row, list) or len(row) < 4:
+            continue
+        try:
+            lx = int(row[0])
+            y = int(row[1])
+            lz = int(row[2])
+            block_id = max(0, int(row[3]))
+        except Exception:
+            continue
+        if lx < 0 or lx > 15 or lz < 0 or lz > 15 or y < 0 or y > 255:
+            continue
+        out[lx + (lz * 16) + (y * 256)] = block_id
+    return out
+
+
 @dataclass
 class DbConfig:
     host: str
@@ -20,6 +85,9 @@ class DbConfig:
 class DatabaseManager:
     def __init__(self, config: DbConfig):
         self.config = config
+        # Sube con cada escritura en items_catalog; el servidor lo usa para no
+        # releer el catalogo mientras no cambie.
+        self.items_catalog_version = 0
 
     def _connect(self, include_database: bool = True):
         kwargs = {
@@ -136,6 +204,7 @@ class DatabaseManager:
                     fog_near DOUBLE NOT NULL DEFAULT 110,
                     fog_far DOUBLE NOT NULL DEFAULT 520,
                     fog_density DOUBLE NOT NULL DEFAULT 0.0025,
+                    voxel_storage VARCHAR(12) NOT NULL DEFAULT 'mysql',
                     is_active TINYINT(1) NOT NULL DEFAULT 0,
                     created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
                     updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
@@ -374,6 +443,8 @@ class DatabaseManager:
                 cursor.execute("ALTER TABLE mundos ADD COLUMN fog_far DOUBLE NOT NULL DEFAULT 520")
             if not self._column_exists(cursor, "mundos", "fog_density"):
                 cursor.execute("ALTER TABLE mundos ADD COLUMN fog_density DOUBLE NOT NULL DEFAULT 0.0025")
+            if not self._column_exists(cursor, "mundos", "voxel_storage"):
+                cursor.execute("ALTER TABLE mundos ADD COLUMN voxel_storage VARCHAR(12) NOT NULL DEFAULT 'mysql'")
             if not self._column_exists(cursor, "decor_assets", "biome"):
                 cursor.execute("ALTER TABLE decor_assets ADD COLUMN biome VARCHAR(20) NOT NULL DEFAULT 'any'")
             if not self._column_exists(cursor, "decor_assets", "target_count"):
@@ -1210,9 +1281,9 @@ class DatabaseManager:
                     decor_density, npc_slots, hub_size, island_size, platform_gap,
                     biome_shape_mode, organic_noise_scale, organic_noise_strength, organic_edge_falloff, bridge_curve_strength,
                     fall_death_enabled, void_death_enabled, fall_death_threshold_voxels,
-                    fog_enabled, fog_mode, fog_color, fog_near, fog_far, fog_density, is_active
+                    fog_enabled, fog_mode, fog_color, fog_near, fog_far, fog_density, voxel_storage, is_active
                 )
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
                 ON DUPLICATE KEY UPDATE
                     seed = VALUES(seed),
                     world_size = VALUES(world_size),
@@ -1243,6 +1314,7 @@ class DatabaseManager:
                     fog_near = VALUES(fog_near),
                     fog_far = VALUES(fog_far),
                     fog_density = VALUES(fog_density),
+                    voxel_storage = VALUES(voxel_storage),
                     is_active = VALUES(is_active)
                 """,
                 (
@@ -1276,6 +1348,7 @@ class DatabaseManager:
                     config.get("fog_near", 110.0),
                     config.get("fog_far", 520.0),
                     config.get("fog_density", 0.0025),
+                    config.get("voxel_storage", "mysql"),
                     active_flag,
                 ),
             )
@@ -1474,6 +1547,7 @@ class DatabaseManager:
             )
             conn.commit()
             cursor.close()
+            self.items_catalog_version += 1
         finally:
             conn.close()
 
@@ -1529,6 +1603,7 @@ class DatabaseManager:
             )
             conn.commit()
             cursor.close()
+            self.items_catalog_version += 1
         finally:
             conn.close()
 
@@ -1644,6 +1719,7 @@ class DatabaseManager:
             )
             conn.commit()
             cursor.close()
+            self.items_catalog_version += 1
             return {
                 "ok": True,
                 "usage": {
@@ -2038,48 +2114,6 @@ class DatabaseManager:
         finally:
             conn.close()
 
-    def _encode_voxel_chunk_blob(self, overrides: list[dict]) -> bytes:
-        payload = {
-            "v": 1,
-            "o": [
-                [int(r.get("lx") or 0), int(r.get("y") or 0), int(r.get("lz") or 0), max(0, int(r.get("block_id") or 0))]
-                for r in (overrides or [])
-            ],
-        }
-        raw = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
-        return zlib.compress(raw, level=6)
-
-    def _decode_voxel_chunk_blob(self, blob: bytes | bytearray | memoryview | None):
-        if blob is None:
-            return []
-        try:
-            if isinstance(blob, memoryview):
-                blob = blob.tobytes()
-            elif isinstance(blob, bytearray):
-                blob = bytes(blob)
-            elif not isinstance(blob, bytes):
-                blob = bytes(blob)
-            raw = zlib.decompress(blob)
-            payload = json.loads(raw.decode("utf-8"))
-        except Exception:
-            return []
-        rows = payload.get("o") if isinstance(payload, dict) else []
-        if not isinstance(rows, list):
-            return []
-        out = []
-        for row in rows:
-            if not isinstance(row, list) or len(row) < 4:
-                continue
-            try:
-                lx = int(row[0])
-                y = int(row[1])
-                lz = int(row[2])
-                block_id = max(0, int(row[3]))
-            except Exception:
-                continue
-            out.append({"lx": lx, "y": y, "lz": lz, "block_id": block_id})
-        return out
-
     def list_world_voxel_chunks(self, world_id: int, limit: int = 200000):
         conn = self._connect(include_database=True)
         try:
@@ -2102,7 +2136,7 @@ class DatabaseManager:
                 chunk_x = int(row.get("chunk_x") or 0)
                 chunk_z = int(row.get("chunk_z") or 0)
                 blob = row.get("overrides_blob")
-                overrides = self._decode_voxel_chunk_blob(blob)
+                overrides = decode_voxel_chunk_blob(blob)
                 out.append(
                     {
                         "chunk_x": chunk_x,
@@ -2115,36 +2149,107 @@ class DatabaseManager:
         finally:
             conn.close()
 
-    def save_world_voxel_chunk(self, world_id: int, chunk_x: int, chunk_z: int, overrides: list[dict]):
+    def save_world_voxel_chunks(self, chunks: list[tuple[int, int, int, dict[int, int]]]):
+        # Lote (world_id, chunk_x, chunk_z, overrides) en una sola transaccion.
+        rows = list(chunks or [])
+        if not rows:
+            return
+        deletes = []
+        upserts = []
+        for world_id, chunk_x, chunk_z, overrides in rows:
+            if overrides:
+                upserts.append(
+                    (int(world_id), int(chunk_x), int(chunk_z), encode_voxel_chunk_blob(overrides), int(len(overrides)))
+                )
+            else:
+                deletes.append((int(world_id), int(chunk_x), int(chunk_z)))
         conn = self._connect(include_database=True)
         try:
             cursor = conn.cursor()
-            rows = list(overrides or [])
-            if len(rows) <= 0:
-                cursor.execute(
+            if deletes:
+                cursor.executemany(
                     """
                     DELETE FROM world_voxel_chunks
                     WHERE world_id = %s AND chunk_x = %s AND chunk_z = %s
                     """,
-                    (int(world_id), int(chunk_x), int(chunk_z)),
+                    deletes,
                 )
-                conn.commit()
-                cursor.close()
-                return
-            blob = self._encode_voxel_chunk_blob(rows)
+            if upserts:
+                cursor.executemany(
+                    """
+                    INSERT INTO world_voxel_chunks (world_id, chunk_x, chunk_z, overrides_blob, overrides_count)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE
+                        overrides_blob = VALUES(overrides_blob),
+                        overrides_count = VALUES(overrides_count)
+                    """,
+                    upserts,
+                )
+            conn.commit()
+            cursor.close()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def list_world_voxel_chunk_keys(self, world_id: int) -> list[tuple[int, int]]:
+        conn = self._connect(include_database=True)
+        try:
+            cursor = conn.cursor()
             cursor.execute(
                 """
-                INSERT INTO world_voxel_chunks (world_id, chunk_x, chunk_z, overrides_blob, overrides_count)
-                VALUES (%s, %s, %s, %s, %s)
-                ON DUPLICATE KEY UPDATE
-                    overrides_blob = VALUES(overrides_blob),
-                    overrides_count = VALUES(overrides_count)
+                SELECT chunk_x, chunk_z
+                FROM world_voxel_chunks
+                WHERE world_id = %s
                 """,
-                (int(world_id), int(chunk_x), int(chunk_z), blob, int(len(rows))),
+                (int(world_id),),
             )
-            conn.commit()
+            rows = cursor.fetchall() or []
+            cursor.close()
+            return [(int(row[0]), int(row[1])) for row in rows]
+        finally:
+            conn.close()
+
+    def list_world_voxel_chunks_at(self, world_id: int, chunk_keys: list[tuple[int, int]], batch_size: int = 256):
+        keys = [(int(cx), int(cz)) for cx, cz in (chunk_keys or [])]
+        if not keys:
+            return []
+        conn = self._connect(include_database=True)
+        try:
+            cursor = conn.cursor(dictionary=True)
+            out = []
+            step = max(1, int(batch_size))
+            for start in range(0, len(keys), step):
+                part = keys[start:start + step]
+                placeholders = ", ".join(["(%s, %s)"] * len(part))
+                params = [int(world_id)]
+                for cx, cz in part:
+                    params.extend((cx, cz))
+                cursor.execute(
+                    f"""
+                    SELECT chunk_x, chunk_z, overrides_blob, overrides_count
+                    FROM world_voxel_chunks
+                    WHERE world_id = %s AND (chunk_x, chunk_z) IN ({placeholders})
+                    """,
+                    tuple(params),
+                )
+                for row in cursor.fetchall() or []:
+                    overrides = decode_voxel_chunk_blob(row.get("overrides_blob"))
+                    out.append(
+                        {
+                            "chunk_x": int(row.get("chunk_x") or 0),
+                            "chunk_z": int(row.get("chunk_z") or 0),
+                            "overrides": overrides,
+                            "overrides_count": int(row.get("overrides_count") or len(overrides)),
+                        }
+                    )
             cursor.close()
+            return out
         finally:
             conn.close()
 
+    def save_world_voxel_chunk(self, world_id: int, chunk_x: int, chunk_z: int, overrides: dict[int, int]):
+        self.save_world_voxel_chunks([(world_id, chunk_x, chunk_z, overrides)])
+
 
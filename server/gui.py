@@ -78,6 +78,7 @@ class ServerGui:
         self.fog_near = tk.DoubleVar(value=66.0)
         self.fog_far = tk.DoubleVar(value=300.0)
         self.fog_density = tk.DoubleVar(value=0.0025)
+        self.voxel_storage = tk.StringVar(value="mysql")
         self.night_min_light = tk.DoubleVar(value=0.04)
         self.physics_move_speed = tk.DoubleVar(value=4.6)
         self.physics_sprint_mult = tk.DoubleVar(value=1.45)
@@ -306,6 +307,7 @@ class ServerGui:
                 "remote_max_follow_speed": 24.0,
                 "remote_teleport_distance": 25.0,
                 "remote_stop_epsilon": 0.03,
+                "server_tick_hz": 0,
             },
         }
         self.network_settings_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "network_settings.json")
@@ -543,6 +545,15 @@ class ServerGui:
         tk.Scale(dens_row, from_=0.0001, to=0.05, resolution=0.0001, orient=tk.HORIZONTAL, length=220, variable=self.fog_density).pack(side=tk.LEFT)
         tk.Label(dens_row, textvariable=self.fog_density, width=8, anchor="w").pack(side=tk.LEFT, padx=(6, 0))
 
+        tk.Label(world_tab, text="Almacen ediciones voxel:").grid(row=23, column=0, sticky="e", padx=(0, 6), pady=4)
+        ttk.Combobox(
+            world_tab,
+            textvariable=self.voxel_storage,
+            values=["mysql", "region"],
+            width=21,
+            state="readonly",
+        ).grid(row=23, column=1, sticky="w", pady=4)
+
         physics_frame = tk.LabelFrame(world_tab, text="Fisica del Mundo", padx=10, pady=8)
         physics_frame.grid(row=1, column=3, rowspan=22, sticky="n", padx=(24, 0), pady=2)
         tk.Label(physics_frame, text="Velocidad base:").grid(row=0, column=0, sticky="e", padx=(0, 6), pady=3)
@@ -1055,6 +1066,7 @@ class ServerGui:
         self.fog_near.set(fog_near)
         self.fog_far.set(fog_far)
         self.fog_density.set(float(row.get("fog_density") or 0.0025))
+        self.voxel_storage.set((row.get("voxel_storage") or "mysql").lower())
         self.night_min_light.set(
             max(
                 0.0,
@@ -1140,6 +1152,9 @@ class ServerGui:
         fog_mode = (self.fog_mode.get().strip().lower() or "linear")
         if fog_mode not in {"linear", "exp2"}:
             fog_mode = "linear"
+        voxel_storage = (self.voxel_storage.get().strip().lower() or "mysql")
+        if voxel_storage not in {"mysql", "region"}:
+            voxel_storage = "mysql"
         fog_color = (self.fog_color.get().strip() or "#b8def2")
         if not (len(fog_color) == 7 and fog_color.startswith("#")):
             messagebox.showerror("Error", "Color de niebla invalido. Usa formato #RRGGBB")
@@ -1221,6 +1236,7 @@ class ServerGui:
             "fog_near": fog_near,
             "fog_far": fog_far,
             "fog_density": fog_density,
+            "voxel_storage": voxel_storage,
             "night_min_light": night_min_light,
             "cave_enabled": 1 if self.cave_enabled.get() == "Si" else 0,
             "cave_noise_scale": cave_noise_scale,
@@ -6180,6 +6196,7 @@ class ServerGui:
             "remote_max_follow_speed": self._coerce_float_clamped(src.get("remote_max_follow_speed"), defaults.get("remote_max_follow_speed", 24.0), 0.2, 160.0),
             "remote_teleport_distance": self._coerce_float_clamped(src.get("remote_teleport_distance"), defaults.get("remote_teleport_distance", 25.0), 1.0, 500.0),
             "remote_stop_epsilon": self._coerce_float_clamped(src.get("remote_stop_epsilon"), defaults.get("remote_stop_epsilon", 0.03), 0.001, 2.0),
+            "server_tick_hz": int(self._coerce_float_clamped(src.get("server_tick_hz"), defaults.get("server_tick_hz", 0), 0, 60)),
         }
         if out["remote_far_distance"] < out["remote_near_distance"]:
             out["remote_far_distance"] = out["remote_near_distance"]
@@ -0,0 +1,131 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import os
+import sys
+import time
+
+
+# Permite ejecutar tanto:
+# - python -m server.prebake --world MundoPrincipal --radius 24
+# - python server/prebake.py --world MundoPrincipal --radius 24
+if __package__ is None or __package__ == "":
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if project_root not in sys.path:
+        sys.path.insert(0, project_root)
+    from server.chunk_store import DEFAULT_CHUNK_CACHE_DIR, BaseChunkDiskCache, base_chunk_cache_key
+    from server.database import DatabaseManager, DbConfig
+    from server.terrain import build_fixed_world_terrain
+    from server.voxel_terrain import HAS_NUMPY, TerrainBlockTables, TerrainContext, chunk_worm_tunnels, generate_base_chunk, region_worm_tunnels
+    from server.ws_server import SimpleWsServer
+else:
+    from .chunk_store import DEFAULT_CHUNK_CACHE_DIR, BaseChunkDiskCache, base_chunk_cache_key
+    from .database import DatabaseManager, DbConfig
+    from .terrain import build_fixed_world_terrain
+    from .voxel_terrain import HAS_NUMPY, TerrainBlockTables, TerrainContext, chunk_worm_tunnels, generate_base_chunk, region_worm_tunnels
+    from .ws_server import SimpleWsServer
+
+
+# Estado por proceso del pool (se inicializa una vez por worker).
+_WORKER_CTX: TerrainContext | None = None
+_WORKER_TABLES: TerrainBlockTables | None = None
+_WORKER_DISK: BaseChunkDiskCache | None = None
+
+
+def _init_worker(world_id: int, world_seed: str, terrain_config: dict, terrain_cells: dict, height: int, top_blocks: dict, cache_dir: str, key: str):
+    global _WORKER_CTX, _WORKER_TABLES, _WORKER_DISK
+    _WORKER_CTX = TerrainContext(world_id, world_seed, terrain_config, terrain_cells, world_height=height)
+    _WORKER_TABLES = TerrainBlockTables(world_seed, top_blocks)
+    _WORKER_DISK = BaseChunkDiskCache(cache_dir, key, height)
+
+
+@lru_cache(maxsize=256)
+def _worker_region_worms(rx: int, rz: int):
+    return region_worm_tunnels(_WORKER_CTX.world_seed, _WORKER_CTX.worm, rx, rz)
+
+
+def _bake_chunk(coord: tuple[int, int]) -> tuple[int, int]:
+    cx, cz = coord
+    ctx = _WORKER_CTX
+    worms = chunk_worm_tunnels(ctx.world_seed, ctx.worm, cx, cz, region_lookup=_worker_region_worms) if ctx.worm is not None else []
+    blocks = generate_base_chunk(ctx, cx, cz, worm_tunnels=worms, block_tables=_WORKER_TABLES)
+    _WORKER_DISK.put(cx, cz, blocks)
+    return cx, cz
+
+
+def _load_world(db: DatabaseManager, world_name: str):
+    world = db.get_world_config(world_name)
+    if not world:
+        raise SystemExit(f"Mundo no encontrado: {world_name}")
+    terrain_row = db.get_world_terrain(int(world["id"]))
+    if terrain_row:
+        terrain_config = terrain_row.get("terrain_config") or {}
+        terrain_cells = terrain_row.get("terrain_cells") or {}
+    else:
+        terrain_config, terrain_cells = build_fixed_world_terrain(world)
+    return world, terrain_config, terrain_cells
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-genera en disco el terreno base de un mundo.")
+    parser.add_argument("--world", required=True, help="Nombre del mundo (mundos.world_name)")
+    parser.add_argument("--radius", type=int, default=16, help="Radio en chunks alrededor de --center-x/--center-z")
+    parser.add_argument("--center-x", type=int, default=0, help="Chunk X central")
+    parser.add_argument("--center-z", type=int, default=0, help="Chunk Z central")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--cache-dir", default=DEFAULT_CHUNK_CACHE_DIR)
+    parser.add_argument("--force", action="store_true", help="Regenera chunks ya presentes en disco")
+    parser.add_argument("--db-host", default="127.0.0.1")
+    parser.add_argument("--db-port", type=int, default=3306)
+    parser.add_argument("--db-user", default="root")
+    parser.add_argument("--db-password", default="")
+    parser.add_argument("--db-name", default="mmo_world")
+    args = parser.parse_args(argv)
+
+    if not HAS_NUMPY:
+        raise SystemExit("Falta dependencia 'numpy'. Instala con: pip install numpy")
+
+    db = DatabaseManager(DbConfig(args.db_host, args.db_port, args.db_user, args.db_password, args.db_name))
+    world, terrain_config, terrain_cells = _load_world(db, args.world)
+    # Misma altura y mismos bloques de superficie que usaria el servidor vivo.
+    server = SimpleWsServer("127.0.0.1", 0, db, print)
+    try:
+        server.voxel_world_height = max(64, min(256, int(terrain_config.get("voxel_world_height") or server.voxel_world_height)))
+    except Exception:
+        pass
+    ctx = server._terrain_context(world, terrain_config, terrain_cells)
+    top_blocks = server._load_world_biome_top_blocks(ctx.world_id)
+    key = base_chunk_cache_key(ctx, top_blocks)
+    disk = BaseChunkDiskCache(args.cache_dir, key, ctx.height)
+
+    r = max(0, int(args.radius))
+    coords = [
+        (args.center_x + dx, args.center_z + dz)
+        for dz in range(-r, r + 1)
+        for dx in range(-r, r + 1)
+    ]
+    if not args.force:
+        coords = [c for c in coords if disk.get(c[0], c[1]) is None]
+    disk.close()
+    print(f"[PREBAKE] mundo={world['world_name']} clave={key} chunks={len(coords)} workers={args.workers}")
+    if not coords:
+        return 0
+
+    started = time.perf_counter()
+    done = 0
+    with ProcessPoolExecutor(
+        max_workers=max(1, int(args.workers)),
+        initializer=_init_worker,
+        initargs=(ctx.world_id, ctx.world_seed, ctx.terrain_config, ctx.terrain_cells, ctx.height, top_blocks, args.cache_dir, key),
+    ) as pool:
+        for _ in pool.map(_bake_chunk, coords, chunksize=8):
+            done += 1
+            if done % 256 == 0 or done == len(coords):
+                print(f"[PREBAKE] {done}/{len(coords)} chunks")
+    elapsed = time.perf_counter() - started
+    print(f"[PREBAKE] Listo en {elapsed:.1f}s ({len(coords) / max(elapsed, 1e-9):.1f} chunks/s) -> {disk.dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,274 @@
+import os
+import re
+import struct
+import threading
+import time
+
+from .database import decode_voxel_chunk_blob, encode_voxel_chunk_blob
+
+DEFAULT_VOXEL_REGION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "voxel_regions")
+
+# Fichero de region de ediciones: sector 0 = cabecera, sectores 1..16 = tabla
+# de VOXEL_REGION_SLOTS entradas (primer sector, bytes) y a continuacion los
+# blobs de cada chunk (mismo formato que world_voxel_chunks.overrides_blob)
+# alineados a sector.
+VOXEL_REGION_CHUNKS = 32
+VOXEL_REGION_SLOTS = VOXEL_REGION_CHUNKS * VOXEL_REGION_CHUNKS
+VOXEL_REGION_MAGIC = b"VXED"
+VOXEL_REGION_VERSION = 1
+VOXEL_REGION_SECTOR = 512
+VOXEL_REGION_HEADER = struct.Struct("<4sHH")
+VOXEL_REGION_ENTRY = struct.Struct("<II")
+VOXEL_REGION_TABLE_OFFSET = VOXEL_REGION_SECTOR
+VOXEL_REGION_DATA_SECTOR = 1 + ((VOXEL_REGION_SLOTS * VOXEL_REGION_ENTRY.size) // VOXEL_REGION_SECTOR)
+
+_REGION_FILE_RE = re.compile(r"^r\.(-?\d+)\.(-?\d+)\.vxr$")
+
+
+def _sectors(length: int) -> int:
+    return (int(length) + VOXEL_REGION_SECTOR - 1) // VOXEL_REGION_SECTOR
+
+
+# E/S posicional con seek + read/write (os.pread/os.pwrite no existen en Windows).
+def _read_at(fh, length: int, offset: int) -> bytes:
+    fh.seek(offset)
+    return fh.read(length)
+
+
+def _write_at(fh, data: bytes, offset: int):
+    fh.seek(offset)
+    fh.write(data)
+
+
+def _file_size(fh) -> int:
+    return fh.seek(0, os.SEEK_END)
+
+
+class RegionVoxelStore:
+    """Almacen de ediciones voxel en ficheros de region locales, alternativo a
+    la tabla world_voxel_chunks de MySQL. Expone las mismas operaciones que usa
+    el servidor sobre DatabaseManager (list_world_voxel_chunk_keys,
+    list_world_voxel_chunks_at, list_world_voxel_chunks, save_world_voxel_chunks).
+
+    Cada region agrupa VOXEL_REGION_CHUNKS x VOXEL_REGION_CHUNKS chunks. Un chunk
+    reescrito se anade al final del fichero y solo despues se cambia su entrada
+    en la tabla, asi que un corte a medias deja la version anterior legible. Un
+    lote hace dos fsync por region (datos y tabla), no uno por chunk. Cuando la
+    basura supera compact_garbage_ratio la region se reescribe compactada.
+    """
+
+    def __init__(self, root_dir: str, fsync: bool = True):
+        self.root_dir = str(root_dir)
+        self.fsync = bool(fsync)
+        self.compact_min_sectors = 256
+        self.compact_garbage_ratio = 0.5
+        self.writes = 0
+        self.fsyncs = 0
+        self.compactions = 0
+        self._lock = threading.Lock()
+        self._tables: dict[tuple[int, int, int], list[tuple[int, int]]] = {}
+
+    def _world_dir(self, world_id: int) -> str:
+        return os.path.join(self.root_dir, f"world_{int(world_id)}")
+
+    def _region_path(self, world_id: int, rx: int, rz: int) -> str:
+        return os.path.join(self._world_dir(world_id), f"r.{int(rx)}.{int(rz)}.vxr")
+
+    def has_world(self, world_id: int) -> bool:
+        return os.path.isdir(self._world_dir(world_id))
+
+    def init_world(self, world_id: int):
+        os.makedirs(self._world_dir(world_id), exist_ok=True)
+
+    def retire_world(self, world_id: int) -> str:
+        # Aparta los ficheros del mundo (sin borrarlos) tras devolverlo a MySQL;
+        # has_world pasa a False y un cambio posterior a region vuelve a copiar.
+        wid = int(world_id)
+        with self._lock:
+            target = f"{self._world_dir(wid)}.mysql-{int(time.time())}"
+            os.replace(self._world_dir(wid), target)
+            for key in [k for k in self._tables if k[0] == wid]:
+                self._tables.pop(key, None)
+        return target
+
+    @staticmethod
+    def _slot(chunk_x: int, chunk_z: int):
+        cx = int(chunk_x)
+        cz = int(chunk_z)
+        rx = cx // VOXEL_REGION_CHUNKS
+        rz = cz // VOXEL_REGION_CHUNKS
+        return (rx, rz), (cx - (rx * VOXEL_REGION_CHUNKS)) + ((cz - (rz * VOXEL_REGION_CHUNKS)) * VOXEL_REGION_CHUNKS)
+
+    @staticmethod
+    def _header() -> bytes:
+        return VOXEL_REGION_HEADER.pack(VOXEL_REGION_MAGIC, VOXEL_REGION_VERSION, VOXEL_REGION_CHUNKS)
+
+    @staticmethod
+    def _pack_table(table: list[tuple[int, int]]) -> bytes:
+        return b"".join(VOXEL_REGION_ENTRY.pack(first, length) for first, length in table)
+
+    def _sync(self, fh):
+        fh.flush()
+        if self.fsync:
+            os.fsync(fh.fileno())
+            self.fsyncs += 1
+
+    def _table(self, world_id: int, rx: int, rz: int):
+        # Tabla de la region (cacheada); None si el fichero no existe o no es valido.
+        key = (int(world_id), int(rx), int(rz))
+        if key in self._tables:
+            return self._tables[key]
+        table = None
+        try:
+            with open(self._region_path(world_id, rx, rz), "rb") as fh:
+                head = fh.read(VOXEL_REGION_DATA_SECTOR * VOXEL_REGION_SECTOR)
+            if len(head) == VOXEL_REGION_DATA_SECTOR * VOXEL_REGION_SECTOR and head[: VOXEL_REGION_HEADER.size] == self._header():
+                table = [
+                    VOXEL_REGION_ENTRY.unpack_from(head, VOXEL_REGION_TABLE_OFFSET + (slot * VOXEL_REGION_ENTRY.size))
+                    for slot in range(VOXEL_REGION_SLOTS)
+                ]
+        except OSError:
+            table = None
+        self._tables[key] = table
+        return table
+
+    def _region_keys(self, world_id: int) -> list[tuple[int, int]]:
+        try:
+            names = os.listdir(self._world_dir(world_id))
+        except OSError:
+            return []
+        out = []
+        for name in names:
+            m = _REGION_FILE_RE.match(name)
+            if m:
+                out.append((int(m.group(1)), int(m.group(2))))
+        return out
+
+    def list_world_voxel_chunk_keys(self, world_id: int) -> list[tuple[int, int]]:
+        out = []
+        with self._lock:
+            for rx, rz in self._region_keys(world_id):
+                table = self._table(world_id, rx, rz)
+                if not table:
+                    continue
+                for slot, (_first, length) in enumerate(table):
+                    if length > 0:
+                        out.append(
+                            (
+                                (rx * VOXEL_REGION_CHUNKS) + (slot % VOXEL_REGION_CHUNKS),
+                                (rz * VOXEL_REGION_CHUNKS) + (slot // VOXEL_REGION_CHUNKS),
+                            )
+                        )
+        return out
+
+    def list_world_voxel_chunks_at(self, world_id: int, chunk_keys: list[tuple[int, int]]):
+        by_region: dict[tuple[int, int], list[tuple[int, int, int]]] = {}
+        for cx, cz in chunk_keys or []:
+            region, slot = self._slot(cx, cz)
+            by_region.setdefault(region, []).append((int(cx), int(cz), slot))
+        out = []
+        with self._lock:
+            for (rx, rz), rows in by_region.items():
+                table = self._table(world_id, rx, rz)
+                if not table:
+                    continue
+                try:
+                    fh = open(self._region_path(world_id, rx, rz), "rb")
+                except OSError:
+                    continue
+                with fh:
+                    for cx, cz, slot in rows:
+                        first, length = table[slot]
+                        if length <= 0:
+                            continue
+                        overrides = decode_voxel_chunk_blob(_read_at(fh, length, first * VOXEL_REGION_SECTOR))
+                        out.append({"chunk_x": cx, "chunk_z": cz, "overrides": overrides, "overrides_count": len(overrides)})
+        return out
+
+    def list_world_voxel_chunks(self, world_id: int, limit: int = 200000):
+        keys = self.list_world_voxel_chunk_keys(world_id)
+        keys.sort(key=lambda k: (k[1], k[0]))
+        return self.list_world_voxel_chunks_at(world_id, keys[: max(1, int(limit))])
+
+    def save_world_voxel_chunks(self, chunks: list[tuple[int, int, int, dict[int, int]]]):
+        # Lote (world_id, chunk_x, chunk_z, overrides); overrides vacio borra el chunk.
+        by_region: dict[tuple[int, int, int], dict[int, bytes | None]] = {}
+        for world_id, chunk_x, chunk_z, overrides in chunks or []:
+            (rx, rz), slot = self._slot(chunk_x, chunk_z)
+            by_region.setdefault((int(world_id), rx, rz), {})[slot] = encode_voxel_chunk_blob(overrides) if overrides else None
+        for (world_id, rx, rz), blobs in by_region.items():
+            self._write_region(world_id, rx, rz, blobs)
+
+    def save_world_voxel_chunk(self, world_id: int, chunk_x: int, chunk_z: int, overrides: dict[int, int]):
+        self.save_world_voxel_chunks([(world_id, chunk_x, chunk_z, overrides)])
+
+    def _write_region(self, world_id: int, rx: int, rz: int, blobs: dict[int, bytes | None]):
+        path = self._region_path(world_id, rx, rz)
+        key = (int(world_id), int(rx), int(rz))
+        os.makedirs(self._world_dir(world_id), exist_ok=True)
+        with self._lock:
+            table = self._table(world_id, rx, rz)
+            if table is None and all(blob is None for blob in blobs.values()):
+                return
+            fh = os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644), "r+b")
+        with fh:
+            with self._lock:
+                if table is None:
+                    # Region nueva (o invalida): cabecera y tabla vacia.
+                    table = [(0, 0)] * VOXEL_REGION_SLOTS
+                    fh.truncate(0)
+                    _write_at(fh, self._header().ljust(VOXEL_REGION_SECTOR, b"\0") + self._pack_table(table), 0)
+                    self._tables[key] = table
+                end = max(VOXEL_REGION_DATA_SECTOR, _sectors(_file_size(fh)))
+                updates: dict[int, tuple[int, int]] = {}
+                for slot, blob in blobs.items():
+                    if blob is None:
+                        updates[slot] = (0, 0)
+                        continue
+                    # Siempre al final: la entrada vieja sigue valida hasta el fsync.
+                    _write_at(fh, blob, end * VOXEL_REGION_SECTOR)
+                    updates[slot] = (end, len(blob))
+                    end += _sectors(len(blob))
+                if end * VOXEL_REGION_SECTOR > _file_size(fh):
+                    fh.truncate(end * VOXEL_REGION_SECTOR)
+            self._sync(fh)
+            with self._lock:
+                for slot, entry in updates.items():
+                    table[slot] = entry
+                    _write_at(fh, VOXEL_REGION_ENTRY.pack(*entry), VOXEL_REGION_TABLE_OFFSET + (slot * VOXEL_REGION_ENTRY.size))
+            self._sync(fh)
+            self.writes += len(blobs)
+        # Con el fichero ya cerrado: en Windows no se puede reemplazar ni borrar
+        # un fichero abierto.
+        with self._lock:
+            self._maybe_compact(path, key, table)
+
+    def _maybe_compact(self, path: str, key: tuple[int, int, int], table: list[tuple[int, int]]):
+        live = sum(_sectors(length) for _first, length in table if length > 0)
+        if live <= 0:
+            os.remove(path)
+            self._tables.pop(key, None)
+            self.compactions += 1
+            return
+        used = _sectors(os.path.getsize(path)) - VOXEL_REGION_DATA_SECTOR
+        if used < int(self.compact_min_sectors) or (used - live) < (used * float(self.compact_garbage_ratio)):
+            return
+        tmp = path + ".tmp"
+        packed = [(0, 0)] * VOXEL_REGION_SLOTS
+        with open(path, "rb") as src, open(tmp, "wb") as out:
+            sector = VOXEL_REGION_DATA_SECTOR
+            for slot, (first, length) in enumerate(table):
+                if length <= 0:
+                    continue
+                _write_at(out, _read_at(src, length, first * VOXEL_REGION_SECTOR), sector * VOXEL_REGION_SECTOR)
+                packed[slot] = (sector, length)
+                sector += _sectors(length)
+            out.truncate(sector * VOXEL_REGION_SECTOR)
+            _write_at(out, self._header().ljust(VOXEL_REGION_SECTOR, b"\0") + self._pack_table(packed), 0)
+            self._sync(out)
+        os.replace(tmp, path)
+        self._tables[key] = packed
+        self.compactions += 1
+
+    def stats(self) -> dict:
+        return {"writes": self.writes, "fsyncs": self.fsyncs, "compactions": self.compactions}
@@ -0,0 +1,955 @@
+import math
+from bisect import bisect_left
+
+try:
+    import numpy as np
+except ImportError:  # numpy es opcional: sin el, el servidor usa la ruta por voxel.
+    np = None
+
+HAS_NUMPY = np is not None
+
+
+# Layout identico a libraries/voxelChunkWorker.js: i = x + (z * 16) + (y * 256).
+CHUNK_SIZE = 16
+VOXEL_LAYER_SIZE = CHUNK_SIZE * CHUNK_SIZE
+WORM_REGION_SIZE = 64
+# Subir al cambiar el resultado de generate_base_chunk: invalida los chunks
+# base guardados en disco (ver chunk_store.base_chunk_cache_key).
+BASE_CHUNK_GENERATOR_VERSION = 1
+# Id de bioma reservado para columnas vacias en los heightmaps (uint8).
+VOID_BIOME_ID = 255
+
+SURFACE_BLOCK_WEIGHTS: dict[str, list[tuple[int, float]]] = {
+    "grass": [(2, 3.0), (1, 2.2), (3, 1.6), (16, 1.0), (17, 0.8), (19, 0.6), (20, 0.35)],
+    "earth": [(16, 2.8), (18, 2.0), (17, 1.8), (3, 1.2), (1, 0.8), (19, 0.7), (20, 0.35)],
+    "stone": [(5, 2.6), (6, 2.2), (8, 1.5), (7, 1.2), (3, 0.8), (19, 0.45), (20, 0.3)],
+    "fire": [(4, 2.5), (3, 1.9), (8, 1.8), (6, 1.3), (14, 0.9), (19, 0.5), (20, 0.4)],
+    "wind": [(9, 2.1), (10, 1.8), (11, 1.5), (12, 1.2), (1, 0.7), (19, 0.55), (20, 0.35)],
+    "bridge": [(13, 2.5), (14, 2.2), (15, 1.7), (10, 1.0), (11, 0.8), (19, 0.45), (20, 0.35)],
+}
+SUBSOIL_BLOCK_WEIGHTS: dict[str, list[tuple[int, float]]] = {
+    "grass": [(16, 2.6), (17, 1.8), (18, 1.6), (3, 1.1), (19, 0.5)],
+    "earth": [(16, 2.7), (18, 2.1), (17, 1.6), (3, 1.0), (19, 0.5)],
+    "stone": [(6, 2.2), (5, 1.7), (7, 1.5), (8, 1.2), (19, 0.4)],
+    "fire": [(6, 2.0), (8, 1.9), (4, 1.3), (3, 1.2), (19, 0.55)],
+    "wind": [(11, 1.8), (12, 1.7), (9, 1.4), (10, 1.2), (19, 0.5)],
+    "bridge": [(13, 2.1), (14, 1.9), (15, 1.4), (11, 1.0), (19, 0.5)],
+}
+DEEP_BLOCK_WEIGHTS: dict[str, list[tuple[int, float]]] = {
+    "grass": [(6, 2.8), (7, 2.1), (5, 1.8), (8, 1.2), (17, 0.6), (20, 0.25)],
+    "earth": [(6, 2.7), (7, 2.2), (5, 1.7), (8, 1.3), (18, 0.55), (20, 0.25)],
+    "stone": [(7, 2.9), (6, 2.3), (5, 1.7), (8, 1.3), (12, 0.45), (20, 0.25)],
+    "fire": [(8, 2.4), (6, 2.1), (7, 1.8), (4, 1.2), (14, 0.6), (20, 0.35)],
+    "wind": [(12, 2.1), (11, 2.0), (6, 1.5), (7, 1.2), (9, 0.8), (20, 0.25)],
+    "bridge": [(14, 2.2), (13, 2.0), (15, 1.5), (11, 1.0), (7, 0.8), (20, 0.25)],
+}
+CAVE_BIOME_THRESHOLD_ADJUST: dict[str, float] = {
+    "fire": -0.03,
+    "stone": -0.02,
+    "earth": 0.00,
+    "grass": +0.02,
+    "wind": +0.03,
+    "bridge": +0.04,
+}
+
+BIOME_HEIGHT_OFFSET: dict[str, float] = {
+    "fire": 0.9,
+    "wind": 0.55,
+    "earth": -0.45,
+}
+
+_SLOPE_ROCK_BLOCKS = {5, 6, 7, 8, 11, 12, 13, 14, 15}
+
+
+def seed_hash(seed: str) -> int:
+    h = 2166136261
+    for ch in str(seed or "default-seed"):
+        h ^= ord(ch)
+        h = (h * 16777619) & 0xFFFFFFFF
+    return h & 0xFFFFFFFF
+
+
+def random_from_int2d(x: int, z: int, seed_h: int) -> float:
+    n = ((int(x) * 374761393) ^ (int(z) * 668265263) ^ int(seed_h)) & 0xFFFFFFFF
+    n = (n ^ (n >> 13)) & 0xFFFFFFFF
+    n = (n * 1274126177) & 0xFFFFFFFF
+    return float(n & 0x7FFFFFFF) / float(0x7FFFFFFF)
+
+
+def dist2_point_segment_3d(px: float, py: float, pz: float, ax: float, ay: float, az: float, bx: float, by: float, bz: float) -> float:
+    abx = bx - ax
+    aby = by - ay
+    abz = bz - az
+    apx = px - ax
+    apy = py - ay
+    apz = pz - az
+    ab2 = (abx * abx) + (aby * aby) + (abz * abz)
+    if ab2 <= 1e-9:
+        return (apx * apx) + (apy * apy) + (apz * apz)
+    t = ((apx * abx) + (apy * aby) + (apz * abz)) / ab2
+    t = max(0.0, min(1.0, t))
+    qx = ax + (abx * t)
+    qy = ay + (aby * t)
+    qz = az + (abz * t)
+    dx = px - qx
+    dy = py - qy
+    dz = pz - qz
+    return (dx * dx) + (dy * dy) + (dz * dz)
+
+
+def slope_bin_for_hint(slope_hint: float) -> int:
+    slope = max(0.0, float(slope_hint or 0.0))
+    # slope_bin: 0 llano, 1 medio, 2 escarpado
+    return 0 if slope < 1.0 else (1 if slope < 2.5 else 2)
+
+
+def surface_block_entries(biome: str, slope_bin: int) -> list[tuple[int, float]]:
+    base = SURFACE_BLOCK_WEIGHTS.get(biome) or SURFACE_BLOCK_WEIGHTS["grass"]
+    adjusted: list[tuple[int, float]] = []
+    for bid, w in base:
+        ww = float(w)
+        # En pendientes altas, favorecer roca/estructura y transicion.
+        if slope_bin == 1:
+            if bid in _SLOPE_ROCK_BLOCKS:
+                ww *= 1.35
+            if bid in {2, 16, 18}:
+                ww *= 0.78
+            if bid == 19:
+                ww *= 1.20
+        elif slope_bin == 2:
+            if bid in _SLOPE_ROCK_BLOCKS:
+                ww *= 1.8
+            if bid in {1, 2, 16, 17, 18}:
+                ww *= 0.5
+            if bid == 19:
+                ww *= 1.45
+        adjusted.append((bid, ww))
+    return adjusted
+
+
+class WeightedBlockTable:
+    """Seleccion ponderada de bloque precompilada para una sal concreta.
+
+    Guarda los ids validos, los pesos acumulados y los hashes de la sal, asi
+    que elegir un bloque cuesta un hash 2D y una busqueda binaria.
+    """
+
+    __slots__ = ("ids", "acc", "total", "seed_h", "jitter", "fallback", "_np_ids", "_np_acc")
+
+    def __init__(self, world_seed: str, salt: str, entries: list[tuple[int, float]], fallback_block_id: int = 1):
+        ids: list[int] = []
+        acc: list[float] = []
+        total_w = 0.0
+        for block_id, weight in entries or []:
+            try:
+                bid = max(1, int(block_id))
+                w = float(weight)
+            except Exception:
+                continue
+            if w <= 0:
+                continue
+            total_w += w
+            ids.append(bid)
+            acc.append(total_w)
+        self.ids = ids
+        self.acc = acc
+        self.total = total_w
+        self.seed_h = seed_hash(f"{world_seed}:{salt}")
+        self.jitter = seed_hash(salt) & 0xFFFF
+        self.fallback = max(1, int(fallback_block_id or 1))
+        self._np_ids = None
+        self._np_acc = None
+
+    def pick(self, x: int, z: int) -> int:
+        ids = self.ids
+        if self.total <= 0.0 or not ids:
+            return self.fallback
+        if len(ids) == 1:
+            return ids[0]
+        r = random_from_int2d(int(x) + self.jitter, int(z) - self.jitter, self.seed_h)
+        t = max(0.0, min(0.999999, float(r))) * self.total
+        return ids[min(bisect_left(self.acc, t), len(ids) - 1)]
+
+    def pick_many(self, x, z):
+        if self.total <= 0.0 or not self.ids:
+            return np.full(np.shape(x), self.fallback, dtype=np.int64)
+        if self._np_ids is None:
+            self._np_ids = np.asarray(self.ids, dtype=np.int64)
+            self._np_acc = np.asarray(self.acc, dtype=np.float64)
+        r = _hash_unit_2d(x + self.jitter, z - self.jitter, self.seed_h)
+        t = np.clip(r, 0.0, 0.999999) * self.total
+        idx = np.searchsorted(self._np_acc, t, side="left")
+        return self._np_ids[np.minimum(idx, len(self.ids) - 1)]
+
+
+class TerrainBlockTables:
+    """Tablas de seleccion de bloques de un mundo: superficie por (bioma,
+    slope_bin) y subsuelo/profundo por bioma. Se compilan al primer uso y
+    valen mientras no cambien la semilla ni los bloques de superficie del
+    catalogo (custom_top_blocks: bioma -> lista de ids).
+    """
+
+    def __init__(self, world_seed: str, custom_top_blocks: dict | None = None):
+        self.world_seed = str(world_seed or "default-seed")
+        self.custom_top_blocks = custom_top_blocks if isinstance(custom_top_blocks, dict) else {}
+        self._surface: dict[tuple[str, int], WeightedBlockTable] = {}
+        self._subsoil: dict[str, WeightedBlockTable] = {}
+        self._deep: dict[str, WeightedBlockTable] = {}
+
+    def matches(self, world_seed: str, custom_top_blocks: dict | None) -> bool:
+        custom = custom_top_blocks if isinstance(custom_top_blocks, dict) else {}
+        if str(world_seed or "default-seed") != self.world_seed:
+            return False
+        if self.custom_top_blocks is not custom:
+            if self.custom_top_blocks != custom:
+                return False
+            self.custom_top_blocks = custom
+        return True
+
+    def surface(self, biome: str, slope_bin: int) -> WeightedBlockTable:
+        key = (biome, int(slope_bin))
+        table = self._surface.get(key)
+        if table is None:
+            b = (biome or "").strip().lower()
+            candidates = self.custom_top_blocks.get(b)
+            if isinstance(candidates, list) and candidates:
+                # Los bloques del catalogo no dependen de la pendiente.
+                table = WeightedBlockTable(
+                    self.world_seed,
+                    f"custom-surface:{b}",
+                    [(int(bid), 1.0) for bid in candidates],
+                    fallback_block_id=int(candidates[0]),
+                )
+            else:
+                table = WeightedBlockTable(
+                    self.world_seed,
+                    f"surface:{b}:s{key[1]}",
+                    surface_block_entries(b, key[1]),
+                    fallback_block_id=2,
+                )
+            self._surface[key] = table
+        return table
+
+    def subsoil(self, biome: str) -> WeightedBlockTable:
+        table = self._subsoil.get(biome)
+        if table is None:
+            b = (biome or "").strip().lower()
+            table = WeightedBlockTable(
+                self.world_seed,
+                f"subsoil:{b}",
+                SUBSOIL_BLOCK_WEIGHTS.get(b) or SUBSOIL_BLOCK_WEIGHTS["grass"],
+                fallback_block_id=16,
+            )
+            self._subsoil[biome] = table
+        return table
+
+    def deep(self, biome: str) -> WeightedBlockTable:
+        table = self._deep.get(biome)
+        if table is None:
+            b = (biome or "").strip().lower()
+            table = WeightedBlockTable(
+                self.world_seed,
+                f"deep:{b}",
+                DEEP_BLOCK_WEIGHTS.get(b) or DEEP_BLOCK_WEIGHTS["grass"],
+                fallback_block_id=6,
+            )
+            self._deep[biome] = table
+        return table
+
+    def surface_block(self, biome: str, x: int, z: int, slope_hint: float) -> int:
+        return self.surface(biome, slope_bin_for_hint(slope_hint)).pick(x, z)
+
+    def subsoil_block(self, biome: str, x: int, y: int, z: int) -> int:
+        return self.subsoil(biome).pick(int(x) + (int(y) * 11), int(z) - (int(y) * 7))
+
+    def deep_block(self, biome: str, x: int, y: int, z: int) -> int:
+        return self.deep(biome).pick(int(x) + (int(y) * 17), int(z) - (int(y) * 13))
+
+    def surface_layer(self, col_x, col_z, codes, palette: list[str], slope_bins, solid_col):
+        """Bloques de superficie de una capa de columnas (p. ej. los 16 x 16 de
+        un chunk) en una sola pasada: un pick vectorizado por (bioma, slope_bin)
+        presente. Las columnas no solidas quedan a 0.
+        """
+        surface = np.zeros(np.shape(col_x), dtype=np.int64)
+        for code, biome in enumerate(palette):
+            in_biome = solid_col & (codes == code)
+            if not in_biome.any():
+                continue
+            for slope_bin in (0, 1, 2):
+                sel = in_biome & (slope_bins == slope_bin)
+                if sel.any():
+                    surface[sel] = self.surface(biome, slope_bin).pick_many(col_x[sel], col_z[sel])
+        return surface
+
+
+def register_biome_id(biome_ids: dict[str, int], biome_names: list[str], biome: str) -> int:
+    # Paleta de biomas por mundo: nombre -> id uint8 estable mientras viva la cache.
+    bid = biome_ids.get(biome)
+    if bid is None:
+        bid = len(biome_names)
+        if bid >= VOID_BIOME_ID:
+            raise ValueError("Demasiados biomas distintos para un heightmap uint8")
+        biome_ids[biome] = bid
+        biome_names.append(biome)
+    return bid
+
+
+def quadrant_biome(quadrants: dict, wx: int, wz: int) -> str:
+    qkey = "xp_zp" if (wx >= 0 and wz >= 0) else ("xn_zp" if (wx < 0 and wz >= 0) else ("xn_zn" if (wx < 0 and wz < 0) else "xp_zn"))
+    biome = (quadrants.get(qkey) or "").strip().lower()
+    if biome:
+        return biome
+    if wx >= 0 and wz >= 0:
+        return "fire"
+    if wx < 0 and wz >= 0:
+        return "grass"
+    if wx < 0 and wz < 0:
+        return "earth"
+    return "wind"
+
+
+def worm_params(terrain_config: dict):
+    """Parametros de worms ya clampeados, o None si estan desactivados.
+
+    (worm_count, min_len, max_len, min_rad, max_rad, cave_min_y)
+    """
+    cfg = terrain_config or {}
+    if int(cfg.get("worm_enabled") if cfg.get("worm_enabled") is not None else 1) != 1:
+        return None
+    worm_count = max(0, min(8, int(cfg.get("worm_count") or 3)))
+    if worm_count <= 0:
+        return None
+    min_len = max(12.0, min(160.0, float(cfg.get("worm_length_min") or 48.0)))
+    max_len = max(min_len, min(220.0, float(cfg.get("worm_length_max") or 120.0)))
+    min_rad = max(0.8, min(6.0, float(cfg.get("worm_radius_min") or 2.2)))
+    max_rad = max(min_rad, min(9.0, float(cfg.get("worm_radius_max") or 4.8)))
+    cave_min_y = max(1, min(64, int(cfg.get("cave_min_y") or 8)))
+    return (worm_count, min_len, max_len, min_rad, max_rad, cave_min_y)
+
+
+class TerrainContext:
+    """Parametros de terreno de un mundo ya parseados y clampeados.
+
+    Se construye una vez por mundo (y se reconstruye si cambia mundos_terrain)
+    para que los helpers de generacion no relean terrain_config por voxel.
+    """
+
+    __slots__ = (
+        "world_id",
+        "world_seed",
+        "terrain_config",
+        "terrain_cells",
+        "height",
+        "seed_hash",
+        "cave_seed_hash",
+        "emissive_seed_hash",
+        "quadrants_layout",
+        "quadrant_biomes",
+        "base_height",
+        "noise_amplitude",
+        "noise_scale",
+        "noise_octaves",
+        "column_height_cap",
+        "biome_roughness",
+        "cave_enabled",
+        "cave_min_y",
+        "cave_surface_buffer",
+        "cave_spawn_safe_radius",
+        "cave_noise_scale",
+        "cave_noise_octaves",
+        "cave_density_threshold",
+        "cave_biome_thresholds",
+        "emissive_enabled",
+        "emissive_density",
+        "worm",
+    )
+
+    def __init__(self, world_id: int, world_seed: str, terrain_config: dict, terrain_cells: dict, world_height: int = 128):
+        cfg = terrain_config if isinstance(terrain_config, dict) else {}
+        self.world_id = int(world_id or 0)
+        self.world_seed = str(world_seed or "default-seed")
+        self.terrain_config = cfg
+        self.terrain_cells = terrain_cells if isinstance(terrain_cells, dict) else {}
+        self.height = max(1, int(world_height or 128))
+        self.seed_hash = seed_hash(self.world_seed)
+        self.cave_seed_hash = seed_hash(f"{self.world_seed}:caves:v1")
+        self.emissive_seed_hash = seed_hash(f"{self.world_seed}:cave-emissive:v1")
+
+        self.quadrants_layout = (cfg.get("biome_layout") or "").strip().lower() == "quadrants"
+        if self.quadrants_layout:
+            self.base_height = float(cfg.get("surface_height") or cfg.get("base_height") or 64.0)
+            self.noise_amplitude = max(0.0, float(cfg.get("mountain_amplitude") or cfg.get("fixed_noise_amplitude") or 20.0))
+            self.noise_scale = max(0.001, float(cfg.get("mountain_noise_scale") or cfg.get("fixed_noise_scale") or 0.02))
+            self.quadrant_biomes = cfg.get("quadrant_biomes") if isinstance(cfg.get("quadrant_biomes"), dict) else {}
+            self.biome_roughness = {}
+        else:
+            self.base_height = float(cfg.get("hub_height") or cfg.get("base_height") or 58.0)
+            self.noise_amplitude = max(0.0, float(cfg.get("fixed_noise_amplitude") or 2.2))
+            self.noise_scale = max(0.001, float(cfg.get("fixed_noise_scale") or 0.06))
+            self.quadrant_biomes = {}
+            self.biome_roughness = {
+                "stone": max(0.0, min(1.0, float(cfg.get("fixed_hub_roughness") or 0.35))),
+                "bridge": max(0.0, min(1.0, float(cfg.get("fixed_bridge_roughness") or 0.18))),
+            }
+        self.noise_octaves = max(1, min(4, int(cfg.get("fixed_noise_octaves") or 2)))
+        self.column_height_cap = max(8, int(cfg.get("voxel_world_height") or world_height or 128))
+
+        self.cave_enabled = int(cfg.get("cave_enabled") if cfg.get("cave_enabled") is not None else 1) == 1
+        self.cave_min_y = max(1, min(64, int(cfg.get("cave_min_y") or 8)))
+        self.cave_surface_buffer = max(2, min(12, int(cfg.get("cave_surface_buffer") or 4)))
+        self.cave_spawn_safe_radius = max(0, min(64, int(cfg.get("cave_spawn_safe_radius") or 24)))
+        self.cave_noise_scale = max(0.010, min(0.120, float(cfg.get("cave_noise_scale") or 0.045)))
+        self.cave_noise_octaves = max(1, min(4, int(cfg.get("cave_noise_octaves") or 3)))
+        self.cave_density_threshold = max(0.45, min(0.90, float(cfg.get("cave_density_threshold") or 0.62)))
+        self.cave_biome_thresholds = {
+            biome: max(0.40, min(0.95, self.cave_density_threshold + adjust))
+            for biome, adjust in CAVE_BIOME_THRESHOLD_ADJUST.items()
+        }
+        self.emissive_enabled = int(cfg.get("cave_emissive_enabled") if cfg.get("cave_emissive_enabled") is not None else 1) == 1
+        self.emissive_density = max(0.0, min(0.08, float(cfg.get("cave_emissive_density") or 0.018)))
+        self.worm = worm_params(cfg)
+
+    def matches(self, world_seed: str, terrain_config: dict, terrain_cells: dict, world_height: int) -> bool:
+        # Identidad primero: tras la primera comparacion se adoptan los dicts
+        # nuevos para que las siguientes llamadas no comparen contenido.
+        cells = terrain_cells if isinstance(terrain_cells, dict) else {}
+        if str(world_seed or "default-seed") != self.world_seed or max(1, int(world_height or 128)) != self.height:
+            return False
+        if self.terrain_config is not terrain_config:
+            if self.terrain_config != terrain_config:
+                return False
+            self.terrain_config = terrain_config
+        if self.terrain_cells is not cells:
+            if self.terrain_cells != cells:
+                return False
+            self.terrain_cells = cells
+        return True
+
+    def cave_threshold_for(self, biome: str) -> float:
+        threshold = self.cave_biome_thresholds.get(biome)
+        if threshold is None:
+            threshold = max(0.40, min(0.95, self.cave_density_threshold))
+        return threshold
+
+
+# ---------------------------------------------------------------------------
+# Primitivas vectorizadas. Replican operacion a operacion (mismo orden de
+# sumas/productos en float64) la ruta escalar de SimpleWsServer para que el
+# resultado sea bit a bit identico.
+# ---------------------------------------------------------------------------
+
+def _hash_unit_2d(x, z, seed_h: int):
+    n = ((x * 374761393) ^ (z * 668265263) ^ int(seed_h)) & 0xFFFFFFFF
+    n = (n ^ (n >> 13)) & 0xFFFFFFFF
+    n = (n * 1274126177) & 0xFFFFFFFF
+    return (n & 0x7FFFFFFF).astype(np.float64) / float(0x7FFFFFFF)
+
+
+def _hash_unit_3d(x, y, z, seed_h: int):
+    n = ((x * 374761393) ^ (y * 1442695041) ^ (z * 668265263) ^ int(seed_h)) & 0xFFFFFFFF
+    n = (n ^ (n >> 13)) & 0xFFFFFFFF
+    n = (n * 1274126177) & 0xFFFFFFFF
+    return (n & 0x7FFFFFFF).astype(np.float64) / float(0x7FFFFFFF)
+
+
+def _smoothstep(t):
+    return t * t * (3.0 - (2.0 * t))
+
+
+def _lerp(a, b, t):
+    return a + ((b - a) * t)
+
+
+def _value_noise_2d(x, z, seed_h: int):
+    fx0 = np.floor(x)
+    fz0 = np.floor(z)
+    sx = _smoothstep(x - fx0)
+    sz = _smoothstep(z - fz0)
+    x0 = fx0.astype(np.int64)
+    z0 = fz0.astype(np.int64)
+    n00 = _hash_unit_2d(x0, z0, seed_h)
+    n10 = _hash_unit_2d(x0 + 1, z0, seed_h)
+    n01 = _hash_unit_2d(x0, z0 + 1, seed_h)
+    n11 = _hash_unit_2d(x0 + 1, z0 + 1, seed_h)
+    v = _lerp(_lerp(n00, n10, sx), _lerp(n01, n11, sx), sz)
+    return (v * 2.0) - 1.0
+
+
+def _lattice_noise_3d(ax, ay, az, seed_h: int):
+    # Ruido de valor 3D sobre la rejilla separable ay x az x ax -> [y, z, x].
+    # Las esquinas se hashean una sola vez por celda de la rejilla y se
+    # reutilizan por todos los voxels que caen en ella.
+    fx0 = np.floor(ax)
+    fy0 = np.floor(ay)
+    fz0 = np.floor(az)
+    sx = _smoothstep(ax - fx0).reshape(1, 1, -1)
+    sy = _smoothstep(ay - fy0).reshape(-1, 1, 1)
+    sz = _smoothstep(az - fz0).reshape(1, -1, 1)
+    x0 = fx0.astype(np.int64)
+    y0 = fy0.astype(np.int64)
+    z0 = fz0.astype(np.int64)
+    gx = np.arange(int(x0.min()), int(x0.max()) + 2, dtype=np.int64)
+    gy = np.arange(int(y0.min()), int(y0.max()) + 2, dtype=np.int64)
+    gz = np.arange(int(z0.min()), int(z0.max()) + 2, dtype=np.int64)
+    corners = _hash_unit_3d(gx.reshape(1, 1, -1), gy.reshape(-1, 1, 1), gz.reshape(1, -1, 1), seed_h)
+    xi = (x0 - gx[0]).reshape(1, 1, -1)
+    yi = (y0 - gy[0]).reshape(-1, 1, 1)
+    zi = (z0 - gz[0]).reshape(1, -1, 1)
+    ix00 = _lerp(corners[yi, zi, xi], corners[yi, zi, xi + 1], sx)
+    ix10 = _lerp(corners[yi + 1, zi, xi], corners[yi + 1, zi, xi + 1], sx)
+    ix01 = _lerp(corners[yi, zi + 1, xi], corners[yi, zi + 1, xi + 1], sx)
+    ix11 = _lerp(corners[yi + 1, zi + 1, xi], corners[yi + 1, zi + 1, xi + 1], sx)
+    v = _lerp(_lerp(ix00, ix10, sy), _lerp(ix01, ix11, sy), sz)
+    return (v * 2.0) - 1.0
+
+
+def cave_noise_field(cave_seed: int, scale: float, octaves: int, x0: int, z0: int, y0: int, y1: int):
+    """Densidad de cuevas normalizada a [0, 1] para el volumen [y0, y1) x 16 x 16
+    de un chunk con origen (x0, z0), como array [y, z, x].
+
+    Equivale a SimpleWsServer._should_carve_cave_at (parte de ruido) voxel a
+    voxel, pero interpolando trilinealmente toda la rejilla de cada octava.
+    """
+    fx = np.arange(x0, x0 + CHUNK_SIZE, dtype=np.int64).astype(np.float64)
+    fy = np.arange(y0, y1, dtype=np.int64).astype(np.float64)
+    fz = np.arange(z0, z0 + CHUNK_SIZE, dtype=np.int64).astype(np.float64)
+    noise = np.zeros((fy.size, CHUNK_SIZE, CHUNK_SIZE), dtype=np.float64)
+    weight = 0.0
+    freq = 1.0
+    amp = 1.0
+    for _ in range(octaves):
+        noise = noise + (_lattice_noise_3d(fx * scale * freq, fy * scale * freq, fz * scale * freq, cave_seed) * amp)
+        weight += amp
+        freq *= 2.03
+        amp *= 0.5
+    return ((noise / weight) * 0.5) + 0.5
+
+
+def sample_column_heights(ctx: TerrainContext, wx, wz):
+    """Version vectorizada de SimpleWsServer._sample_fixed_column_height.
+
+    Devuelve (alturas int64 con -1 en columnas vacias, indices de bioma,
+    paleta de nombres de bioma).
+    """
+    wx = np.asarray(wx, dtype=np.int64)
+    wz = np.asarray(wz, dtype=np.int64)
+    flat_x = wx.ravel().tolist()
+    flat_z = wz.ravel().tolist()
+    palette: list[str] = []
+    palette_idx: dict[str, int] = {}
+    biome_codes = np.full(len(flat_x), -1, dtype=np.int64)
+
+    if ctx.quadrants_layout:
+        for i, (cx, cz) in enumerate(zip(flat_x, flat_z)):
+            biome = quadrant_biome(ctx.quadrant_biomes, cx, cz)
+            code = palette_idx.get(biome)
+            if code is None:
+                code = palette_idx[biome] = len(palette)
+                palette.append(biome)
+            biome_codes[i] = code
+    elif ctx.terrain_cells:
+        cells = ctx.terrain_cells
+        for i, (cx, cz) in enumerate(zip(flat_x, flat_z)):
+            biome = (cells.get(f"{cx},{cz}") or "").strip().lower()
+            if not biome:
+                continue
+            code = palette_idx.get(biome)
+            if code is None:
+                code = palette_idx[biome] = len(palette)
+                palette.append(biome)
+            biome_codes[i] = code
+
+    scale = ctx.noise_scale
+    fx = wx.ravel().astype(np.float64)
+    fz = wz.ravel().astype(np.float64)
+    noise = np.zeros(fx.shape, dtype=np.float64)
+    weight = 0.0
+    freq = 1.0
+    amp_mul = 1.0
+    for _ in range(ctx.noise_octaves):
+        noise = noise + (_value_noise_2d(fx * scale * freq, fz * scale * freq, ctx.seed_hash) * amp_mul)
+        weight += amp_mul
+        freq *= 2.07
+        amp_mul *= 0.5
+    normalized = noise / weight
+
+    biome_y_lut = np.zeros(max(1, len(palette)), dtype=np.float64)
+    rough_lut = np.ones(max(1, len(palette)), dtype=np.float64)
+    for code, biome in enumerate(palette):
+        biome_y_lut[code] = BIOME_HEIGHT_OFFSET.get(biome, 0.0)
+        rough_lut[code] = ctx.biome_roughness.get(biome, 1.0)
+    safe_codes = np.maximum(biome_codes, 0)
+    final_h = (ctx.base_height + biome_y_lut[safe_codes]) + ((normalized * ctx.noise_amplitude) * rough_lut[safe_codes])
+    final_h = np.clip(final_h, 0.0, float(ctx.column_height_cap - 1))
+    heights = np.rint(final_h).astype(np.int64)
+    heights[biome_codes < 0] = -1
+    return heights.reshape(wx.shape), biome_codes.reshape(wx.shape), palette
+
+
+def sample_chunk_heightmap(
+    ctx: TerrainContext,
+    chunk_x: int,
+    chunk_z: int,
+    biome_ids: dict[str, int],
+    biome_names: list[str],
+):
+    """Heightmap de las 16x16 columnas de un chunk, plano con i = x + z*16.
+
+    Devuelve (alturas int16 con -1 en columnas vacias, biomas uint8 con
+    VOID_BIOME_ID en columnas vacias). Los biomas nuevos se anaden a la paleta
+    del mundo (biome_ids/biome_names).
+    """
+    x0 = int(chunk_x) * CHUNK_SIZE
+    z0 = int(chunk_z) * CHUNK_SIZE
+    gz, gx = np.meshgrid(
+        np.arange(z0, z0 + CHUNK_SIZE, dtype=np.int64),
+        np.arange(x0, x0 + CHUNK_SIZE, dtype=np.int64),
+        indexing="ij",
+    )
+    heights, codes, palette = sample_column_heights(ctx, gx, gz)
+    lut = np.full(max(1, len(palette)), VOID_BIOME_ID, dtype=np.uint8)
+    for code, biome in enumerate(palette):
+        lut[code] = register_biome_id(biome_ids, biome_names, biome)
+    biomes = np.where(codes >= 0, lut[np.maximum(codes, 0)], VOID_BIOME_ID).astype(np.uint8)
+    return heights.astype(np.int16).reshape(-1), biomes.reshape(-1)
+
+
+def heightmap_window(tiles: list):
+    """Une 3x3 teselas (orden dz, dx desde -1) en la ventana 18x18 [z, x] que
+    necesita generate_base_chunk: las columnas del chunk central mas 1 de borde.
+
+    Devuelve (alturas int64 con -1 en vacias, codigos de bioma int64 con -1 en
+    vacias).
+    """
+    h_rows = []
+    b_rows = []
+    for row in range(3):
+        row_tiles = tiles[row * 3:(row * 3) + 3]
+        h_rows.append(np.concatenate([np.asarray(t[0]).reshape(CHUNK_SIZE, CHUNK_SIZE) for t in row_tiles], axis=1))
+        b_rows.append(np.concatenate([np.asarray(t[1]).reshape(CHUNK_SIZE, CHUNK_SIZE) for t in row_tiles], axis=1))
+    lo = CHUNK_SIZE - 1
+    hi = (CHUNK_SIZE * 2) + 1
+    heights = np.concatenate(h_rows, axis=0)[lo:hi, lo:hi].astype(np.int64)
+    codes = np.concatenate(b_rows, axis=0)[lo:hi, lo:hi].astype(np.int64)
+    codes[codes == VOID_BIOME_ID] = -1
+    return heights, codes
+
+
+def region_worm_tunnels(world_seed: str, params: tuple, rx: int, rz: int) -> list[tuple]:
+    """Worms que nacen en la region (rx, rz) de WORM_REGION_SIZE voxels.
+
+    Cada worm es una capsula de dos segmentos (inicio -> medio -> fin) fija en
+    XZ. La Y depende de la columna consultada (banda bajo la superficie), asi
+    que se guarda en forma relativa:
+    (sx, sz, mx, mz, ex, ez, sy_r, dy_slope, curve_y, radius, min_x, max_x, min_z, max_z)
+    """
+    worm_count, min_len, max_len, min_rad, max_rad, _ = params
+    region = WORM_REGION_SIZE
+    rxx = int(rx)
+    rzz = int(rz)
+    region_seed = seed_hash(f"{world_seed}:worms:v1:{rxx}:{rzz}")
+    base_x = rxx * region
+    base_z = rzz * region
+    out: list[tuple] = []
+    for i in range(worm_count):
+        sx = base_x + (random_from_int2d((rxx * 131) + (i * 17) + 11, (rzz * 193) - (i * 29) - 7, region_seed) * region)
+        sz = base_z + (random_from_int2d((rxx * 197) + (i * 23) + 5, (rzz * 149) - (i * 31) - 13, region_seed) * region)
+        sy_r = random_from_int2d((rxx * 167) + (i * 19) + 3, (rzz * 173) - (i * 37) - 9, region_seed)
+        theta = random_from_int2d((rxx * 181) + (i * 41) + 1, (rzz * 211) - (i * 43) - 1, region_seed) * (math.pi * 2.0)
+        length = min_len + (random_from_int2d((rxx * 223) + (i * 47) + 2, (rzz * 227) - (i * 53) - 2, region_seed) * (max_len - min_len))
+        radius = min_rad + (random_from_int2d((rxx * 229) + (i * 59) + 4, (rzz * 233) - (i * 61) - 4, region_seed) * (max_rad - min_rad))
+        dy_slope = (random_from_int2d((rxx * 239) + (i * 67) + 6, (rzz * 241) - (i * 71) - 6, region_seed) - 0.5) * (length * 0.18)
+        curve_lat = (random_from_int2d((rxx * 251) + (i * 73) + 8, (rzz * 257) - (i * 79) - 8, region_seed) - 0.5) * (length * 0.45)
+        curve_y = (random_from_int2d((rxx * 263) + (i * 83) + 10, (rzz * 269) - (i * 89) - 10, region_seed) - 0.5) * (length * 0.22)
+        dx = math.cos(theta)
+        dz = math.sin(theta)
+        ex = sx + (dx * length)
+        ez = sz + (dz * length)
+        mx = sx + (dx * (length * 0.5)) + ((-dz) * curve_lat)
+        mz = sz + (dz * (length * 0.5)) + (dx * curve_lat)
+        out.append(
+            (
+                sx, sz, mx, mz, ex, ez, sy_r, dy_slope, curve_y, radius,
+                min(sx, mx, ex) - radius,
+                max(sx, mx, ex) + radius,
+                min(sz, mz, ez) - radius,
+                max(sz, mz, ez) + radius,
+            )
+        )
+    return out
+
+
+def chunk_worm_tunnels(world_seed: str, params: tuple, chunk_x: int, chunk_z: int, region_lookup=None) -> list[tuple]:
+    """Worms cuya caja XZ toca el chunk, tomados de las 3x3 regiones vecinas
+    (mismo vecindario que consulta la ruta por voxel). region_lookup(rx, rz)
+    permite servir las regiones desde una cache."""
+    if params is None:
+        return []
+    region = WORM_REGION_SIZE
+    rx = math.floor((int(chunk_x) * CHUNK_SIZE) / region)
+    rz = math.floor((int(chunk_z) * CHUNK_SIZE) / region)
+    chunk_min_x = float(int(chunk_x) * CHUNK_SIZE)
+    chunk_max_x = chunk_min_x + float(CHUNK_SIZE - 1)
+    chunk_min_z = float(int(chunk_z) * CHUNK_SIZE)
+    chunk_max_z = chunk_min_z + float(CHUNK_SIZE - 1)
+    out: list[tuple] = []
+    for rzz in range(rz - 1, rz + 2):
+        for rxx in range(rx - 1, rx + 2):
+            worms = region_lookup(rxx, rzz) if region_lookup else region_worm_tunnels(world_seed, params, rxx, rzz)
+            for worm in worms:
+                if chunk_max_x < worm[10] or chunk_min_x > worm[11] or chunk_max_z < worm[12] or chunk_min_z > worm[13]:
+                    continue
+                out.append(worm)
+    return out
+
+
+def worm_tunnel_hit(worms: list[tuple], cave_min_y: int, x: int, y: int, z: int, top_y: int) -> bool:
+    # Consulta escalar: unas pocas comprobaciones AABB sobre los worms del chunk.
+    if not worms:
+        return False
+    # Banda vertical razonable para iniciar worms (subterraneo, no profundo extremo).
+    band_top = max(cave_min_y + 6, int(top_y) - 8)
+    band_bot = max(cave_min_y + 2, int(top_y) - 44)
+    if band_top <= band_bot:
+        band_top = band_bot + 2
+    px = float(x)
+    py = float(y)
+    pz = float(z)
+    for sx, sz, mx, mz, ex, ez, sy_r, dy_slope, curve_y, radius, min_x, max_x, min_z, max_z in worms:
+        if px < min_x or px > max_x or pz < min_z or pz > max_z:
+            continue
+        sy = band_bot + (sy_r * (band_top - band_bot))
+        ey = sy + dy_slope
+        my = sy + (dy_slope * 0.5) + curve_y
+        if py < (min(sy, my, ey) - radius) or py > (max(sy, my, ey) + radius):
+            continue
+        rad2 = radius * radius
+        if dist2_point_segment_3d(px, py, pz, sx, sy, sz, mx, my, mz) <= rad2:
+            return True
+        if dist2_point_segment_3d(px, py, pz, mx, my, mz, ex, ey, ez) <= rad2:
+            return True
+    return False
+
+
+def _worm_carve_mask(worms: list[tuple], cave_min_y: int, px, py, pz, top):
+    # Equivalente vectorizado de worm_tunnel_hit para voxels de un mismo chunk.
+    carve = np.zeros(px.shape, dtype=bool)
+    if not worms or px.size == 0:
+        return carve
+    band_top = np.maximum(cave_min_y + 6, top - 8)
+    band_bot = np.maximum(cave_min_y + 2, top - 44)
+    band_top = np.where(band_top <= band_bot, band_bot + 2, band_top)
+    band_span = band_top - band_bot
+    fx = px.astype(np.float64)
+    fy = py.astype(np.float64)
+    fz = pz.astype(np.float64)
+    for sx, sz, mx, mz, ex, ez, sy_r, dy_slope, curve_y, radius, min_x, max_x, min_z, max_z in worms:
+        sy = band_bot + (sy_r * band_span)
+        ey = sy + dy_slope
+        my = sy + (dy_slope * 0.5) + curve_y
+        min_y = np.minimum(np.minimum(sy, my), ey) - radius
+        max_y = np.maximum(np.maximum(sy, my), ey) + radius
+        inside = ~((fx < min_x) | (fx > max_x) | (fy < min_y) | (fy > max_y) | (fz < min_z) | (fz > max_z))
+        if not inside.any():
+            continue
+        rad2 = radius * radius
+        hit = _dist2_point_segment(fx, fy, fz, sx, sy, sz, mx, my, mz) <= rad2
+        hit |= _dist2_point_segment(fx, fy, fz, mx, my, mz, ex, ey, ez) <= rad2
+        carve |= inside & hit
+    return carve
+
+
+def _dist2_point_segment(px, py, pz, ax, ay, az, bx, by, bz):
+    abx = bx - ax
+    aby = by - ay
+    abz = bz - az
+    apx = px - ax
+    apy = py - ay
+    apz = pz - az
+    ab2 = (abx * abx) + (aby * aby) + (abz * abz)
+    degenerate = ab2 <= 1e-9
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = ((apx * abx) + (apy * aby) + (apz * abz)) / ab2
+    t = np.clip(t, 0.0, 1.0)
+    dx = px - (ax + (abx * t))
+    dy = py - (ay + (aby * t))
+    dz = pz - (az + (abz * t))
+    d2 = (dx * dx) + (dy * dy) + (dz * dz)
+    return np.where(degenerate, (apx * apx) + (apy * apy) + (apz * apz), d2)
+
+
+def generate_base_chunk(
+    ctx: TerrainContext,
+    chunk_x: int,
+    chunk_z: int,
+    custom_top_blocks: dict | None = None,
+    column_window=None,
+    worm_tunnels: list[tuple] | None = None,
+    block_tables: TerrainBlockTables | None = None,
+):
+    """Genera el terreno base de un chunk completo (16 x ctx.height x 16).
+
+    Devuelve un array uint16 plano con layout i = x + z*16 + y*256, bit a bit
+    identico a evaluar SimpleWsServer._compute_base_block_id_at voxel a voxel.
+    column_window = (alturas, codigos, paleta) permite reutilizar un heightmap
+    ya cacheado (ver heightmap_window) en lugar de volver a muestrearlo y
+    worm_tunnels los worms del chunk (ver chunk_worm_tunnels). block_tables
+    reutiliza las tablas de seleccion ya compiladas del mundo; si falta se
+    construyen a partir de custom_top_blocks.
+    """
+    world_seed = ctx.world_seed
+    height = ctx.height
+    cx = int(chunk_x)
+    cz = int(chunk_z)
+    x0 = cx * CHUNK_SIZE
+    z0 = cz * CHUNK_SIZE
+
+    # Alturas con borde de 1 columna para el slope hint de superficie.
+    ext_z, ext_x = np.meshgrid(
+        np.arange(z0 - 1, z0 + CHUNK_SIZE + 1, dtype=np.int64),
+        np.arange(x0 - 1, x0 + CHUNK_SIZE + 1, dtype=np.int64),
+        indexing="ij",
+    )
+    if column_window is not None:
+        ext_heights, ext_codes, palette = column_window
+    else:
+        ext_heights, ext_codes, palette = sample_column_heights(ctx, ext_x, ext_z)
+    top = ext_heights[1:-1, 1:-1]
+    codes = ext_codes[1:-1, 1:-1]
+    col_x = ext_x[1:-1, 1:-1]
+    col_z = ext_z[1:-1, 1:-1]
+    solid_col = top >= 0
+
+    # Slope hint: max diferencia con las 4 vecinas (vecinas vacias no cuentan).
+    slope = np.zeros(top.shape, dtype=np.int64)
+    for nb in (ext_heights[1:-1, 2:], ext_heights[1:-1, :-2], ext_heights[2:, 1:-1], ext_heights[:-2, 1:-1]):
+        slope = np.maximum(slope, np.where(nb >= 0, np.abs(nb - top), 0))
+    slope_bins = np.where(slope < 1.0, 0, np.where(slope < 2.5, 1, 2))
+
+    if block_tables is None:
+        block_tables = TerrainBlockTables(world_seed, custom_top_blocks)
+    surface = block_tables.surface_layer(col_x, col_z, codes, palette, slope_bins, solid_col)
+
+    # Volumen [y, z, x] -> flatten C == i = x + z*16 + y*256.
+    vy = np.arange(height, dtype=np.int64).reshape(height, 1, 1)
+    vx = np.broadcast_to(col_x, (height, CHUNK_SIZE, CHUNK_SIZE))
+    vz = np.broadcast_to(col_z, (height, CHUNK_SIZE, CHUNK_SIZE))
+    vy = np.broadcast_to(vy, (height, CHUNK_SIZE, CHUNK_SIZE))
+    vtop = np.broadcast_to(top, (height, CHUNK_SIZE, CHUNK_SIZE))
+    vcodes = np.broadcast_to(codes, (height, CHUNK_SIZE, CHUNK_SIZE))
+
+    blocks = np.zeros((height, CHUNK_SIZE, CHUNK_SIZE), dtype=np.int64)
+    is_top = vy == vtop
+    is_subsoil = (vy < vtop) & (vy >= (vtop - 3))
+    is_deep = vy < (vtop - 3)
+    blocks = np.where(is_top, np.broadcast_to(surface, blocks.shape), blocks)
+    for code, biome in enumerate(palette):
+        in_biome = vcodes == code
+        sel = in_biome & is_subsoil
+        if sel.any():
+            sy = vy[sel]
+            blocks[sel] = block_tables.subsoil(biome).pick_many(vx[sel] + (sy * 11), vz[sel] - (sy * 7))
+        sel = in_biome & is_deep
+        if sel.any():
+            sy = vy[sel]
+            blocks[sel] = block_tables.deep(biome).pick_many(vx[sel] + (sy * 17), vz[sel] - (sy * 13))
+
+    surface_buffer = ctx.cave_surface_buffer
+
+    # Promocion emisiva (bloque 20) en zonas profundas.
+    density = ctx.emissive_density
+    if ctx.emissive_enabled and density > 0.0:
+        sel = (blocks > 0) & (vy < (vtop - (surface_buffer + 2)))
+        if sel.any():
+            depth = np.maximum(0, vtop[sel] - vy[sel])
+            depth_mul = 1.0 + np.minimum(0.9, np.maximum(0.0, (depth - 8) * 0.03))
+            chance = np.clip(density * depth_mul, 0.0, 0.25)
+            r = _hash_unit_3d(vx[sel], vy[sel], vz[sel], ctx.emissive_seed_hash)
+            promoted = blocks[sel]
+            promoted[r < chance] = 20
+            blocks[sel] = promoted
+
+    # Tallado de cuevas (ruido 3D + worms), solo en la banda Y que puede tallarse.
+    if ctx.cave_enabled and solid_col.any():
+        min_y = ctx.cave_min_y
+        max_y = min(height, int(top.max()) - surface_buffer)
+        safe_r = ctx.cave_spawn_safe_radius
+        band = slice(min_y, max(min_y, max_y))
+        sub = blocks[band]
+        sub_y = vy[band]
+        sub_top = vtop[band]
+        cand = (sub > 0) & (sub_y < (sub_top - surface_buffer))
+        if safe_r > 0:
+            cand &= ((col_x * col_x) + (col_z * col_z)) > (safe_r * safe_r)
+        if cand.any():
+            thr_lut = np.zeros(max(1, len(palette)), dtype=np.float64)
+            for code, biome in enumerate(palette):
+                thr_lut[code] = ctx.cave_threshold_for(biome)
+            thr = thr_lut[np.maximum(codes, 0)]
+            depth = np.maximum(0, sub_top - sub_y)
+            thr = np.where(depth < (surface_buffer + 6), thr + 0.06, np.where(depth > 24, thr - 0.03, thr))
+            thr = np.clip(thr, 0.40, 0.95)
+
+            n01 = cave_noise_field(ctx.cave_seed_hash, ctx.cave_noise_scale, ctx.cave_noise_octaves, x0, z0, band.start, band.stop)
+            carve = cand & (n01 > thr)
+            params = ctx.worm
+            if params is not None:
+                if worm_tunnels is None:
+                    worm_tunnels = chunk_worm_tunnels(world_seed, params, cx, cz)
+                carve[cand] |= _worm_carve_mask(
+                    worm_tunnels,
+                    params[5],
+                    vx[band][cand],
+                    sub_y[cand],
+                    vz[band][cand],
+                    sub_top[cand],
+                )
+            sub[carve] = 0
+
+    blocks[:, ~solid_col] = 0
+    return blocks.astype(np.uint16).reshape(-1)
+
+
+def chunk_solid_mask(blocks, height: int):
+    # Bitmask de solidez [y, z, x] de un chunk final (base + overrides).
+    return np.frombuffer(blocks, dtype=np.uint16).reshape(int(height), CHUNK_SIZE, CHUNK_SIZE) > 0
+
+
+def solid_window(masks: dict, x0: int, z0: int, size: int, height: int):
+    """Une las mascaras de los chunks que cubren [x0, x0+size) x [z0, z0+size)
+    en un volumen [y, z, x], con 2 capas vacias extra arriba para la
+    comprobacion de hueco sobre la columna.
+    """
+    out = np.zeros((int(height) + 2, size, size), dtype=bool)
+    for (cx, cz), mask in masks.items():
+        gx0 = max(x0, cx * CHUNK_SIZE)
+        gx1 = min(x0 + size, (cx + 1) * CHUNK_SIZE)
+        gz0 = max(z0, cz * CHUNK_SIZE)
+        gz1 = min(z0 + size, (cz + 1) * CHUNK_SIZE)
+        if gx0 >= gx1 or gz0 >= gz1:
+            continue
+        out[: int(height), gz0 - z0 : gz1 - z0, gx0 - x0 : gx1 - x0] = mask[
+            :, gz0 - (cz * CHUNK_SIZE) : gz1 - (cz * CHUNK_SIZE), gx0 - (cx * CHUNK_SIZE) : gx1 - (cx * CHUNK_SIZE)
+        ]
+    return out
+
+
+def spawn_actor_y_grid(solid, ref_top: int, world_height: int, max_offset: int = 16):
+    """Version vectorizada de SimpleWsServer._find_spawn_actor_y_for_column.
+
+    Suelo solido en top con top+1 y top+2 libres; se prueba ref_top,
+    ref_top-1, ref_top+1, ... y gana el primer top valido. Devuelve actor_y
+    por columna [z, x] (NaN si la columna no tiene hueco valido).
+    """
+    tops = []
+    limit = min(int(world_height) - 2, solid.shape[0] - 2)
+    for off in range(0, int(max_offset) + 1):
+        for top in ((ref_top,) if off == 0 else (ref_top - off, ref_top + off)):
+            if 0 <= top < limit:
+                tops.append(top)
+    if not tops:
+        return np.full(solid.shape[1:], np.nan)
+    t = np.asarray(tops, dtype=np.int64)
+    ok = solid[t] & ~solid[t + 1] & ~solid[t + 2]
+    first = ok.argmax(axis=0)
+    return np.where(ok.any(axis=0), t[first] + 1.0, np.nan)
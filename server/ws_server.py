@@ -1,11 +1,17 @@
+from array import array
 import asyncio
+import base64
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 import hashlib
 import json
 import math
 import os
 import random
+import sys
 import threading
+import zlib
 
 from mysql.connector import Error
 from mysql.connector import errorcode
@@ -18,13 +24,40 @@ except ImportError as exc:
     ) from exc
 
 from .auth import utc_now, verify_password
+from .chunk_store import DEFAULT_CHUNK_CACHE_DIR, BaseChunkDiskCache, base_chunk_cache_key
 from .database import DatabaseManager
 from .decor import build_world_decor_slots
 from .terrain import build_fixed_world_terrain
+from .voxel_store import DEFAULT_VOXEL_REGION_DIR, RegionVoxelStore
+from .voxel_terrain import (
+    BIOME_HEIGHT_OFFSET,
+    CHUNK_SIZE,
+    HAS_NUMPY,
+    VOID_BIOME_ID,
+    VOXEL_LAYER_SIZE,
+    TerrainBlockTables,
+    TerrainContext,
+    chunk_solid_mask,
+    chunk_worm_tunnels,
+    dist2_point_segment_3d,
+    generate_base_chunk,
+    heightmap_window,
+    quadrant_biome,
+    random_from_int2d,
+    region_worm_tunnels,
+    register_biome_id,
+    sample_chunk_heightmap,
+    seed_hash,
+    solid_window,
+    spawn_actor_y_grid,
+    worm_tunnel_hit,
+)
 
 class SimpleWsServer:
     def __init__(self, host: str, port: int, db: DatabaseManager, log_fn, network_settings=None, network_event_cb=None):
-        self.protocol_version = "1.1.0"
+        self.protocol_version = "1.2.0"
+        # Capacidades que un cliente puede declarar en login (payload.capabilities).
+        self.protocol_capabilities = ("supports_chunk_patch", "supports_player_aoi", "supports_players_snapshot")
         self.server_build = datetime.now(timezone.utc).strftime("%Y-%m-%d")
         self.host = host
         self.port = port
@@ -38,12 +71,88 @@ class SimpleWsServer:
         self.server = None
         self.clients: set = set()
         self.sessions: dict = {}
+        # Indices de sesiones mantenidos en login/enter_world/logout/desconexion
+        # (_index_session, _index_session_world, _pop_session).
+        self.world_clients_by_name: dict[str, set] = {}
+        self.ws_by_username: dict[str, object] = {}
         self.decor_maintenance_last_by_world: dict[int, float] = {}
         self.world_loot_by_world: dict[int, dict[str, dict]] = {}
-        self.world_voxel_changes_by_world: dict[int, dict[str, int]] = {}
+        self.world_voxel_changes_by_world: dict[int, OrderedDict] = {}
+        self.world_voxel_chunk_index_by_world: dict[int, set[tuple[int, int]]] = {}
         self.world_voxel_loaded_worlds: set[int] = set()
+        # Version de edicion por chunk (solo sube). Las versiones solo son
+        # comparables dentro de la misma voxel_sync_epoch (una por arranque).
+        self.world_voxel_chunk_versions_by_world: dict[int, dict[tuple[int, int], int]] = {}
+        self.voxel_sync_epoch = os.urandom(6).hex()
+        self.voxel_sync_max_known_chunks = 65536
+        # Ventana de chunks de cada sesion (parches voxel y world_chunk_request):
+        # view_distance_chunks + este margen (igual al margen de descarga del cliente).
+        self.chunk_window_margin_chunks = 3
+        self.voxel_override_cache_max_chunks_per_world = 4096
+        self.voxel_override_keep_radius_chunks = 8
+        self.voxel_dirty_chunks: dict[tuple[int, int, int], float] = {}
+        self.voxel_inflight_chunks: dict[tuple[int, int, int], int] = {}
+        self.voxel_persist_window_s = 1.0
+        # Tras un fallo de escritura no se reintenta hasta voxel_persist_retry_at
+        # (espera exponencial hasta voxel_persist_retry_max_s); el aviso se
+        # repite como mucho cada voxel_persist_warn_interval_s.
+        self.voxel_persist_retry_s = 1.0
+        self.voxel_persist_retry_max_s = 60.0
+        self.voxel_persist_warn_interval_s = 30.0
+        self.voxel_persist_failures = 0
+        self.voxel_persist_retry_at = 0.0
+        self.voxel_persist_warned_at = 0.0
+        self.voxel_persist_executor: ThreadPoolExecutor | None = None
+        # Generacion de chunks base para world_chunk_request fuera del loop.
+        self.chunk_gen_executor: ThreadPoolExecutor | None = None
+        # Almacen de ediciones voxel por mundo (mundos.voxel_storage): la DB o
+        # ficheros de region locales bajo voxel_region_dir.
+        self.voxel_region_dir = DEFAULT_VOXEL_REGION_DIR
+        self.voxel_region_store: RegionVoxelStore | None = None
+        self.world_voxel_store_by_world: dict[int, object] = {}
+        self.world_terrain_ctx_by_world: dict[int, TerrainContext] = {}
+        self.world_base_chunks_by_world: dict[int, dict] = {}
+        self.base_chunk_cache_max_per_world = 256
+        self.base_chunk_disk_dir = DEFAULT_CHUNK_CACHE_DIR
+        # Linea [INFO] periodica con terrain_cache_stats(); 0 la desactiva.
+        self.terrain_cache_log_interval_s = 300.0
+        self.terrain_cache_logged: dict[int, dict] = {}
+        self.world_heightmaps_by_world: dict[int, dict] = {}
+        self.heightmap_cache_max_chunks_per_world = 1024
+        self.world_chunk_payloads_by_world: dict[int, dict] = {}
+        self.chunk_payload_cache_max_per_world = 512
+        self.chunk_request_max_per_call = 32
+        # Sin NumPy los chunks se generan voxel a voxel en el loop: como mucho
+        # estos por llamada, el resto va a rejected con retry = true.
+        self.chunk_request_max_sync_generate = 1
+        self.world_chunk_solids_by_world: dict[int, dict] = {}
+        self.chunk_solid_cache_max_per_world = 256
+        self.spawn_cache_max_per_world = 128
+        self.spawn_search_radius = 9
+        self.worm_index_by_seed: dict[str, dict] = {}
+        self.worm_index_max_chunks = 1024
         self.voxel_world_height = 128
         self.voxel_edit_reach = 64.0
+        # Area de interes de jugadores (world_player_moved): rejilla uniforme por
+        # mundo; se entra al AOI a aoi_radius y se sale a aoi_radius + histeresis.
+        self.world_aoi_by_world: dict[str, dict] = {}
+        self.aoi_cell_size = 32.0
+        self.aoi_radius = 96.0
+        self.aoi_hysteresis = 16.0
+        # Tick de mundo (movement_sync.server_tick_hz > 0): ultimo estado de cada
+        # jugador movido por destinatario, enviado en un world_players_snapshot.
+        self.world_tick_pending: dict[object, dict] = {}
+        self.world_tick_seq = 0
+        # Cola de salida por conexion, drenada por su propia tarea. Los eventos de
+        # outbound_latest_wins (accion -> campo clave del payload) sustituyen a su
+        # version aun no enviada; el resto es fiable. Un cliente con la cola por
+        # encima de outbound_high_water durante outbound_high_water_s, o con la
+        # cola llena, se desconecta.
+        self.outbound_by_ws: dict[object, dict] = {}
+        self.outbound_latest_wins = {"world_player_moved": "id", "world_player_emotion": "id"}
+        self.outbound_queue_max = 1024
+        self.outbound_high_water = 256
+        self.outbound_high_water_s = 5.0
         self.loot_pickup_radius = 1.35
         self.loot_spawn_radius_min = 0.45
         self.loot_spawn_radius_max = 1.35
@@ -51,10 +160,27 @@ class SimpleWsServer:
         self.inventory_total_slots = 32
         self.inventory_hotbar_slots = 8
         self.character_max_slots = 3
-        self.world_biome_top_blocks_cache: dict[int, dict] = {}
+        self.voxel_block_catalog: dict | None = None
+        self.world_block_tables_by_world: dict[int, TerrainBlockTables] = {}
+        self.item_catalog_recheck_sec = 300.0
         self.position_persist_min_interval_sec = 2.5
         self.position_persist_min_distance = 0.9
 
+    def _negotiate_capabilities(self, requested) -> frozenset:
+        # Interseccion entre lo que declara el cliente y lo que soporta el servidor.
+        if not isinstance(requested, list):
+            return frozenset()
+        return frozenset(str(c) for c in requested if str(c) in self.protocol_capabilities)
+
+    def _world_tick_hz(self) -> int:
+        # 0 = sin tick: cada world_move se reenvia al momento.
+        sync = self.network_settings.get("movement_sync")
+        try:
+            hz = int((sync if isinstance(sync, dict) else {}).get("server_tick_hz") or 0)
+        except (TypeError, ValueError):
+            hz = 0
+        return max(0, min(60, hz))
+
     def _network_config_payload(self) -> dict:
         timeout_ms = self.network_settings.get("client_request_timeout_ms", 12000)
         try:
@@ -92,6 +218,7 @@ class SimpleWsServer:
                 "remote_max_follow_speed": remote_max_follow_speed,
                 "remote_teleport_distance": _f("remote_teleport_distance", 25.0, 1.0, 500.0),
                 "remote_stop_epsilon": _f("remote_stop_epsilon", 0.03, 0.001, 2.0),
+                "server_tick_hz": self._world_tick_hz(),
             },
             "protocol_version": self.protocol_version,
             "server_build": self.server_build,
@@ -334,16 +461,38 @@ class SimpleWsServer:
         hint_y = float(spawn_hint.get("y") or 60.0)
         hint_z = float(spawn_hint.get("z") or 0.0)
 
+        ctx = self._terrain_context(world, terrain_config, terrain_cells) if HAS_NUMPY else None
+        spawns = self._world_chunk_solid_cache(ctx)["spawns"] if ctx is not None else None
+        # Ultimo spawn bueno por zona: chunk de la posicion preferida, franja de
+        # altura de un chunk y spawn_hint. Solo se reutiliza si queda dentro del
+        # radio que la busqueda aceptaria desde esta posicion.
+        cache_key = (
+            math.floor(pref_x / CHUNK_SIZE),
+            math.floor(pref_z / CHUNK_SIZE),
+            math.floor(pref_y / CHUNK_SIZE),
+            int(round(hint_x)),
+            int(round(hint_y)),
+            int(round(hint_z)),
+        )
+        if spawns is not None:
+            hit = spawns.get(cache_key)
+            if hit is not None and max(abs(hit[0]["x"] - pref_x), abs(hit[0]["z"] - pref_z)) <= self.spawn_search_radius:
+                spawns.move_to_end(cache_key)
+                return dict(hit[0])
+        deps: set[tuple[int, int]] = set()
+
         # 1) Buscar cerca de la posicion preferida.
+        result = None
         best = None
         best_score = None
-        for radius in range(0, 10):
+        column_y = self._spawn_column_lookup(
+            world_id, world, terrain_config, terrain_cells, ctx, int(round(pref_x)), int(round(pref_z)), self.spawn_search_radius, pref_y, deps
+        )
+        for radius in range(0, self.spawn_search_radius + 1):
             for ox, oz in self._iter_ring_offsets(radius):
                 cx = int(round(pref_x)) + ox
                 cz = int(round(pref_z)) + oz
-                actor_y = self._find_spawn_actor_y_for_column(
-                    world_id, world, terrain_config, terrain_cells, cx, cz, pref_y
-                )
+                actor_y = column_y(cx, cz)
                 if actor_y is None:
                     continue
                 score = math.hypot(cx - pref_x, cz - pref_z) + (abs(actor_y - pref_y) * 0.18)
@@ -352,22 +501,74 @@ class SimpleWsServer:
                     best_score = score
             if best is not None and radius >= 2:
                 break
-        if best is not None:
-            return best
+        result = best
 
         # 2) Fallback alrededor de spawn_hint.
-        for radius in range(0, 20):
-            for ox, oz in self._iter_ring_offsets(radius):
-                cx = int(round(hint_x)) + ox
-                cz = int(round(hint_z)) + oz
-                actor_y = self._find_spawn_actor_y_for_column(
-                    world_id, world, terrain_config, terrain_cells, cx, cz, hint_y
-                )
-                if actor_y is not None:
-                    return {"x": float(cx), "y": float(actor_y), "z": float(cz)}
+        if result is None:
+            column_y = self._spawn_column_lookup(
+                world_id, world, terrain_config, terrain_cells, ctx, int(round(hint_x)), int(round(hint_z)), 19, hint_y, deps
+            )
+            for radius in range(0, 20):
+                for ox, oz in self._iter_ring_offsets(radius):
+                    cx = int(round(hint_x)) + ox
+                    cz = int(round(hint_z)) + oz
+                    actor_y = column_y(cx, cz)
+                    if actor_y is not None:
+                        result = {"x": float(cx), "y": float(actor_y), "z": float(cz)}
+                        break
+                if result is not None:
+                    break
 
         # 3) Ultimo fallback: spawn_hint tal cual.
-        return {"x": float(hint_x), "y": float(hint_y), "z": float(hint_z)}
+        if result is None:
+            result = {"x": float(hint_x), "y": float(hint_y), "z": float(hint_z)}
+
+        if spawns is not None:
+            spawns[cache_key] = (dict(result), frozenset(deps))
+            while len(spawns) > max(1, int(self.spawn_cache_max_per_world)):
+                spawns.popitem(last=False)
+        return result
+
+    def _spawn_column_lookup(
+        self,
+        world_id: int,
+        world: dict,
+        terrain_config: dict,
+        terrain_cells: dict,
+        ctx: TerrainContext | None,
+        center_x: int,
+        center_z: int,
+        radius: int,
+        ref_actor_y: float,
+        deps: set,
+    ):
+        # Devuelve f(x, z) -> actor_y | None para el cuadrado de radio dado.
+        # Con NumPy se resuelve todo el cuadrado de una vez sobre las mascaras
+        # de solidez por chunk; sin NumPy se evalua columna a columna.
+        if ctx is None:
+            return lambda x, z: self._find_spawn_actor_y_for_column(
+                world_id, world, terrain_config, terrain_cells, x, z, ref_actor_y
+            )
+        size = (int(radius) * 2) + 1
+        x0 = int(center_x) - int(radius)
+        z0 = int(center_z) - int(radius)
+        masks = {}
+        for cz in range(z0 // CHUNK_SIZE, ((z0 + size - 1) // CHUNK_SIZE) + 1):
+            for cx in range(x0 // CHUNK_SIZE, ((x0 + size - 1) // CHUNK_SIZE) + 1):
+                masks[(cx, cz)] = self._chunk_solid_mask(world_id, ctx, cx, cz)
+                deps.add((cx, cz))
+        world_h = max(8, int(terrain_config.get("voxel_world_height") or self.voxel_world_height or 128))
+        grid = spawn_actor_y_grid(
+            solid_window(masks, x0, z0, size, ctx.height),
+            int(round(float(ref_actor_y) - 1.0)),
+            world_h,
+        )
+
+        def lookup(x: int, z: int):
+            actor_y = grid[int(z) - z0, int(x) - x0]
+            return None if actor_y != actor_y else float(actor_y)
+
+        return lookup
 
     def _resolve_safe_spawn_position(self, session: dict, preferred_pos: dict | None = None) -> dict:
         spawn_hint = session.get("spawn_hint") or {"x": 0.0, "y": 60.0, "z": 0.0}
@@ -485,9 +686,9 @@ class SimpleWsServer:
                 "payload": payload,
             },
         )
-        await self._broadcast_world_event(
-            session["world_name"],
-            "world_player_moved",
+        await self._broadcast_player_moved(
+            websocket,
+            session,
             {
                 "id": session.get("user_id"),
                 "username": session.get("username"),
@@ -502,7 +703,6 @@ class SimpleWsServer:
                 "max_hp": snap["max_hp"],
                 "position": snap["position"],
             },
-            exclude=websocket,
         )
 
     def _session_role(self, websocket) -> str:
@@ -832,38 +1032,159 @@ class SimpleWsServer:
             self.world_loot_by_world[wid] = bucket
         return bucket
 
-    def _world_voxel_bucket(self, world_id: int) -> dict[str, int]:
+    def _world_voxel_bucket(self, world_id: int) -> OrderedDict:
+        # Overrides residentes por chunk (LRU): (cx, cz) -> {indice local: block_id},
+        # con el mismo indice que los chunks base (x + z*16 + y*256).
         wid = int(world_id or 0)
         if wid <= 0:
-            return {}
+            return OrderedDict()
         bucket = self.world_voxel_changes_by_world.get(wid)
         if bucket is None:
-            bucket = {}
+            bucket = OrderedDict()
             self.world_voxel_changes_by_world[wid] = bucket
         return bucket
 
-    def _voxel_key(self, x: int, y: int, z: int) -> str:
-        return f"{int(x)},{int(y)},{int(z)}"
+    def _world_voxel_store(self, world_id: int):
+        return self.world_voxel_store_by_world.get(int(world_id or 0)) or self.db
+
+    def _region_voxel_store(self) -> RegionVoxelStore:
+        if self.voxel_region_store is None:
+            self.voxel_region_store = RegionVoxelStore(self.voxel_region_dir)
+        return self.voxel_region_store
 
-    def _parse_voxel_key(self, key: str):
+    def _migrate_world_voxel_storage(self, world: dict):
+        # Se ejecuta al arrancar (fuera del loop): deja las ediciones del mundo en
+        # el almacen que indica mundos.voxel_storage, copiando en ambos sentidos.
+        wid = int(world.get("id") or 0)
+        if wid <= 0 or not self.voxel_region_dir:
+            return
+        mode = (world.get("voxel_storage") or "mysql").strip().lower()
+        store = self._region_voxel_store()
         try:
-            xs, ys, zs = str(key).split(",", 2)
-            return int(xs), int(ys), int(zs)
-        except Exception:
+            if mode == "region" and not store.has_world(wid):
+                rows = self.db.list_world_voxel_chunks_at(wid, self.db.list_world_voxel_chunk_keys(wid))
+                store.save_world_voxel_chunks([(wid, r["chunk_x"], r["chunk_z"], r["overrides"]) for r in rows if r.get("overrides")])
+                store.init_world(wid)
+                self.log(f"[INFO] Ediciones voxel del mundo {wid} copiadas de MySQL a ficheros de region ({len(rows)} chunks)")
+            elif mode != "region" and store.has_world(wid):
+                rows = store.list_world_voxel_chunks_at(wid, store.list_world_voxel_chunk_keys(wid))
+                keep = {(int(r["chunk_x"]), int(r["chunk_z"])) for r in rows}
+                stale = [(wid, cx, cz, {}) for cx, cz in self.db.list_world_voxel_chunk_keys(wid) if (int(cx), int(cz)) not in keep]
+                self.db.save_world_voxel_chunks([(wid, r["chunk_x"], r["chunk_z"], r["overrides"]) for r in rows] + stale)
+                moved = store.retire_world(wid)
+                self.log(
+                    f"[INFO] Ediciones voxel del mundo {wid} copiadas de ficheros de region a MySQL "
+                    f"({len(rows)} chunks, {len(stale)} filas antiguas borradas); region apartada en {moved}"
+                )
+        except Exception as exc:
+            self.log(f"[WARN] No se pudo migrar el almacen voxel del mundo {wid} a {mode}: {exc}")
+
+    def _migrate_voxel_storage_all_worlds(self):
+        for world_name in self.db.list_world_names():
+            world = self.db.get_world_config(world_name)
+            if world:
+                self._migrate_world_voxel_storage(world)
+
+    def _bind_world_voxel_store(self, world: dict):
+        # El almacen se fija al cargar el indice del mundo y nunca copia datos:
+        # la migracion entre MySQL y region se hace al arrancar el servidor. Si
+        # mundos.voxel_storage cambio despues, el mundo sigue en el almacen que
+        # tiene sus ediciones hasta el proximo reinicio.
+        wid = int(world.get("id") or 0)
+        if wid <= 0 or wid in self.world_voxel_loaded_worlds:
+            return
+        mode = (world.get("voxel_storage") or "mysql").strip().lower()
+        on_region = bool(self.voxel_region_dir) and self._region_voxel_store().has_world(wid)
+        if on_region != (mode == "region") and self.voxel_region_dir:
+            self.log(
+                f"[WARN] Mundo {wid}: voxel_storage={mode} se aplicara al reiniciar; "
+                f"se sigue usando {'region' if on_region else 'mysql'}"
+            )
+        if on_region:
+            self.world_voxel_store_by_world[wid] = self.voxel_region_store
+        else:
+            self.world_voxel_store_by_world.pop(wid, None)
+
+    def _ensure_world_voxel_index(self, world_id: int) -> set[tuple[int, int]]:
+        # Solo se cargan las coordenadas de los chunks con overrides; los blobs
+        # se leen bajo demanda en _world_voxel_chunk_overrides. Un fallo de
+        # lectura se propaga sin marcar el mundo como cargado: un indice vacio
+        # haria que la siguiente edicion sobrescribiera las ediciones guardadas.
+        wid = int(world_id or 0)
+        if wid <= 0:
+            return set()
+        if wid not in self.world_voxel_loaded_worlds:
+            keys = self._world_voxel_store(wid).list_world_voxel_chunk_keys(wid)
+            self.world_voxel_chunk_index_by_world[wid] = set(keys)
+            self._world_voxel_bucket(wid).clear()
+            self.world_voxel_loaded_worlds.add(wid)
+        return self.world_voxel_chunk_index_by_world.setdefault(wid, set())
+
+    def _world_voxel_chunk_overrides(self, world_id: int, chunk_x: int, chunk_z: int, create: bool = False):
+        wid = int(world_id or 0)
+        if wid <= 0:
             return None
+        key = (int(chunk_x), int(chunk_z))
+        bucket = self._world_voxel_bucket(wid)
+        overrides = bucket.get(key)
+        if overrides is not None:
+            bucket.move_to_end(key)
+            return overrides
+        index = self._ensure_world_voxel_index(wid)
+        if key in index:
+            # Sin try: si la lectura falla no se cachea {} (ver _ensure_world_voxel_index).
+            rows = self._world_voxel_store(wid).list_world_voxel_chunks_at(wid, [key])
+            overrides = dict(rows[0].get("overrides") or {}) if rows else {}
+        elif create:
+            overrides = {}
+        else:
+            return None
+        bucket[key] = overrides
+        self._evict_world_voxel_chunks(wid, keep=key)
+        return overrides
+
+    def _evict_world_voxel_chunks(self, world_id: int, keep: tuple[int, int] | None = None):
+        # Descarta los chunks menos usados que no esten cerca de ningun jugador.
+        # Con write-behind un chunk residente puede estar sucio (pendiente de
+        # escribir) o en vuelo en el hilo de persistencia: esos se conservan, la
+        # memoria es su unica copia al dia. El resto ya esta persistido y basta
+        # con soltarlo.
+        bucket = self._world_voxel_bucket(world_id)
+        limit = max(1, int(self.voxel_override_cache_max_chunks_per_world))
+        if len(bucket) <= limit:
+            return
+        radius = max(0, int(self.voxel_override_keep_radius_chunks))
+        near = []
+        for sess in self.sessions.values():
+            if not sess.get("in_world") or int(sess.get("world_id") or 0) != int(world_id):
+                continue
+            pos = sess.get("position") or {}
+            try:
+                near.append((math.floor(float(pos.get("x") or 0.0) / CHUNK_SIZE), math.floor(float(pos.get("z") or 0.0) / CHUNK_SIZE)))
+            except Exception:
+                continue
+        for _ in range(len(bucket)):
+            if len(bucket) <= limit:
+                break
+            key = next(iter(bucket))
+            dkey = (int(world_id), key[0], key[1])
+            if key == keep or dkey in self.voxel_dirty_chunks or dkey in self.voxel_inflight_chunks or any(abs(key[0] - pcx) <= radius and abs(key[1] - pcz) <= radius for pcx, pcz in near):
+                bucket.move_to_end(key)
+                continue
+            bucket.pop(key, None)
+
+    def _voxel_chunk_index(self, x: int, y: int, z: int):
+        ix = int(x)
+        iz = int(z)
+        cx = ix // CHUNK_SIZE
+        cz = iz // CHUNK_SIZE
+        return cx, cz, (ix - (cx * CHUNK_SIZE)) + ((iz - (cz * CHUNK_SIZE)) * CHUNK_SIZE) + (int(y) * VOXEL_LAYER_SIZE)
 
     def _seed_hash(self, seed: str) -> int:
-        h = 2166136261
-        for ch in str(seed or "default-seed"):
-            h ^= ord(ch)
-            h = (h * 16777619) & 0xFFFFFFFF
-        return h & 0xFFFFFFFF
+        return seed_hash(seed)
 
     def _random_from_int2d(self, x: int, z: int, seed_hash: int) -> float:
-        n = ((x * 374761393) ^ (z * 668265263) ^ seed_hash) & 0xFFFFFFFF
-        n = (n ^ (n >> 13)) & 0xFFFFFFFF
-        n = (n * 1274126177) & 0xFFFFFFFF
-        return float(n & 0x7FFFFFFF) / float(0x7FFFFFFF)
+        return random_from_int2d(x, z, seed_hash)
 
     def _smoothstep(self, t: float) -> float:
         return t * t * (3.0 - (2.0 * t))
@@ -925,36 +1246,23 @@ class SimpleWsServer:
         v = self._lerp(iy0, iy1, sz)
         return (v * 2.0) - 1.0
 
-    def _should_carve_cave_at(self, world_seed: str, terrain_config: dict, biome: str, x: int, y: int, z: int, top_y: int, cave_seed_hash: int | None = None) -> bool:
-        if int(terrain_config.get("cave_enabled") if terrain_config.get("cave_enabled") is not None else 1) != 1:
+    def _should_carve_cave_at(self, ctx: TerrainContext, biome: str, x: int, y: int, z: int, top_y: int) -> bool:
+        if not ctx.cave_enabled:
             return False
         iy = int(y)
         top = int(top_y)
-        min_y = max(1, min(64, int(terrain_config.get("cave_min_y") or 8)))
-        if iy < min_y:
+        if iy < ctx.cave_min_y:
             return False
-        surface_buffer = max(2, min(12, int(terrain_config.get("cave_surface_buffer") or 4)))
+        surface_buffer = ctx.cave_surface_buffer
         if iy >= (top - surface_buffer):
             return False
-        safe_r = max(0, min(64, int(terrain_config.get("cave_spawn_safe_radius") or 24)))
+        safe_r = ctx.cave_spawn_safe_radius
         if safe_r > 0:
             if ((int(x) * int(x)) + (int(z) * int(z))) <= (safe_r * safe_r):
                 return False
 
-        scale = max(0.010, min(0.120, float(terrain_config.get("cave_noise_scale") or 0.045)))
-        octaves = max(1, min(4, int(terrain_config.get("cave_noise_octaves") or 3)))
-        threshold = max(0.45, min(0.90, float(terrain_config.get("cave_density_threshold") or 0.62)))
-        b = (biome or "").strip().lower()
-        biome_adjust = {
-            "fire": -0.03,
-            "stone": -0.02,
-            "earth": 0.00,
-            "grass": +0.02,
-            "wind": +0.03,
-            "bridge": +0.04,
-        }.get(b, 0.0)
-        threshold = max(0.40, min(0.95, threshold + biome_adjust))
-
+        scale = ctx.cave_noise_scale
+        threshold = ctx.cave_threshold_for((biome or "").strip().lower())
         depth = max(0, top - iy)
         if depth < (surface_buffer + 6):
             threshold += 0.06
@@ -962,12 +1270,12 @@ class SimpleWsServer:
             threshold -= 0.03
         threshold = max(0.40, min(0.95, threshold))
 
-        seed_h = int(cave_seed_hash) if cave_seed_hash is not None else self._seed_hash(f"{world_seed}:caves:v1")
+        seed_h = ctx.cave_seed_hash
         noise = 0.0
         weight = 0.0
         freq = 1.0
         amp = 1.0
-        for _ in range(octaves):
+        for _ in range(ctx.cave_noise_octaves):
             n = self._value_noise_3d(float(x) * scale * freq, float(iy) * scale * freq, float(z) * scale * freq, seed_h)
             noise += n * amp
             weight += amp
@@ -976,151 +1284,84 @@ class SimpleWsServer:
         normalized = (noise / weight) if weight > 0 else 0.0
         n01 = (normalized * 0.5) + 0.5
         carve_noise = float(n01) > float(threshold)
-        carve_worm = self._should_carve_worm_at(world_seed, terrain_config, int(x), int(iy), int(z), int(top))
+        carve_worm = self._should_carve_worm_at(ctx, int(x), int(iy), int(z), int(top))
         return bool(carve_noise or carve_worm)
 
     def _dist2_point_segment_3d(self, px: float, py: float, pz: float, ax: float, ay: float, az: float, bx: float, by: float, bz: float) -> float:
-        abx = bx - ax
-        aby = by - ay
-        abz = bz - az
-        apx = px - ax
-        apy = py - ay
-        apz = pz - az
-        ab2 = (abx * abx) + (aby * aby) + (abz * abz)
-        if ab2 <= 1e-9:
-            return (apx * apx) + (apy * apy) + (apz * apz)
-        t = ((apx * abx) + (apy * aby) + (apz * abz)) / ab2
-        t = max(0.0, min(1.0, t))
-        qx = ax + (abx * t)
-        qy = ay + (aby * t)
-        qz = az + (abz * t)
-        dx = px - qx
-        dy = py - qy
-        dz = pz - qz
-        return (dx * dx) + (dy * dy) + (dz * dz)
-
-    def _should_carve_worm_at(self, world_seed: str, terrain_config: dict, x: int, y: int, z: int, top_y: int) -> bool:
-        if int(terrain_config.get("worm_enabled") if terrain_config.get("worm_enabled") is not None else 1) != 1:
+        return dist2_point_segment_3d(px, py, pz, ax, ay, az, bx, by, bz)
+
+    def _worm_index(self, world_seed: str, params: tuple) -> dict:
+        # Worms por region de 64 voxels + indice por chunk de los worms que lo
+        # tocan. Solo dependen de la semilla y de los parametros de worms.
+        seed = str(world_seed or "default-seed")
+        index = self.worm_index_by_seed.get(seed)
+        if index is None or index["params"] != params:
+            index = {"params": params, "regions": {}, "chunks": OrderedDict()}
+            self.worm_index_by_seed[seed] = index
+        return index
+
+    def _chunk_worm_tunnels(self, world_seed: str, params: tuple, chunk_x: int, chunk_z: int) -> list[tuple]:
+        index = self._worm_index(world_seed, params)
+        chunks = index["chunks"]
+        key = (int(chunk_x), int(chunk_z))
+        worms = chunks.get(key)
+        if worms is not None:
+            chunks.move_to_end(key)
+            return worms
+        regions = index["regions"]
+
+        def region_lookup(rx: int, rz: int) -> list[tuple]:
+            rkey = (rx, rz)
+            found = regions.get(rkey)
+            if found is None:
+                found = region_worm_tunnels(world_seed, params, rx, rz)
+                regions[rkey] = found
+            return found
+
+        worms = chunk_worm_tunnels(world_seed, params, key[0], key[1], region_lookup=region_lookup)
+        chunks[key] = worms
+        while len(chunks) > max(1, int(self.worm_index_max_chunks)):
+            chunks.popitem(last=False)
+        # Las regiones son baratas (worm_count tuplas); se recortan junto al indice.
+        if len(regions) > (4 * max(1, int(self.worm_index_max_chunks))):
+            regions.clear()
+        return worms
+
+    def _should_carve_worm_at(self, ctx: TerrainContext, x: int, y: int, z: int, top_y: int) -> bool:
+        params = ctx.worm
+        if params is None:
             return False
-        worm_count = max(0, min(8, int(terrain_config.get("worm_count") or 3)))
-        if worm_count <= 0:
-            return False
-        min_len = max(12.0, min(160.0, float(terrain_config.get("worm_length_min") or 48.0)))
-        max_len = max(min_len, min(220.0, float(terrain_config.get("worm_length_max") or 120.0)))
-        min_rad = max(0.8, min(6.0, float(terrain_config.get("worm_radius_min") or 2.2)))
-        max_rad = max(min_rad, min(9.0, float(terrain_config.get("worm_radius_max") or 4.8)))
-        region = 64
-        rx = math.floor(int(x) / region)
-        rz = math.floor(int(z) / region)
-        cave_min_y = max(1, min(64, int(terrain_config.get("cave_min_y") or 8)))
-        # Banda vertical razonable para iniciar worms (subterraneo, no profundo extremo).
-        band_top = max(cave_min_y + 6, int(top_y) - 8)
-        band_bot = max(cave_min_y + 2, int(top_y) - 44)
-        if band_top <= band_bot:
-            band_top = band_bot + 2
-
-        def rnd(seed_local: int, a: int, b: int) -> float:
-            return self._random_from_int2d(a, b, seed_local)
-
-        px = float(x)
-        py = float(y)
-        pz = float(z)
-        for rzz in range(rz - 1, rz + 2):
-            for rxx in range(rx - 1, rx + 2):
-                region_seed = self._seed_hash(f"{world_seed}:worms:v1:{rxx}:{rzz}")
-                base_x = rxx * region
-                base_z = rzz * region
-                for i in range(worm_count):
-                    sx = base_x + (rnd(region_seed, (rxx * 131) + (i * 17) + 11, (rzz * 193) - (i * 29) - 7) * region)
-                    sz = base_z + (rnd(region_seed, (rxx * 197) + (i * 23) + 5, (rzz * 149) - (i * 31) - 13) * region)
-                    sy = band_bot + (rnd(region_seed, (rxx * 167) + (i * 19) + 3, (rzz * 173) - (i * 37) - 9) * (band_top - band_bot))
-                    theta = rnd(region_seed, (rxx * 181) + (i * 41) + 1, (rzz * 211) - (i * 43) - 1) * (math.pi * 2.0)
-                    length = min_len + (rnd(region_seed, (rxx * 223) + (i * 47) + 2, (rzz * 227) - (i * 53) - 2) * (max_len - min_len))
-                    radius = min_rad + (rnd(region_seed, (rxx * 229) + (i * 59) + 4, (rzz * 233) - (i * 61) - 4) * (max_rad - min_rad))
-                    dy_slope = (rnd(region_seed, (rxx * 239) + (i * 67) + 6, (rzz * 241) - (i * 71) - 6) - 0.5) * (length * 0.18)
-                    curve_lat = (rnd(region_seed, (rxx * 251) + (i * 73) + 8, (rzz * 257) - (i * 79) - 8) - 0.5) * (length * 0.45)
-                    curve_y = (rnd(region_seed, (rxx * 263) + (i * 83) + 10, (rzz * 269) - (i * 89) - 10) - 0.5) * (length * 0.22)
-                    dx = math.cos(theta)
-                    dz = math.sin(theta)
-                    px_perp = -dz
-                    pz_perp = dx
-                    ex = sx + (dx * length)
-                    ey = sy + dy_slope
-                    ez = sz + (dz * length)
-                    mx = sx + (dx * (length * 0.5)) + (px_perp * curve_lat)
-                    my = sy + (dy_slope * 0.5) + curve_y
-                    mz = sz + (dz * (length * 0.5)) + (pz_perp * curve_lat)
-                    rad2 = radius * radius
-                    min_x = min(sx, mx, ex) - radius
-                    max_x = max(sx, mx, ex) + radius
-                    min_y = min(sy, my, ey) - radius
-                    max_y = max(sy, my, ey) + radius
-                    min_z = min(sz, mz, ez) - radius
-                    max_z = max(sz, mz, ez) + radius
-                    if px < min_x or px > max_x or py < min_y or py > max_y or pz < min_z or pz > max_z:
-                        continue
-                    d2a = self._dist2_point_segment_3d(px, py, pz, sx, sy, sz, mx, my, mz)
-                    if d2a <= rad2:
-                        return True
-                    d2b = self._dist2_point_segment_3d(px, py, pz, mx, my, mz, ex, ey, ez)
-                    if d2b <= rad2:
-                        return True
-        return False
-
-    def _sample_fixed_column_height(self, world_seed: str, terrain_config: dict, terrain_cells: dict, wx: int, wz: int):
-        layout = (terrain_config.get("biome_layout") or "").strip().lower()
-        if layout == "quadrants":
-            base_height = float(terrain_config.get("surface_height") or terrain_config.get("base_height") or 64.0)
-            amp = max(0.0, float(terrain_config.get("mountain_amplitude") or terrain_config.get("fixed_noise_amplitude") or 20.0))
-            scale = max(0.001, float(terrain_config.get("mountain_noise_scale") or terrain_config.get("fixed_noise_scale") or 0.02))
-            octaves = max(1, min(4, int(terrain_config.get("fixed_noise_octaves") or 2)))
-            quadrants = terrain_config.get("quadrant_biomes") if isinstance(terrain_config.get("quadrant_biomes"), dict) else {}
-            qkey = "xp_zp" if (wx >= 0 and wz >= 0) else ("xn_zp" if (wx < 0 and wz >= 0) else ("xn_zn" if (wx < 0 and wz < 0) else "xp_zn"))
-            biome = (quadrants.get(qkey) or "").strip().lower()
-            if not biome:
-                if wx >= 0 and wz >= 0:
-                    biome = "fire"
-                elif wx < 0 and wz >= 0:
-                    biome = "grass"
-                elif wx < 0 and wz < 0:
-                    biome = "earth"
-                else:
-                    biome = "wind"
+        ix = int(x)
+        iz = int(z)
+        worms = self._chunk_worm_tunnels(ctx.world_seed, params, ix // CHUNK_SIZE, iz // CHUNK_SIZE)
+        return worm_tunnel_hit(worms, params[5], ix, int(y), iz, int(top_y))
+
+    def _sample_fixed_column_height(self, ctx: TerrainContext, wx: int, wz: int):
+        if ctx.quadrants_layout:
+            biome = quadrant_biome(ctx.quadrant_biomes, wx, wz)
             rough_mul = 1.0
         else:
-            if not isinstance(terrain_cells, dict) or not terrain_cells:
+            if not ctx.terrain_cells:
                 return None, "void"
-            biome = (terrain_cells.get(f"{int(wx)},{int(wz)}") or "").strip().lower()
+            biome = (ctx.terrain_cells.get(f"{int(wx)},{int(wz)}") or "").strip().lower()
             if not biome:
                 return None, "void"
-            base_height = float(terrain_config.get("hub_height") or terrain_config.get("base_height") or 58.0)
-            amp = max(0.0, float(terrain_config.get("fixed_noise_amplitude") or 2.2))
-            scale = max(0.001, float(terrain_config.get("fixed_noise_scale") or 0.06))
-            hub_rough = max(0.0, min(1.0, float(terrain_config.get("fixed_hub_roughness") or 0.35)))
-            bridge_rough = max(0.0, min(1.0, float(terrain_config.get("fixed_bridge_roughness") or 0.18)))
-            rough_mul = 1.0
-            if biome == "stone":
-                rough_mul = hub_rough
-            elif biome == "bridge":
-                rough_mul = bridge_rough
+            rough_mul = ctx.biome_roughness.get(biome, 1.0)
 
-        octaves = max(1, min(4, int(terrain_config.get("fixed_noise_octaves") or 2)))
+        scale = ctx.noise_scale
         noise = 0.0
         weight = 0.0
         freq = 1.0
         amp_mul = 1.0
-        seed_hash = self._seed_hash(world_seed)
-        for _ in range(octaves):
-            n = self._value_noise_2d(float(wx) * scale * freq, float(wz) * scale * freq, seed_hash)
+        for _ in range(ctx.noise_octaves):
+            n = self._value_noise_2d(float(wx) * scale * freq, float(wz) * scale * freq, ctx.seed_hash)
             noise += n * amp_mul
             weight += amp_mul
             freq *= 2.07
             amp_mul *= 0.5
         normalized = (noise / weight) if weight > 0 else 0.0
-        biome_y = (0.9 if biome == "fire" else 0.0) + (0.55 if biome == "wind" else 0.0) - (0.45 if biome == "earth" else 0.0)
-        world_h = max(8, int(terrain_config.get("voxel_world_height") or self.voxel_world_height or 128))
-        final_h = base_height + biome_y + (normalized * amp * rough_mul)
-        final_h = max(0.0, min(float(world_h - 1), final_h))
+        final_h = ctx.base_height + BIOME_HEIGHT_OFFSET.get(biome, 0.0) + (normalized * ctx.noise_amplitude * rough_mul)
+        final_h = max(0.0, min(float(ctx.column_height_cap - 1), final_h))
         return int(round(final_h)), biome
 
     def _terrain_layout_uses_sparse_cells(self, terrain_config: dict) -> bool:
@@ -1149,194 +1390,53 @@ class SimpleWsServer:
             }
         return out
 
-    def _pick_weighted_block(self, world_seed: str, x: int, z: int, salt: str, entries: list[tuple[int, float]], fallback_block_id: int = 1) -> int:
-        valid: list[tuple[int, float]] = []
-        total_w = 0.0
-        for block_id, weight in entries or []:
-            try:
-                bid = max(1, int(block_id))
-                w = float(weight)
-            except Exception:
-                continue
-            if w <= 0:
-                continue
-            valid.append((bid, w))
-            total_w += w
-        if total_w <= 0.0 or not valid:
-            return max(1, int(fallback_block_id or 1))
-        seed_h = self._seed_hash(f"{world_seed}:{salt}")
-        jitter = self._seed_hash(salt) & 0xFFFF
-        r = self._random_from_int2d(int(x) + jitter, int(z) - jitter, seed_h)
-        t = max(0.0, min(0.999999, float(r))) * total_w
-        acc = 0.0
-        for bid, w in valid:
-            acc += w
-            if t <= acc:
-                return int(bid)
-        return int(valid[-1][0])
-
-    def _default_surface_block_id(self, world_seed: str, biome: str, x: int, z: int, slope_hint: float) -> int:
-        b = (biome or "").strip().lower()
-        slope = max(0.0, float(slope_hint or 0.0))
-        # slope_bin: 0 llano, 1 medio, 2 escarpado
-        slope_bin = 0 if slope < 1.0 else (1 if slope < 2.5 else 2)
-        by_biome: dict[str, list[tuple[int, float]]] = {
-            "grass": [(2, 3.0), (1, 2.2), (3, 1.6), (16, 1.0), (17, 0.8), (19, 0.6), (20, 0.35)],
-            "earth": [(16, 2.8), (18, 2.0), (17, 1.8), (3, 1.2), (1, 0.8), (19, 0.7), (20, 0.35)],
-            "stone": [(5, 2.6), (6, 2.2), (8, 1.5), (7, 1.2), (3, 0.8), (19, 0.45), (20, 0.3)],
-            "fire": [(4, 2.5), (3, 1.9), (8, 1.8), (6, 1.3), (14, 0.9), (19, 0.5), (20, 0.4)],
-            "wind": [(9, 2.1), (10, 1.8), (11, 1.5), (12, 1.2), (1, 0.7), (19, 0.55), (20, 0.35)],
-            "bridge": [(13, 2.5), (14, 2.2), (15, 1.7), (10, 1.0), (11, 0.8), (19, 0.45), (20, 0.35)],
-        }
-        base = by_biome.get(b) or by_biome["grass"]
-        adjusted: list[tuple[int, float]] = []
-        for bid, w in base:
-            ww = float(w)
-            # En pendientes altas, favorecer roca/estructura y transicion.
-            if slope_bin == 1:
-                if bid in {5, 6, 7, 8, 11, 12, 13, 14, 15}:
-                    ww *= 1.35
-                if bid in {2, 16, 18}:
-                    ww *= 0.78
-                if bid == 19:
-                    ww *= 1.20
-            elif slope_bin == 2:
-                if bid in {5, 6, 7, 8, 11, 12, 13, 14, 15}:
-                    ww *= 1.8
-                if bid in {1, 2, 16, 17, 18}:
-                    ww *= 0.5
-                if bid == 19:
-                    ww *= 1.45
-            adjusted.append((bid, ww))
-        return self._pick_weighted_block(
-            world_seed,
-            int(x),
-            int(z),
-            f"surface:{b}:s{slope_bin}",
-            adjusted,
-            fallback_block_id=2,
-        )
-
-    def _default_subsoil_block_id(self, world_seed: str, biome: str, x: int, y: int, z: int) -> int:
-        b = (biome or "").strip().lower()
-        by_biome: dict[str, list[tuple[int, float]]] = {
-            "grass": [(16, 2.6), (17, 1.8), (18, 1.6), (3, 1.1), (19, 0.5)],
-            "earth": [(16, 2.7), (18, 2.1), (17, 1.6), (3, 1.0), (19, 0.5)],
-            "stone": [(6, 2.2), (5, 1.7), (7, 1.5), (8, 1.2), (19, 0.4)],
-            "fire": [(6, 2.0), (8, 1.9), (4, 1.3), (3, 1.2), (19, 0.55)],
-            "wind": [(11, 1.8), (12, 1.7), (9, 1.4), (10, 1.2), (19, 0.5)],
-            "bridge": [(13, 2.1), (14, 1.9), (15, 1.4), (11, 1.0), (19, 0.5)],
-        }
-        base = by_biome.get(b) or by_biome["grass"]
-        return self._pick_weighted_block(
-            world_seed,
-            int(x) + (int(y) * 11),
-            int(z) - (int(y) * 7),
-            f"subsoil:{b}",
-            base,
-            fallback_block_id=16,
-        )
-
-    def _default_deep_block_id(self, world_seed: str, biome: str, x: int, y: int, z: int) -> int:
-        b = (biome or "").strip().lower()
-        by_biome: dict[str, list[tuple[int, float]]] = {
-            "grass": [(6, 2.8), (7, 2.1), (5, 1.8), (8, 1.2), (17, 0.6), (20, 0.25)],
-            "earth": [(6, 2.7), (7, 2.2), (5, 1.7), (8, 1.3), (18, 0.55), (20, 0.25)],
-            "stone": [(7, 2.9), (6, 2.3), (5, 1.7), (8, 1.3), (12, 0.45), (20, 0.25)],
-            "fire": [(8, 2.4), (6, 2.1), (7, 1.8), (4, 1.2), (14, 0.6), (20, 0.35)],
-            "wind": [(12, 2.1), (11, 2.0), (6, 1.5), (7, 1.2), (9, 0.8), (20, 0.25)],
-            "bridge": [(14, 2.2), (13, 2.0), (15, 1.5), (11, 1.0), (7, 0.8), (20, 0.25)],
-        }
-        base = by_biome.get(b) or by_biome["grass"]
-        return self._pick_weighted_block(
-            world_seed,
-            int(x) + (int(y) * 17),
-            int(z) - (int(y) * 13),
-            f"deep:{b}",
-            base,
-            fallback_block_id=6,
-        )
-
-    def _maybe_promote_emissive_block(self, world_seed: str, terrain_config: dict, block_id: int, x: int, y: int, z: int, top_y: int) -> int:
+    def _world_block_tables(self, ctx: TerrainContext) -> TerrainBlockTables:
+        # Tablas de seleccion de bloques compiladas una vez por mundo; solo se
+        # rehacen si cambia la semilla o el mapa de bloques de superficie.
+        top_blocks = self._load_world_biome_top_blocks(ctx.world_id)
+        tables = self.world_block_tables_by_world.get(ctx.world_id)
+        if tables is not None and tables.matches(ctx.world_seed, top_blocks):
+            return tables
+        tables = TerrainBlockTables(ctx.world_seed, top_blocks)
+        self.world_block_tables_by_world[ctx.world_id] = tables
+        return tables
+
+    def _maybe_promote_emissive_block(self, ctx: TerrainContext, block_id: int, x: int, y: int, z: int, top_y: int) -> int:
         bid = max(0, int(block_id or 0))
         if bid <= 0:
             return 0
-        if int(terrain_config.get("cave_emissive_enabled") if terrain_config.get("cave_emissive_enabled") is not None else 1) != 1:
+        if not ctx.emissive_enabled:
             return bid
         iy = int(y)
         top = int(top_y)
-        surface_buffer = max(2, min(12, int(terrain_config.get("cave_surface_buffer") or 4)))
-        if iy >= (top - (surface_buffer + 2)):
+        if iy >= (top - (ctx.cave_surface_buffer + 2)):
             return bid
-        density = max(0.0, min(0.08, float(terrain_config.get("cave_emissive_density") or 0.018)))
+        density = ctx.emissive_density
         if density <= 0.0:
             return bid
         depth = max(0, top - iy)
         depth_mul = 1.0 + min(0.9, max(0.0, (depth - 8) * 0.03))
         chance = max(0.0, min(0.25, density * depth_mul))
-        seed_h = self._seed_hash(f"{world_seed}:cave-emissive:v1")
-        r = self._random_from_int3d(int(x), int(y), int(z), seed_h)
+        r = self._random_from_int3d(int(x), int(y), int(z), ctx.emissive_seed_hash)
         if r < chance:
             return 20
         return bid
 
-    def _column_slope_hint(self, world_seed: str, terrain_config: dict, terrain_cells: dict, x: int, z: int, top_y: int) -> float:
-        # Coste constante (4 muestras) solo para superficie.
+    def _column_slope_hint(self, ctx: TerrainContext, x: int, z: int, top_y: int) -> float:
+        # Coste constante (4 lecturas del heightmap) solo para superficie.
+        # Las columnas vecinas vacias no cuentan.
         y_px = int(top_y)
-        hpx = self._sample_fixed_column_height(world_seed, terrain_config, terrain_cells, int(x) + 1, int(z))[0]
-        hnx = self._sample_fixed_column_height(world_seed, terrain_config, terrain_cells, int(x) - 1, int(z))[0]
-        hpz = self._sample_fixed_column_height(world_seed, terrain_config, terrain_cells, int(x), int(z) + 1)[0]
-        hnz = self._sample_fixed_column_height(world_seed, terrain_config, terrain_cells, int(x), int(z) - 1)[0]
-        return float(max(abs(int(hpx) - y_px), abs(int(hnx) - y_px), abs(int(hpz) - y_px), abs(int(hnz) - y_px)))
+        slope = 0
+        for nx, nz in ((int(x) + 1, int(z)), (int(x) - 1, int(z)), (int(x), int(z) + 1), (int(x), int(z) - 1)):
+            h = self._column_top_and_biome(ctx, nx, nz)[0]
+            if h is not None:
+                slope = max(slope, abs(int(h) - y_px))
+        return float(slope)
 
     def _load_world_biome_top_blocks(self, world_id: int) -> dict[str, list[int]]:
-        wid = int(world_id or 0)
-        if wid <= 0:
+        if int(world_id or 0) <= 0:
             return {}
-        now = self._now_epoch()
-        cached = self.world_biome_top_blocks_cache.get(wid)
-        if isinstance(cached, dict):
-            age = now - float(cached.get("ts") or 0.0)
-            if age <= 10.0 and isinstance(cached.get("map"), dict):
-                return cached.get("map") or {}
-
-        out: dict[str, list[int]] = {}
-        try:
-            rows = self.db.list_items(limit=5000, active_only=True)
-        except Exception:
-            rows = []
-        valid_biomes = {"grass", "earth", "stone", "fire", "wind", "bridge"}
-        for row in rows or []:
-            item_type = str(row.get("item_type") or "").strip().lower()
-            if item_type not in {"boxel", "voxel", "bloque"}:
-                continue
-            code_raw = str(row.get("item_code") or "").strip()
-            try:
-                block_id = int(code_raw)
-            except Exception:
-                continue
-            if block_id <= 0:
-                continue
-            voxel = self._extract_voxel_cfg_from_item_props(row.get("properties_json"))
-            has_explicit_cell = any(k in voxel for k in ("tile_col", "tile_row", "cell_col", "cell_row", "col", "row", "tile_index", "cell_index"))
-            if not has_explicit_cell:
-                continue
-            biomes = voxel.get("biomes")
-            if not isinstance(biomes, list):
-                legacy = voxel.get("biome")
-                biomes = [legacy] if legacy else []
-            normalized = []
-            for b in biomes:
-                key = str(b or "").strip().lower()
-                if key in valid_biomes and key not in normalized:
-                    normalized.append(key)
-            for b in normalized:
-                arr = out.setdefault(b, [])
-                if block_id not in arr:
-                    arr.append(block_id)
-
-        self.world_biome_top_blocks_cache[wid] = {"ts": now, "map": out}
-        return out
+        return self._voxel_block_catalog()["top_blocks"]
 
     def _extract_voxel_cfg_from_item_props(self, props_raw) -> dict:
         props = props_raw
@@ -1363,17 +1463,38 @@ class SimpleWsServer:
         return voxel
 
     def _list_world_voxel_block_defs(self, world_id: int) -> list[dict]:
-        wid = int(world_id or 0)
-        out: dict[int, dict] = {}
-
-        # Definiciones base oficiales: kit 20 boxels en atlas_base_boxel.png
-        out.update(self._base_boxel_default_defs())
-
+        return self._voxel_block_catalog()["defs"]
+
+    def _voxel_block_catalog(self) -> dict:
+        # Catalogo de bloques voxel (defs para el cliente + bloques de superficie
+        # por bioma) construido con una sola lectura de items_catalog. Se rehace
+        # solo cuando el DatabaseManager modifica items (items_catalog_version) o,
+        # como red de seguridad frente a cambios externos, cada
+        # item_catalog_recheck_sec. La version es un hash del contenido: una
+        # relectura sin cambios conserva los mismos objetos y la misma version.
+        now = self._now_epoch()
+        db_version = getattr(self.db, "items_catalog_version", None)
+        cached = self.voxel_block_catalog
+        if cached is not None and cached["db_version"] == db_version:
+            if (now - cached["ts"]) <= float(self.item_catalog_recheck_sec):
+                return cached
         try:
             rows = self.db.list_items(limit=10000, active_only=True)
-        except Exception:
+        except Exception as exc:
+            if cached is not None:
+                # Sin DB se mantiene el catalogo anterior (evita invalidar
+                # tablas de superficie y chunks base por un fallo puntual).
+                self.log(f"[WARN] No se pudo releer items_catalog: {exc}")
+                cached["ts"] = now
+                return cached
             rows = []
 
+        out: dict[int, dict] = {}
+        top_blocks: dict[str, list[int]] = {}
+        # Definiciones base oficiales: kit 20 boxels en atlas_base_boxel.png
+        out.update(self._base_boxel_default_defs())
+        valid_biomes = {"grass", "earth", "stone", "fire", "wind", "bridge"}
+
         for row in rows or []:
             item_type = str(row.get("item_type") or "").strip().lower()
             if item_type not in {"boxel", "voxel", "bloque"}:
@@ -1407,6 +1528,17 @@ class SimpleWsServer:
                     return int(default)
 
             has_explicit_cell = any(k in voxel for k in ("tile_col", "tile_row", "cell_col", "cell_row", "col", "row", "tile_index", "cell_index"))
+            if has_explicit_cell:
+                biomes = voxel.get("biomes")
+                if not isinstance(biomes, list):
+                    legacy = voxel.get("biome")
+                    biomes = [legacy] if legacy else []
+                for b in biomes:
+                    key = str(b or "").strip().lower()
+                    if key in valid_biomes:
+                        arr = top_blocks.setdefault(key, [])
+                        if block_id not in arr:
+                            arr.append(block_id)
             # Si no hay celda explicita, no sobreescribimos defaults legacy.
             if not has_explicit_cell and int(block_id) in out:
                 continue
@@ -1439,97 +1571,322 @@ class SimpleWsServer:
                 "cell_border_px": int(cell_border_px),
             }
 
-        return [out[k] for k in sorted(out.keys())]
-
-    def _biome_top_block_id(self, world_id: int, world_seed: str, biome: str, x: int, z: int, slope_hint: float = 0.0) -> int:
-        b = (biome or "").strip().lower()
-        custom_map = self._load_world_biome_top_blocks(int(world_id or 0))
-        candidates = custom_map.get(b) if isinstance(custom_map, dict) else None
-        if isinstance(candidates, list) and candidates:
-            if len(candidates) == 1:
-                return int(candidates[0])
-            weighted = [(int(bid), 1.0) for bid in candidates]
-            return self._pick_weighted_block(
-                world_seed,
-                int(x),
-                int(z),
-                f"custom-surface:{b}",
-                weighted,
-                fallback_block_id=int(candidates[0]),
+        defs = [out[k] for k in sorted(out.keys())]
+        raw = json.dumps({"defs": defs, "top_blocks": top_blocks}, sort_keys=True, separators=(",", ":"))
+        version = hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+        if cached is not None and cached["version"] == version:
+            cached["db_version"] = db_version
+            cached["ts"] = now
+            return cached
+        self.voxel_block_catalog = {
+            "version": version,
+            "defs": defs,
+            "top_blocks": top_blocks,
+            "db_version": db_version,
+            "ts": now,
+        }
+        return self.voxel_block_catalog
+
+    def _terrain_context(self, world: dict, terrain_config: dict, terrain_cells: dict) -> TerrainContext:
+        # Un TerrainContext por mundo; se reconstruye si cambia la semilla, la
+        # altura o el contenido de mundos_terrain.
+        wid = int(world.get("id") or 0)
+        world_seed = str(world.get("seed") or "default-seed")
+        height = int(self.voxel_world_height)
+        ctx = self.world_terrain_ctx_by_world.get(wid)
+        if ctx is not None and ctx.matches(world_seed, terrain_config or {}, terrain_cells or {}, height):
+            return ctx
+        ctx = TerrainContext(wid, world_seed, terrain_config or {}, terrain_cells or {}, world_height=height)
+        self.world_terrain_ctx_by_world[wid] = ctx
+        return ctx
+
+    def _world_heightmap_cache(self, ctx: TerrainContext) -> dict:
+        # Cache LRU de heightmaps (altura int16 + bioma uint8) por chunk y mundo.
+        # Se invalida entera cuando se reconstruye el TerrainContext del mundo.
+        cache = self.world_heightmaps_by_world.get(ctx.world_id)
+        if cache is not None and cache["ctx"] is ctx:
+            return cache
+        cache = {
+            "ctx": ctx,
+            "biome_ids": {},
+            "biome_names": [],
+            "tiles": OrderedDict(),
+        }
+        self.world_heightmaps_by_world[ctx.world_id] = cache
+        return cache
+
+    def _heightmap_tile(self, cache: dict, chunk_x: int, chunk_z: int):
+        tiles = cache["tiles"]
+        key = (int(chunk_x), int(chunk_z))
+        tile = tiles.get(key)
+        if tile is not None:
+            tiles.move_to_end(key)
+            return tile
+        ctx = cache["ctx"]
+        if HAS_NUMPY:
+            tile = sample_chunk_heightmap(ctx, key[0], key[1], cache["biome_ids"], cache["biome_names"])
+        else:
+            heights = array("h", [-1]) * VOXEL_LAYER_SIZE
+            biomes = array("B", [VOID_BIOME_ID]) * VOXEL_LAYER_SIZE
+            x0 = key[0] * CHUNK_SIZE
+            z0 = key[1] * CHUNK_SIZE
+            for lz in range(CHUNK_SIZE):
+                for lx in range(CHUNK_SIZE):
+                    top_y, biome = self._sample_fixed_column_height(ctx, x0 + lx, z0 + lz)
+                    if top_y is None:
+                        continue
+                    i = lx + (lz * CHUNK_SIZE)
+                    heights[i] = int(top_y)
+                    biomes[i] = register_biome_id(cache["biome_ids"], cache["biome_names"], biome)
+            tile = (heights, biomes)
+        tiles[key] = tile
+        while len(tiles) > max(9, int(self.heightmap_cache_max_chunks_per_world)):
+            tiles.popitem(last=False)
+        return tile
+
+    def _column_top_and_biome(self, ctx: TerrainContext, x: int, z: int):
+        # Equivalente cacheado de _sample_fixed_column_height.
+        cache = self._world_heightmap_cache(ctx)
+        ix = int(x)
+        iz = int(z)
+        cx = ix // CHUNK_SIZE
+        cz = iz // CHUNK_SIZE
+        heights, biomes = self._heightmap_tile(cache, cx, cz)
+        i = (ix - (cx * CHUNK_SIZE)) + ((iz - (cz * CHUNK_SIZE)) * CHUNK_SIZE)
+        top_y = int(heights[i])
+        if top_y < 0:
+            return None, "void"
+        return top_y, cache["biome_names"][int(biomes[i])]
+
+    def _world_base_chunk_cache(self, ctx: TerrainContext) -> dict:
+        # Cache LRU de chunks base por mundo. Se invalida entera si cambia el
+        # TerrainContext o el mapa de bloques de superficie.
+        top_blocks = self._load_world_biome_top_blocks(ctx.world_id)
+        cache = self.world_base_chunks_by_world.get(ctx.world_id)
+        if cache is not None and cache["ctx"] is ctx:
+            if cache["top_blocks"] is top_blocks or cache["top_blocks"] == top_blocks:
+                cache["top_blocks"] = top_blocks
+                return cache
+        if cache is not None:
+            self._close_base_chunk_cache(cache)
+        cache = {
+            "ctx": ctx,
+            "top_blocks": top_blocks,
+            "chunks": OrderedDict(),
+            "disk": self._base_chunk_disk_cache(ctx, top_blocks),
+        }
+        self.world_base_chunks_by_world[ctx.world_id] = cache
+        return cache
+
+    @staticmethod
+    def _close_base_chunk_cache(cache: dict):
+        # Primero las vistas en memoria: apuntan a los mapeos del disco.
+        cache["chunks"].clear()
+        if cache.get("disk") is not None:
+            cache["disk"].close()
+
+    def _base_chunk_disk_cache(self, ctx: TerrainContext, top_blocks: dict) -> BaseChunkDiskCache | None:
+        # Cache en disco por clave de contenido (ver chunk_store): la rellenan el
+        # servidor al generar y `python -m server.prebake`. Si cambia la semilla o
+        # la configuracion, la clave nueva apunta a otro directorio.
+        if not HAS_NUMPY or not self.base_chunk_disk_dir:
+            return None
+        disk = BaseChunkDiskCache(self.base_chunk_disk_dir, base_chunk_cache_key(ctx, top_blocks), ctx.height)
+        self.log(f"[INFO] Cache de chunks base en disco: world_id={ctx.world_id} clave={disk.key}")
+        return disk
+
+    def terrain_cache_stats(self) -> dict[int, dict]:
+        out = {}
+        for wid, cache in self.world_base_chunks_by_world.items():
+            disk = cache.get("disk")
+            row = {"memory_chunks": len(cache["chunks"])}
+            if disk is not None:
+                row.update(disk.stats())
+            out[int(wid)] = row
+        return out
+
+    def _cached_base_chunk_blocks(self, cache: dict, key: tuple[int, int]):
+        # Chunk base desde memoria o disco; None si hay que generarlo.
+        blocks = cache["chunks"].get(key)
+        if blocks is not None:
+            cache["chunks"].move_to_end(key)
+            return blocks
+        if cache["disk"] is not None:
+            blocks = cache["disk"].get(key[0], key[1])
+            if blocks is not None:
+                self._remember_base_chunk(cache, key, blocks)
+        return blocks
+
+    def _remember_base_chunk(self, cache: dict, key: tuple[int, int], blocks):
+        chunks = cache["chunks"]
+        chunks[key] = blocks
+        while len(chunks) > max(1, int(self.base_chunk_cache_max_per_world)):
+            chunks.popitem(last=False)
+
+    def _base_chunk_blocks(self, ctx: TerrainContext, chunk_x: int, chunk_z: int):
+        cache = self._world_base_chunk_cache(ctx)
+        key = (int(chunk_x), int(chunk_z))
+        blocks = self._cached_base_chunk_blocks(cache, key)
+        if blocks is not None:
+            return blocks
+        disk = cache["disk"]
+        heightmaps = self._world_heightmap_cache(ctx)
+        tiles = [
+            self._heightmap_tile(heightmaps, key[0] + dx, key[1] + dz)
+            for dz in (-1, 0, 1)
+            for dx in (-1, 0, 1)
+        ]
+        window_heights, window_codes = heightmap_window(tiles)
+        worms = self._chunk_worm_tunnels(ctx.world_seed, ctx.worm, key[0], key[1]) if ctx.worm is not None else []
+        blocks = generate_base_chunk(
+            ctx,
+            key[0],
+            key[1],
+            custom_top_blocks=cache["top_blocks"],
+            column_window=(window_heights, window_codes, list(heightmaps["biome_names"])),
+            worm_tunnels=worms,
+            block_tables=self._world_block_tables(ctx),
+        )
+        if disk is not None:
+            try:
+                disk.put(key[0], key[1], blocks)
+            except Exception as exc:
+                self.log(f"[WARN] No se pudo guardar chunk base en disco {key}: {exc}")
+        self._remember_base_chunk(cache, key, blocks)
+        return blocks
+
+    @staticmethod
+    def _generate_base_chunk_job(ctx: TerrainContext, key: tuple[int, int], top_blocks: dict, worms: list, tables, disk):
+        # Hilo chunk_gen_executor: solo datos de entrada, sin caches del servidor.
+        blocks = generate_base_chunk(ctx, key[0], key[1], custom_top_blocks=top_blocks, worm_tunnels=worms, block_tables=tables)
+        exc = None
+        if disk is not None:
+            try:
+                disk.put(key[0], key[1], blocks)
+            except Exception as err:
+                exc = err
+        return blocks, exc
+
+    async def _prepare_base_chunks(self, ctx: TerrainContext, keys: list[tuple[int, int]]):
+        # Genera en chunk_gen_executor los chunks base que no estan en memoria ni
+        # en disco, para que _world_chunk_payload no bloquee el loop con ellos.
+        if not HAS_NUMPY:
+            return
+        cache = self._world_base_chunk_cache(ctx)
+        missing = [key for key in keys if self._cached_base_chunk_blocks(cache, key) is None]
+        if not missing:
+            return
+        if self.chunk_gen_executor is None:
+            self.chunk_gen_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chunk-gen")
+        loop = asyncio.get_running_loop()
+        tables = self._world_block_tables(ctx)
+        for key in missing:
+            worms = self._chunk_worm_tunnels(ctx.world_seed, ctx.worm, key[0], key[1]) if ctx.worm is not None else []
+            blocks, exc = await loop.run_in_executor(
+                self.chunk_gen_executor,
+                self._generate_base_chunk_job,
+                ctx,
+                key,
+                cache["top_blocks"],
+                worms,
+                tables,
+                cache["disk"],
             )
-        return self._default_surface_block_id(world_seed, b, int(x), int(z), float(slope_hint or 0.0))
+            if exc is not None:
+                self.log(f"[WARN] No se pudo guardar chunk base en disco {key}: {exc}")
+            # Si la cache se invalido mientras tanto, el chunk ya no vale.
+            if self.world_base_chunks_by_world.get(ctx.world_id) is cache:
+                self._remember_base_chunk(cache, key, blocks)
 
     def _base_block_id_at(self, world: dict, terrain_config: dict, terrain_cells: dict, x: int, y: int, z: int) -> int:
         iy = int(y)
         if iy < 0 or iy >= int(self.voxel_world_height):
             return 0
-        world_seed = str(world.get("seed") or "default-seed")
-        cave_seed_hash = self._seed_hash(f"{world_seed}:caves:v1")
-        style = (terrain_config.get("world_style") or "fixed_biome_grid").strip().lower()
-        if style == "fixed_biome_grid":
-            top_y, biome = self._sample_fixed_column_height(
-                world_seed,
-                terrain_config or {},
-                terrain_cells or {},
-                int(x),
-                int(z),
-            )
-        else:
-            top_y, biome = self._sample_fixed_column_height(
-                world_seed,
-                terrain_config or {},
-                terrain_cells or {},
-                int(x),
-                int(z),
-            )
+        ctx = self._terrain_context(world, terrain_config, terrain_cells)
+        if not HAS_NUMPY:
+            return self._compute_base_block_id_at(ctx, x, y, z)
+        ix = int(x)
+        iz = int(z)
+        cx = ix // CHUNK_SIZE
+        cz = iz // CHUNK_SIZE
+        blocks = self._base_chunk_blocks(ctx, cx, cz)
+        return int(blocks[(ix - (cx * CHUNK_SIZE)) + ((iz - (cz * CHUNK_SIZE)) * CHUNK_SIZE) + (iy * VOXEL_LAYER_SIZE)])
+
+    def _base_block_ids_at(self, world: dict, terrain_config: dict, terrain_cells: dict, coords) -> dict[tuple[int, int, int], int]:
+        # Version por lotes de _base_block_id_at: agrupa las coordenadas por chunk
+        # y pide cada chunk base una sola vez a la cache.
+        out: dict[tuple[int, int, int], int] = {}
+        by_chunk: dict[tuple[int, int], list[tuple[int, int, int]]] = {}
+        height = int(self.voxel_world_height)
+        for x, y, z in coords:
+            key = (int(x), int(y), int(z))
+            if key in out:
+                continue
+            out[key] = 0
+            if 0 <= key[1] < height:
+                by_chunk.setdefault((key[0] // CHUNK_SIZE, key[2] // CHUNK_SIZE), []).append(key)
+        if not by_chunk:
+            return out
+        ctx = self._terrain_context(world, terrain_config, terrain_cells)
+        for (cx, cz), keys in by_chunk.items():
+            if not HAS_NUMPY:
+                for key in keys:
+                    out[key] = self._compute_base_block_id_at(ctx, *key)
+                continue
+            blocks = self._base_chunk_blocks(ctx, cx, cz)
+            x0 = cx * CHUNK_SIZE
+            z0 = cz * CHUNK_SIZE
+            for key in keys:
+                out[key] = int(blocks[(key[0] - x0) + ((key[2] - z0) * CHUNK_SIZE) + (key[1] * VOXEL_LAYER_SIZE)])
+        return out
+
+    def _compute_base_block_id_at(self, ctx: TerrainContext, x: int, y: int, z: int) -> int:
+        # Ruta de referencia voxel a voxel (sin numpy). generate_base_chunk debe
+        # producir exactamente el mismo resultado.
+        iy = int(y)
+        if iy < 0 or iy >= int(self.voxel_world_height):
+            return 0
+        top_y, biome = self._column_top_and_biome(ctx, int(x), int(z))
         if top_y is None:
             return 0
         if iy > int(top_y):
             return 0
+        tables = self._world_block_tables(ctx)
         block_id = 0
         if iy == int(top_y):
-            slope_hint = self._column_slope_hint(
-                world_seed,
-                terrain_config or {},
-                terrain_cells or {},
-                int(x),
-                int(z),
-                int(top_y),
-            )
-            block_id = self._biome_top_block_id(
-                int(world.get("id") or 0),
-                world_seed,
-                biome,
-                int(x),
-                int(z),
-                slope_hint,
-            )
+            slope_hint = self._column_slope_hint(ctx, int(x), int(z), int(top_y))
+            block_id = tables.surface_block(biome, int(x), int(z), slope_hint)
         elif iy >= (int(top_y) - 3):
-            block_id = self._default_subsoil_block_id(
-                world_seed,
-                biome,
-                int(x),
-                int(y),
-                int(z),
-            )
+            block_id = tables.subsoil_block(biome, int(x), iy, int(z))
         else:
-            block_id = self._default_deep_block_id(
-                world_seed,
-                biome,
-                int(x),
-                int(y),
-                int(z),
-            )
-        block_id = self._maybe_promote_emissive_block(world_seed, terrain_config or {}, block_id, int(x), iy, int(z), int(top_y))
-        if block_id > 0 and self._should_carve_cave_at(world_seed, terrain_config or {}, biome, int(x), iy, int(z), int(top_y), cave_seed_hash):
+            block_id = tables.deep_block(biome, int(x), iy, int(z))
+        block_id = self._maybe_promote_emissive_block(ctx, block_id, int(x), iy, int(z), int(top_y))
+        if block_id > 0 and self._should_carve_cave_at(ctx, biome, int(x), iy, int(z), int(top_y)):
             return 0
         return int(block_id)
 
-    def _effective_block_id_at(self, world_id: int, world: dict, terrain_config: dict, terrain_cells: dict, x: int, y: int, z: int) -> int:
-        key = self._voxel_key(x, y, z)
-        bucket = self._world_voxel_bucket(world_id)
-        if key in bucket:
-            return max(0, int(bucket.get(key) or 0))
+    def _effective_block_id_at(
+        self,
+        world_id: int,
+        world: dict,
+        terrain_config: dict,
+        terrain_cells: dict,
+        x: int,
+        y: int,
+        z: int,
+        base_block_id: int | None = None,
+    ) -> int:
+        # base_block_id: bloque base ya resuelto por el llamador (evita repetir
+        # la consulta al terreno en la ruta de edicion).
+        if 0 <= int(y) < int(self.voxel_world_height):
+            cx, cz, idx = self._voxel_chunk_index(x, y, z)
+            overrides = self._world_voxel_chunk_overrides(world_id, cx, cz)
+            if overrides:
+                bid = overrides.get(idx)
+                if bid is not None:
+                    return bid
+        if base_block_id is not None:
+            return int(base_block_id)
         return self._base_block_id_at(world, terrain_config, terrain_cells, x, y, z)
 
     def _set_voxel_override(
@@ -1543,69 +1900,373 @@ class SimpleWsServer:
         z: int,
         block_id: int,
         persist_chunk: bool = True,
+        base_block_id: int | None = None,
     ):
-        key = self._voxel_key(x, y, z)
-        bucket = self._world_voxel_bucket(world_id)
+        cx, cz, idx = self._voxel_chunk_index(x, y, z)
+        overrides = self._world_voxel_chunk_overrides(world_id, cx, cz, create=True)
         target = max(0, int(block_id or 0))
-        base = self._base_block_id_at(world, terrain_config, terrain_cells, x, y, z)
+        if base_block_id is None:
+            base = self._base_block_id_at(world, terrain_config, terrain_cells, x, y, z)
+        else:
+            base = int(base_block_id)
         changed = False
-        has_prev = key in bucket
+        prev = overrides.get(idx)
         if target == base:
-            if has_prev:
-                bucket.pop(key, None)
-                changed = True
-        else:
-            prev = max(0, int(bucket.get(key) or 0))
-            if (not has_prev) or (prev != target):
-                bucket[key] = target
+            if prev is not None:
+                del overrides[idx]
                 changed = True
+        elif prev != target:
+            overrides[idx] = target
+            changed = True
         if not changed:
             return False, None
-        cx = math.floor(int(x) / 16)
-        cz = math.floor(int(z) / 16)
+        self._invalidate_world_chunk(world_id, cx, cz)
+        self._bump_world_voxel_chunk_version(world_id, cx, cz)
         if persist_chunk:
             try:
-                self._persist_world_voxel_chunk(world_id, cx, cz, bucket)
+                self._persist_world_voxel_chunk(world_id, cx, cz)
             except Exception:
                 pass
         return True, (cx, cz)
 
-    def _persist_world_voxel_chunk(self, world_id: int, chunk_x: int, chunk_z: int, bucket: dict[str, int] | None = None):
+    def _persist_world_voxel_chunk(self, world_id: int, chunk_x: int, chunk_z: int):
+        # Write-behind: solo marca el chunk como sucio. _voxel_persist_loop agrupa
+        # las ediciones de cada chunk durante voxel_persist_window_s y las escribe
+        # en lote desde el hilo de persistencia.
         wid = int(world_id or 0)
         if wid <= 0:
             return
-        b = bucket if isinstance(bucket, dict) else self._world_voxel_bucket(wid)
-        rows = []
-        for key, block_id in b.items():
-            parsed = self._parse_voxel_key(key)
-            if not parsed:
+        key = (int(chunk_x), int(chunk_z))
+        overrides = self._world_voxel_bucket(wid).get(key)
+        if overrides is None:
+            return
+        index = self._ensure_world_voxel_index(wid)
+        if overrides:
+            index.add(key)
+        else:
+            index.discard(key)
+        self.voxel_dirty_chunks.setdefault((wid, key[0], key[1]), self._now_epoch())
+
+    def _take_voxel_flush_batch(self, world_id: int | None = None, force: bool = False) -> list:
+        # Copia (en el hilo del loop) los chunks sucios listos para escribir.
+        now = self._now_epoch()
+        if not force and now < self.voxel_persist_retry_at:
+            return []
+        window = max(0.0, float(self.voxel_persist_window_s))
+        batch = []
+        for dkey, since in list(self.voxel_dirty_chunks.items()):
+            if world_id is not None and dkey[0] != int(world_id):
                 continue
-            x, y, z = parsed
-            cx = math.floor(int(x) / 16)
-            cz = math.floor(int(z) / 16)
-            if cx != int(chunk_x) or cz != int(chunk_z):
+            if not force and (now - since) < window:
                 continue
-            lx = int(x) - (cx * 16)
-            lz = int(z) - (cz * 16)
-            bid = max(0, int(block_id or 0))
-            rows.append({"lx": lx, "y": int(y), "lz": lz, "block_id": bid})
-        self.db.save_world_voxel_chunk(wid, int(chunk_x), int(chunk_z), rows)
+            self.voxel_dirty_chunks.pop(dkey, None)
+            overrides = self._world_voxel_bucket(dkey[0]).get((dkey[1], dkey[2]))
+            if overrides is None:
+                continue
+            batch.append((dkey[0], dkey[1], dkey[2], dict(overrides)))
+            self.voxel_inflight_chunks[dkey] = self.voxel_inflight_chunks.get(dkey, 0) + 1
+        return batch
 
-    def _list_voxel_overrides_payload(self, world_id: int) -> list[dict]:
-        bucket = self._world_voxel_bucket(world_id)
-        out = []
-        for key, block_id in bucket.items():
-            try:
-                xs, ys, zs = str(key).split(",", 2)
-                x = int(xs)
-                y = int(ys)
-                z = int(zs)
-                bid = max(0, int(block_id or 0))
-            except Exception:
+    def _submit_voxel_flush(self, batch: list):
+        if not batch:
+            return None
+        if self.voxel_persist_executor is None:
+            self.voxel_persist_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="voxel-persist")
+        by_store: dict[int, tuple[object, list]] = {}
+        for row in batch:
+            store = self._world_voxel_store(row[0])
+            by_store.setdefault(id(store), (store, []))[1].append(row)
+        fut = self.voxel_persist_executor.submit(self._save_voxel_batches, list(by_store.values()))
+        loop = self.loop
+
+        def _done(f):
+            if loop is not None and loop.is_running():
+                loop.call_soon_threadsafe(self._finish_voxel_flush, batch, f)
+            else:
+                self._finish_voxel_flush(batch, f)
+
+        fut.add_done_callback(_done)
+        return fut
+
+    @staticmethod
+    def _save_voxel_batches(groups: list):
+        # Hilo de persistencia: un lote por almacen (DB y/o ficheros de region).
+        for store, rows in groups:
+            store.save_world_voxel_chunks(rows)
+
+    def _finish_voxel_flush(self, batch: list, fut):
+        exc = fut.exception()
+        for wid, cx, cz, _overrides in batch:
+            dkey = (wid, cx, cz)
+            left = self.voxel_inflight_chunks.get(dkey, 0) - 1
+            if left > 0:
+                self.voxel_inflight_chunks[dkey] = left
+            else:
+                self.voxel_inflight_chunks.pop(dkey, None)
+            if exc is not None:
+                self.voxel_dirty_chunks.setdefault(dkey, 0.0)
+        if exc is None:
+            if self.voxel_persist_failures:
+                self.log(f"[INFO] Persistencia voxel recuperada tras {self.voxel_persist_failures} fallos")
+            self.voxel_persist_failures = 0
+            self.voxel_persist_retry_at = 0.0
+            return
+        self.voxel_persist_failures += 1
+        now = self._now_epoch()
+        delay = min(
+            float(self.voxel_persist_retry_max_s),
+            float(self.voxel_persist_retry_s) * (2 ** min(self.voxel_persist_failures - 1, 16)),
+        )
+        self.voxel_persist_retry_at = now + delay
+        if self.voxel_persist_failures == 1 or (now - self.voxel_persist_warned_at) >= float(self.voxel_persist_warn_interval_s):
+            self.voxel_persist_warned_at = now
+            self.log(
+                f"[WARN] No se pudieron persistir {len(batch)} chunks voxel "
+                f"(fallo {self.voxel_persist_failures}, reintento en {delay:.0f}s): {exc}"
+            )
+
+    def _flush_world_voxel_chunks(self, world_id: int | None = None):
+        return self._submit_voxel_flush(self._take_voxel_flush_batch(world_id, force=True))
+
+    async def _flush_world_tick(self):
+        # Un world_players_snapshot por destinatario con los jugadores movidos
+        # desde el tick anterior.
+        if not self.world_tick_pending:
+            return
+        pending = self.world_tick_pending
+        self.world_tick_pending = {}
+        self.world_tick_seq += 1
+        for client, players in pending.items():
+            if not players or client not in self.sessions:
+                continue
+            await self._send(
+                client,
+                {"id": None, "action": "world_players_snapshot", "payload": {"tick": self.world_tick_seq, "players": list(players.values())}},
+            )
+
+    async def _world_tick_loop(self):
+        loop = asyncio.get_running_loop()
+        next_at = loop.time()
+        while True:
+            hz = self._world_tick_hz()
+            if hz <= 0:
+                # Tick desactivado en caliente: se vacia lo pendiente y se espera.
+                await self._flush_world_tick()
+                await asyncio.sleep(0.25)
+                next_at = loop.time()
+                continue
+            next_at = max(next_at + (1.0 / hz), loop.time())
+            await asyncio.sleep(max(0.0, next_at - loop.time()))
+            await self._flush_world_tick()
+
+    def _log_terrain_cache_stats(self):
+        # Solo los mundos cuya cache cambio desde la ultima linea.
+        stats = self.terrain_cache_stats()
+        for wid, row in sorted(stats.items()):
+            if self.terrain_cache_logged.get(wid) == row:
                 continue
-            out.append({"x": x, "y": y, "z": z, "block_id": bid})
+            looked = int(row.get("hits", 0)) + int(row.get("misses", 0))
+            ratio = (100.0 * int(row.get("hits", 0)) / looked) if looked else 0.0
+            self.log(
+                f"[INFO] Cache de terreno mundo {wid}: {row['memory_chunks']} chunks en memoria, "
+                f"disco {row.get('hits', 0)} aciertos / {row.get('misses', 0)} fallos ({ratio:.0f}%), "
+                f"{row.get('writes', 0)} escritos"
+            )
+        self.terrain_cache_logged = stats
+
+    async def _terrain_cache_stats_loop(self):
+        while True:
+            interval = float(self.terrain_cache_log_interval_s)
+            await asyncio.sleep(interval if interval > 0 else 5.0)
+            if interval > 0:
+                self._log_terrain_cache_stats()
+
+    async def _voxel_persist_loop(self):
+        while True:
+            await asyncio.sleep(max(0.05, float(self.voxel_persist_window_s) * 0.25))
+            self._submit_voxel_flush(self._take_voxel_flush_batch())
+
+    def _list_voxel_overrides_payload(self, world_id: int, chunk_keys=None) -> list[dict]:
+        # Chunks residentes desde memoria; el resto se decodifica desde la DB
+        # solo para el payload, sin ocupar la cache LRU. chunk_keys limita el
+        # resultado a esos chunks (resync delta).
+        wid = int(world_id or 0)
+        if wid <= 0:
+            return []
+        bucket = self._world_voxel_bucket(wid)
+        index = self._ensure_world_voxel_index(wid)
+        if chunk_keys is None:
+            wanted = None
+            chunks = [(key, overrides) for key, overrides in bucket.items() if overrides]
+            missing = [key for key in index if key not in bucket]
+        else:
+            wanted = set(chunk_keys)
+            chunks = [(key, bucket[key]) for key in wanted if bucket.get(key)]
+            missing = [key for key in wanted if key in index and key not in bucket]
+        if missing:
+            rows = self._world_voxel_store(wid).list_world_voxel_chunks_at(wid, missing)
+            for crow in rows:
+                key = (int(crow.get("chunk_x") or 0), int(crow.get("chunk_z") or 0))
+                chunks.append((key, crow.get("overrides") or {}))
+        out = []
+        for (cx, cz), overrides in chunks:
+            x0 = cx * CHUNK_SIZE
+            z0 = cz * CHUNK_SIZE
+            for idx, block_id in overrides.items():
+                out.append({
+                    "x": x0 + (idx & 15),
+                    "y": idx // VOXEL_LAYER_SIZE,
+                    "z": z0 + ((idx // CHUNK_SIZE) & 15),
+                    "block_id": int(block_id),
+                })
+        return out
+
+    def _bump_world_voxel_chunk_version(self, world_id: int, chunk_x: int, chunk_z: int) -> int:
+        versions = self.world_voxel_chunk_versions_by_world.setdefault(int(world_id or 0), {})
+        key = (int(chunk_x), int(chunk_z))
+        version = versions.get(key, 0) + 1
+        versions[key] = version
+        return version
+
+    def _world_voxel_chunk_versions(self, world_id: int) -> dict[tuple[int, int], int]:
+        # Chunks con ediciones persistidas (version 0 si no se han tocado en esta
+        # epoca) + chunks editados en esta epoca, aunque ya no tengan overrides.
+        wid = int(world_id or 0)
+        out = dict.fromkeys(self._ensure_world_voxel_index(wid), 0)
+        out.update(self.world_voxel_chunk_versions_by_world.get(wid) or {})
         return out
 
+    def _voxel_chunk_versions_payload(self, world_id: int, chunk_keys) -> dict[str, int]:
+        versions = self.world_voxel_chunk_versions_by_world.get(int(world_id or 0)) or {}
+        return {f"{cx}:{cz}": int(versions.get((cx, cz), 0)) for cx, cz in chunk_keys}
+
+    def _voxel_sync_payload(self, world_id: int, client_sync) -> tuple[list[dict], dict]:
+        # Resync de overrides en enter_world. Si el cliente trae versiones de la
+        # misma epoca y mundo solo se envian los chunks cuya version cambio
+        # (mode=delta); si no, todos los overrides del mundo (mode=full).
+        wid = int(world_id or 0)
+        versions = self._world_voxel_chunk_versions(wid)
+        known = None
+        if (
+            isinstance(client_sync, dict)
+            and str(client_sync.get("epoch") or "") == self.voxel_sync_epoch
+            and int(client_sync.get("world_id") or 0) == wid
+            and isinstance(client_sync.get("chunks"), dict)
+            and len(client_sync["chunks"]) <= int(self.voxel_sync_max_known_chunks)
+        ):
+            known = {}
+            for raw_key, raw_version in client_sync["chunks"].items():
+                try:
+                    cx_raw, cz_raw = str(raw_key).split(":", 1)
+                    known[(int(cx_raw), int(cz_raw))] = int(raw_version)
+                except Exception:
+                    continue
+        sync = {"epoch": self.voxel_sync_epoch, "world_id": wid}
+        if known is None:
+            sync["mode"] = "full"
+            sync["chunks"] = {f"{cx}:{cz}": int(v) for (cx, cz), v in versions.items()}
+            sync["removed"] = []
+            return self._list_voxel_overrides_payload(wid), sync
+        changed = [key for key, version in versions.items() if known.get(key) != version]
+        sync["mode"] = "delta"
+        sync["chunks"] = {f"{cx}:{cz}": int(versions[(cx, cz)]) for cx, cz in changed}
+        sync["removed"] = [f"{cx}:{cz}" for cx, cz in known if (cx, cz) not in versions]
+        return self._list_voxel_overrides_payload(wid, changed), sync
+
+    def _world_chunk_payload_cache(self, ctx: TerrainContext) -> dict:
+        # Chunks finales (base + overrides) ya codificados, en LRU por mundo.
+        # Se descarta entera cuando se invalida la cache de chunks base.
+        base_cache = self._world_base_chunk_cache(ctx)
+        cache = self.world_chunk_payloads_by_world.get(ctx.world_id)
+        if cache is not None and cache["base"] is base_cache:
+            return cache
+        cache = {"base": base_cache, "chunks": OrderedDict()}
+        self.world_chunk_payloads_by_world[ctx.world_id] = cache
+        return cache
+
+    def _final_chunk_blocks(self, world_id: int, ctx: TerrainContext, chunk_x: int, chunk_z: int) -> array:
+        if HAS_NUMPY:
+            blocks = array("H", self._base_chunk_blocks(ctx, chunk_x, chunk_z).tobytes())
+        else:
+            x0 = int(chunk_x) * CHUNK_SIZE
+            z0 = int(chunk_z) * CHUNK_SIZE
+            blocks = array(
+                "H",
+                (
+                    self._compute_base_block_id_at(ctx, x0 + lx, y, z0 + lz)
+                    for y in range(ctx.height)
+                    for lz in range(CHUNK_SIZE)
+                    for lx in range(CHUNK_SIZE)
+                ),
+            )
+        overrides = self._world_voxel_chunk_overrides(world_id, chunk_x, chunk_z)
+        if overrides:
+            size = len(blocks)
+            for idx, block_id in overrides.items():
+                if idx < size:
+                    blocks[idx] = block_id
+        return blocks
+
+    def _world_chunk_solid_cache(self, ctx: TerrainContext) -> dict:
+        # Mascaras de solidez por chunk y ultimos spawns resueltos (con los
+        # chunks de los que dependen), ambos en LRU por mundo.
+        base_cache = self._world_base_chunk_cache(ctx)
+        cache = self.world_chunk_solids_by_world.get(ctx.world_id)
+        if cache is not None and cache["base"] is base_cache:
+            return cache
+        cache = {"base": base_cache, "chunks": OrderedDict(), "spawns": OrderedDict()}
+        self.world_chunk_solids_by_world[ctx.world_id] = cache
+        return cache
+
+    def _chunk_solid_mask(self, world_id: int, ctx: TerrainContext, chunk_x: int, chunk_z: int):
+        chunks = self._world_chunk_solid_cache(ctx)["chunks"]
+        key = (int(chunk_x), int(chunk_z))
+        mask = chunks.get(key)
+        if mask is not None:
+            chunks.move_to_end(key)
+            return mask
+        mask = chunk_solid_mask(self._final_chunk_blocks(world_id, ctx, key[0], key[1]), ctx.height)
+        chunks[key] = mask
+        while len(chunks) > max(1, int(self.chunk_solid_cache_max_per_world)):
+            chunks.popitem(last=False)
+        return mask
+
+    def _invalidate_world_chunk(self, world_id: int, chunk_x: int, chunk_z: int):
+        wid = int(world_id or 0)
+        key = (int(chunk_x), int(chunk_z))
+        payloads = self.world_chunk_payloads_by_world.get(wid)
+        if payloads is not None:
+            payloads["chunks"].pop(key, None)
+        solids = self.world_chunk_solids_by_world.get(wid)
+        if solids is not None:
+            solids["chunks"].pop(key, None)
+            spawns = solids["spawns"]
+            for skey, (_pos, deps) in list(spawns.items()):
+                if key in deps:
+                    spawns.pop(skey, None)
+
+    def _world_chunk_payload(self, world_id: int, ctx: TerrainContext, chunk_x: int, chunk_z: int) -> dict:
+        # uint16 little-endian (indice x + z*16 + y*256) -> zlib -> base64.
+        cache = self._world_chunk_payload_cache(ctx)
+        chunks = cache["chunks"]
+        key = (int(chunk_x), int(chunk_z))
+        entry = chunks.get(key)
+        if entry is not None:
+            chunks.move_to_end(key)
+            return entry
+        blocks = self._final_chunk_blocks(world_id, ctx, key[0], key[1])
+        if sys.byteorder != "little":
+            blocks.byteswap()
+        entry = {
+            "cx": key[0],
+            "cz": key[1],
+            "data": base64.b64encode(zlib.compress(blocks.tobytes(), 6)).decode("ascii"),
+        }
+        chunks[key] = entry
+        while len(chunks) > max(1, int(self.chunk_payload_cache_max_per_world)):
+            chunks.popitem(last=False)
+        return entry
+
     def _resolve_session_world_and_terrain(self, session: dict):
         world_id = int(session.get("world_id") or 0)
         world_name = (session.get("world_name") or "").strip()
@@ -1631,32 +2292,9 @@ class SimpleWsServer:
             if self._terrain_layout_uses_sparse_cells(terrain_config) and (not terrain_cells):
                 terrain_config, terrain_cells = build_fixed_world_terrain(world)
                 self.db.save_world_terrain(world_id, terrain_config, terrain_cells)
-        if world_id > 0 and world_id not in self.world_voxel_loaded_worlds:
-            bucket = self._world_voxel_bucket(world_id)
-            bucket.clear()
-            try:
-                chunk_rows = self.db.list_world_voxel_chunks(world_id, limit=120000)
-            except Exception:
-                chunk_rows = []
-            if chunk_rows:
-                for crow in chunk_rows:
-                    cx = int(crow.get("chunk_x") or 0)
-                    cz = int(crow.get("chunk_z") or 0)
-                    entries = crow.get("overrides") or []
-                    if not isinstance(entries, list):
-                        continue
-                    for entry in entries:
-                        try:
-                            lx = int(entry.get("lx") or 0)
-                            y = int(entry.get("y") or 0)
-                            lz = int(entry.get("lz") or 0)
-                            bid = max(0, int(entry.get("block_id") or 0))
-                        except Exception:
-                            continue
-                        x = (cx * 16) + lx
-                        z = (cz * 16) + lz
-                        bucket[self._voxel_key(x, y, z)] = bid
-            self.world_voxel_loaded_worlds.add(world_id)
+        if world_id > 0:
+            self._bind_world_voxel_store(world)
+            self._ensure_world_voxel_index(world_id)
         try:
             self.voxel_world_height = max(64, min(256, int(terrain_config.get("voxel_world_height") or self.voxel_world_height)))
         except Exception:
@@ -1672,16 +2310,10 @@ class SimpleWsServer:
         wn = (world_name or "").strip()
         if not wn:
             return
-        alive = False
-        for sess in self.sessions.values():
-            if not sess.get("in_world"):
-                continue
-            if (sess.get("world_name") or "") != wn:
-                continue
-            alive = True
-            break
+        alive = bool(self.world_clients_by_name.get(wn))
         if not alive and wid > 0:
             self.world_loot_by_world.pop(wid, None)
+            self._flush_world_voxel_chunks(wid)
 
     def _make_loot_key(self, world_id: int) -> str:
         return f"loot:{int(world_id)}:{int(self._now_epoch() * 1000)}:{random.randint(1000, 999999)}"
@@ -1775,22 +2407,274 @@ class SimpleWsServer:
         return out
 
     async def _broadcast_world_event(self, world_name: str, action: str, payload: dict, exclude=None):
-        dead = []
-        for client in self.clients:
+        message = {"id": None, "action": action, "payload": payload}
+        encoded = None
+        for client in self._world_clients(world_name):
             if exclude is not None and client == exclude:
                 continue
-            sess = self.sessions.get(client) or {}
-            if not sess.get("in_world"):
+            if encoded is None:
+                encoded, raw_len = self._encode_message(message)
+            await self._send_encoded(client, message, encoded, raw_len)
+
+    def _session_chunk_window(self, sess: dict) -> tuple[int, int, int]:
+        # (chunk x, chunk z, radio Chebyshev) de la ventana de chunks de la sesion.
+        pos = sess.get("position") or {"x": 0.0, "z": 0.0}
+        pcx = math.floor(float(pos.get("x") or 0.0) / CHUNK_SIZE)
+        pcz = math.floor(float(pos.get("z") or 0.0) / CHUNK_SIZE)
+        radius = max(1, int(sess.get("view_distance_chunks") or 3)) + int(self.chunk_window_margin_chunks)
+        return pcx, pcz, radius
+
+    def _session_sees_chunk(self, sess: dict, chunk_x: int, chunk_z: int) -> bool:
+        pcx, pcz, radius = self._session_chunk_window(sess)
+        return abs(int(chunk_x) - pcx) <= radius and abs(int(chunk_z) - pcz) <= radius
+
+    async def _send_voxel_changes(
+        self,
+        client,
+        sess: dict,
+        changes: list[dict],
+        chunk_versions: dict,
+        by,
+        patch: bool = True,
+        reset_chunks: list[tuple[int, int]] | None = None,
+    ):
+        # Solo las versiones de los chunks que recibe este cliente. reset_chunks:
+        # chunks cuyos overrides van completos en changes (el cliente descarta
+        # los que tuviera de esos chunks).
+        reset_keys = [f"{cx}:{cz}" for cx, cz in (reset_chunks or ())]
+        keys = {f"{int(c['x']) // CHUNK_SIZE}:{int(c['z']) // CHUNK_SIZE}" for c in changes}
+        keys.update(reset_keys)
+        versions = {key: v for key, v in (chunk_versions or {}).items() if key in keys}
+        patch_payload = {"changes": changes, "by": by, "chunk_versions": versions}
+        if reset_keys:
+            patch_payload["reset_chunks"] = reset_keys
+        # Clientes con supports_chunk_patch reciben solo world_chunk_patch; el
+        # resto conserva el comportamiento anterior (parche en lotes + un
+        # world_block_changed por cambio).
+        modern = "supports_chunk_patch" in (sess.get("capabilities") or ())
+        if patch or modern:
+            await self._send(
+                client,
+                {"id": None, "action": "world_chunk_patch", "payload": patch_payload},
+            )
+        if modern:
+            return
+        for change in changes:
+            await self._send(
+                client,
+                {"id": None, "action": "world_block_changed", "payload": {"change": change, "by": by, "chunk_versions": versions}},
+            )
+
+    async def _broadcast_voxel_changes(self, world_name: str, changes: list[dict], chunk_versions: dict, by, exclude=None, patch: bool = True):
+        # Interest management: cada sesion recibe solo los cambios de chunks
+        # dentro de su ventana de vision; de los demas solo se apunta la clave
+        # del chunk y al entrar en la ventana se reenvian sus overrides actuales
+        # (_flush_session_voxel_pending).
+        by_chunk: dict[tuple[int, int], list[dict]] = {}
+        for change in changes:
+            key = (int(change["x"]) // CHUNK_SIZE, int(change["z"]) // CHUNK_SIZE)
+            by_chunk.setdefault(key, []).append(change)
+        for client in self._world_clients(world_name):
+            if exclude is not None and client == exclude:
                 continue
-            if sess.get("world_name") != world_name:
+            sess = self.sessions.get(client)
+            if sess is None:
                 continue
-            try:
-                await self._send(client, {"id": None, "action": action, "payload": payload})
-            except Exception:
-                dead.append(client)
-        for client in dead:
-            self.clients.discard(client)
-            self.sessions.pop(client, None)
+            visible: list[dict] = []
+            for key, rows in by_chunk.items():
+                if self._session_sees_chunk(sess, key[0], key[1]):
+                    visible.extend(rows)
+                    continue
+                sess.setdefault("voxel_pending_chunks", set()).add(key)
+            if not visible:
+                continue
+            await self._send_voxel_changes(client, sess, visible, chunk_versions, by, patch=patch)
+
+    async def _flush_session_voxel_pending(self, websocket, session: dict):
+        pending = session.get("voxel_pending_chunks")
+        if not pending:
+            return
+        world_id = int(session.get("world_id") or 0)
+        ready = [key for key in pending if self._session_sees_chunk(session, key[0], key[1])]
+        if not ready:
+            return
+        # Estado actual del chunk, no la lista de ediciones: asi tambien llegan
+        # los bloques que volvieron al terreno base (reset_chunks).
+        changes = self._list_voxel_overrides_payload(world_id, ready)
+        pending.difference_update(ready)
+        chunk_versions = self._voxel_chunk_versions_payload(world_id, ready)
+        await self._send_voxel_changes(websocket, session, changes, chunk_versions, None, reset_chunks=ready)
+
+    def _index_session(self, websocket, session: dict):
+        username = session.get("username")
+        if username:
+            self.ws_by_username[username] = websocket
+
+    def _index_session_world(self, websocket, session: dict, remove: bool = False):
+        # Conexiones por mundo (sesiones con in_world); se rehace al cambiar de mundo.
+        key = session.get("world_name") if session.get("in_world") and not remove else None
+        old = session.get("world_index_key")
+        if old == key:
+            return
+        if old is not None:
+            bucket = self.world_clients_by_name.get(old)
+            if bucket is not None:
+                bucket.discard(websocket)
+                if not bucket:
+                    del self.world_clients_by_name[old]
+        if key:
+            self.world_clients_by_name.setdefault(key, set()).add(websocket)
+            session["world_index_key"] = key
+        else:
+            session.pop("world_index_key", None)
+
+    def _unindex_session(self, websocket, session: dict):
+        self._index_session_world(websocket, session, remove=True)
+        if self.ws_by_username.get(session.get("username")) is websocket:
+            del self.ws_by_username[session.get("username")]
+
+    def _pop_session(self, websocket):
+        session = self.sessions.pop(websocket, None)
+        if session is not None:
+            self._unindex_session(websocket, session)
+            self._aoi_remove(websocket, session)
+        return session
+
+    def _world_clients(self, world_name: str) -> tuple:
+        # Copia: los envios pueden ceder el control y modificar el indice.
+        return tuple(self.world_clients_by_name.get(world_name) or ())
+
+    def _aoi_world(self, world_name: str) -> dict:
+        grid = self.world_aoi_by_world.get(world_name)
+        if grid is None:
+            # cells: celda -> websockets; legacy: sesiones sin supports_player_aoi,
+            # que siguen recibiendo el movimiento de todo el mundo.
+            grid = {"cells": {}, "legacy": set()}
+            self.world_aoi_by_world[world_name] = grid
+        return grid
+
+    def _aoi_cell(self, pos: dict) -> tuple[int, int]:
+        size = max(1.0, float(self.aoi_cell_size))
+        return math.floor(float(pos.get("x") or 0.0) / size), math.floor(float(pos.get("z") or 0.0) / size)
+
+    def _aoi_place(self, websocket, session: dict):
+        world_name = session.get("world_name")
+        key = (world_name, self._aoi_cell(session.get("position") or {}))
+        if session.get("aoi_key") == key:
+            return
+        self._aoi_unplace(websocket, session)
+        grid = self._aoi_world(world_name)
+        grid["cells"].setdefault(key[1], set()).add(websocket)
+        if "supports_player_aoi" not in (session.get("capabilities") or ()):
+            grid["legacy"].add(websocket)
+        session["aoi_key"] = key
+
+    def _aoi_unplace(self, websocket, session: dict):
+        key = session.pop("aoi_key", None)
+        if key is None:
+            return
+        grid = self.world_aoi_by_world.get(key[0])
+        if grid is None:
+            return
+        cell = grid["cells"].get(key[1])
+        if cell is not None:
+            cell.discard(websocket)
+            if not cell:
+                del grid["cells"][key[1]]
+        grid["legacy"].discard(websocket)
+        if not grid["cells"]:
+            del self.world_aoi_by_world[key[0]]
+
+    def _aoi_remove(self, websocket, session: dict):
+        # Salida del mundo o desconexion: fuera de la rejilla y de los AOI ajenos.
+        self._aoi_unplace(websocket, session)
+        self.world_tick_pending.pop(websocket, None)
+        for pending in self.world_tick_pending.values():
+            pending.pop(session.get("user_id"), None)
+        for other in session.pop("aoi_visible", set()):
+            osess = self.sessions.get(other)
+            if osess is not None:
+                osess.get("aoi_visible", set()).discard(websocket)
+
+    def _aoi_refresh(self, websocket, session: dict):
+        # Recoloca la sesion en la rejilla y recalcula su conjunto visible (la
+        # relacion es simetrica). Devuelve (visibles, entran, salen).
+        self._aoi_place(websocket, session)
+        pos = session.get("position") or {}
+        px = float(pos.get("x") or 0.0)
+        pz = float(pos.get("z") or 0.0)
+        radius = max(0.0, float(self.aoi_radius))
+        keep = radius + max(0.0, float(self.aoi_hysteresis))
+        cells = self.world_aoi_by_world[session.get("world_name")]["cells"]
+        gx, gz = session["aoi_key"][1]
+        span = int(math.ceil(keep / max(1.0, float(self.aoi_cell_size))))
+        old = session.get("aoi_visible") or set()
+        visible = set()
+        for dz in range(-span, span + 1):
+            for dx in range(-span, span + 1):
+                for other in cells.get((gx + dx, gz + dz), ()):
+                    if other is websocket:
+                        continue
+                    opos = self.sessions[other].get("position") or {}
+                    d2 = ((float(opos.get("x") or 0.0) - px) ** 2) + ((float(opos.get("z") or 0.0) - pz) ** 2)
+                    if d2 <= radius * radius or (other in old and d2 <= keep * keep):
+                        visible.add(other)
+        entered = visible - old
+        left = old - visible
+        session["aoi_visible"] = visible
+        for other in entered:
+            self.sessions[other].setdefault("aoi_visible", set()).add(websocket)
+        for other in left:
+            osess = self.sessions.get(other)
+            if osess is not None:
+                osess.get("aoi_visible", set()).discard(websocket)
+        return visible, entered, left
+
+    async def _broadcast_player_moved(self, websocket, session: dict, payload: dict, aoi=None, notify_self: bool = True):
+        # world_player_moved solo a las sesiones del AOI con supports_player_aoi
+        # (mas world_player_aoi_enter/leave al cambiar el conjunto) y a todas las
+        # sesiones legacy del mundo. aoi: resultado previo de _aoi_refresh.
+        visible, entered, left = aoi if aoi is not None else self._aoi_refresh(websocket, session)
+        mover_aoi = "supports_player_aoi" in (session.get("capabilities") or ())
+        mover_key = session.get("user_id")
+        tick = self._world_tick_hz() > 0
+        legacy = self.world_aoi_by_world[session.get("world_name")]["legacy"]
+        leave_self = {"id": session.get("user_id"), "username": session.get("username")}
+        frames: dict[str, tuple] = {}
+
+        async def _push(client, action: str, body: dict, shared: bool = False):
+            # shared: mismo cuerpo para todos los destinatarios, se serializa una vez.
+            message = {"id": None, "action": action, "payload": body}
+            if shared:
+                if action not in frames:
+                    frames[action] = (message, *self._encode_message(message))
+                await self._send_encoded(client, *frames[action])
+            else:
+                await self._send(client, message)
+
+        for other in left:
+            osess = self.sessions.get(other)
+            if osess is None:
+                continue
+            # Un snapshot pendiente no debe resucitar el avatar tras el leave.
+            self.world_tick_pending.get(other, {}).pop(mover_key, None)
+            self.world_tick_pending.get(websocket, {}).pop(osess.get("user_id"), None)
+            if other not in legacy:
+                await _push(other, "world_player_aoi_leave", leave_self, shared=True)
+            if mover_aoi:
+                await _push(websocket, "world_player_aoi_leave", {"id": osess.get("user_id"), "username": osess.get("username")})
+        for other in entered:
+            if other not in legacy:
+                await _push(other, "world_player_aoi_enter", payload, shared=True)
+            if mover_aoi and notify_self:
+                await _push(websocket, "world_player_aoi_enter", self._session_world_player_payload(self.sessions[other]))
+        for other in (visible - entered - legacy) | legacy:
+            if other is websocket or other not in self.sessions:
+                continue
+            if tick and "supports_players_snapshot" in (self.sessions[other].get("capabilities") or ()):
+                self.world_tick_pending.setdefault(other, {})[mover_key] = payload
+                continue
+            await _push(other, "world_player_moved", payload, shared=True)
 
     def start(self):
         if self.thread and self.thread.is_alive():
@@ -1807,11 +2691,7 @@ class SimpleWsServer:
             return False
 
         async def _force():
-            target_ws = None
-            for ws, sess in list(self.sessions.items()):
-                if sess.get("username") == username:
-                    target_ws = ws
-                    break
+            target_ws = self.ws_by_username.get(username)
             if not target_ws:
                 return False
             try:
@@ -1840,8 +2720,15 @@ class SimpleWsServer:
             self.log("[INFO] Loop async finalizado.")
 
     async def _main(self):
+        try:
+            await asyncio.to_thread(self._migrate_voxel_storage_all_worlds)
+        except Exception as exc:
+            self.log(f"[WARN] No se pudo revisar el almacen voxel de los mundos: {exc}")
         self.server = await websockets.serve(self._handler, self.host, self.port)
         self.log(f"[INFO] WebSocket activo en ws://{self.host}:{self.port}")
+        persist_task = asyncio.create_task(self._voxel_persist_loop())
+        tick_task = asyncio.create_task(self._world_tick_loop())
+        stats_task = asyncio.create_task(self._terrain_cache_stats_loop())
         await self.stop_event.wait()
         self.log("[INFO] Deteniendo servidor...")
         self.server.close()
@@ -1853,18 +2740,133 @@ class SimpleWsServer:
             except Exception:
                 pass
 
-    async def _send(self, ws, message: dict):
+        persist_task.cancel()
+        tick_task.cancel()
+        stats_task.cancel()
+        self._flush_world_voxel_chunks()
+        self._log_terrain_cache_stats()
+        for cache in self.world_base_chunks_by_world.values():
+            self._close_base_chunk_cache(cache)
+        self.world_base_chunks_by_world.clear()
+        if self.voxel_persist_executor is not None:
+            await asyncio.to_thread(self.voxel_persist_executor.shutdown, True)
+            self.voxel_persist_executor = None
+        if self.chunk_gen_executor is not None:
+            await asyncio.to_thread(self.chunk_gen_executor.shutdown, True)
+            self.chunk_gen_executor = None
+
+    @staticmethod
+    def _encode_message(message: dict) -> tuple[str, int]:
+        # Un solo json.dumps por mensaje; en broadcasts el frame y su tamano en
+        # bytes se comparten entre todos los destinatarios.
         encoded = json.dumps(message, ensure_ascii=False)
-        await ws.send(encoded)
-        self._emit_network_event(
-            "TX",
-            message.get("action"),
-            "server",
-            self._peer_label(ws),
-            message.get("id"),
-            message.get("payload"),
-            len(encoded.encode("utf-8")),
-        )
+        raw_len = len(encoded) if encoded.isascii() else len(encoded.encode("utf-8"))
+        return encoded, raw_len
+
+    def _emit_tx_event(self, ws, message: dict, raw_len: int):
+        if self.network_event_cb:
+            self._emit_network_event(
+                "TX",
+                message.get("action"),
+                "server",
+                self._peer_label(ws),
+                message.get("id"),
+                message.get("payload"),
+                raw_len,
+            )
+
+    def _open_outbound(self, ws):
+        state = {"queue": deque(), "latest": {}, "size": 0, "wake": asyncio.Event(), "over_since": None, "closing": False}
+        self.outbound_by_ws[ws] = state
+        state["task"] = asyncio.create_task(self._outbound_writer(ws, state))
+
+    def _close_outbound(self, ws):
+        state = self.outbound_by_ws.pop(ws, None)
+        if state is not None:
+            state["closing"] = True
+            state["task"].cancel()
+
+    def _enqueue_outbound(self, ws, state: dict, message: dict, encoded: str, raw_len: int):
+        if state["closing"]:
+            return
+        key = None
+        key_field = self.outbound_latest_wins.get(message.get("action"))
+        if key_field is not None:
+            key = (message.get("action"), (message.get("payload") or {}).get(key_field))
+            old = state["latest"].get(key)
+            if old is not None:
+                # La version anterior sigue sin enviarse: se descarta en la cola.
+                old[0] = None
+                state["size"] -= 1
+        entry = [message, encoded, raw_len, key]
+        if key is not None:
+            state["latest"][key] = entry
+        state["queue"].append(entry)
+        state["size"] += 1
+        if state["size"] > int(self.outbound_high_water):
+            now = asyncio.get_running_loop().time()
+            if state["over_since"] is None:
+                state["over_since"] = now
+            if state["size"] >= int(self.outbound_queue_max) or (now - state["over_since"]) >= float(self.outbound_high_water_s):
+                self._drop_slow_client(ws, state)
+                return
+        state["wake"].set()
+
+    def _drop_slow_client(self, ws, state: dict):
+        self.log(f"[WARN] Cliente lento desconectado: {self._peer_label(ws)} ({state['size']} mensajes en cola)")
+        state["closing"] = True
+        state["queue"].clear()
+        state["latest"].clear()
+        state["size"] = 0
+        state["task"].cancel()
+
+        async def _close():
+            try:
+                await ws.close(code=4002, reason="Slow consumer")
+            except Exception:
+                pass
+
+        # _handler limpia la sesion cuando la conexion termina de cerrarse.
+        asyncio.ensure_future(_close())
+
+    async def _outbound_writer(self, ws, state: dict):
+        queue = state["queue"]
+        try:
+            while True:
+                if not queue:
+                    state["wake"].clear()
+                    await state["wake"].wait()
+                    continue
+                entry = queue.popleft()
+                message, encoded, raw_len, key = entry
+                if message is None:
+                    continue
+                state["size"] -= 1
+                if key is not None and state["latest"].get(key) is entry:
+                    del state["latest"][key]
+                if state["size"] <= int(self.outbound_high_water):
+                    state["over_since"] = None
+                await ws.send(encoded)
+                self._emit_tx_event(ws, message, raw_len)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Conexion rota: se deja de encolar y _handler limpia al cerrarse.
+            state["closing"] = True
+            queue.clear()
+            state["latest"].clear()
+            state["size"] = 0
+
+    async def _send_encoded(self, ws, message: dict, encoded: str, raw_len: int):
+        # Nunca lanza: solo encola. Una conexion rota o lenta la cierra el
+        # escritor (o _drop_slow_client) y _handler limpia la sesion al terminar.
+        state = self.outbound_by_ws.get(ws)
+        if state is not None:
+            self._enqueue_outbound(ws, state, message, encoded, raw_len)
+
+    async def _send(self, ws, message: dict):
+        encoded, raw_len = self._encode_message(message)
+        await self._send_encoded(ws, message, encoded, raw_len)
 
     async def _send_response(self, ws, req_id, action: str, payload: dict):
         await self._send(ws, {"id": req_id, "action": action, "payload": payload})
@@ -1873,20 +2875,30 @@ class SimpleWsServer:
         await self._send_response(ws, req_id, action, {"ok": False, "error": error_msg})
 
     async def _broadcast_event(self, action: str, payload: dict, exclude=None):
-        dead = []
-        for client in self.clients:
+        message = {"id": None, "action": action, "payload": payload}
+        encoded, raw_len = self._encode_message(message)
+        for client in tuple(self.clients):
             if exclude is not None and client == exclude:
                 continue
-            try:
-                await self._send(client, {"id": None, "action": action, "payload": payload})
-            except Exception:
-                dead.append(client)
-        for client in dead:
-            self.clients.discard(client)
-            self.sessions.pop(client, None)
+            await self._send_encoded(client, message, encoded, raw_len)
+
+    async def _leave_world(self, websocket, session: dict):
+        # Logout o desconexion de una sesion ya retirada de los indices: aviso a
+        # los demas y, si era el ultimo jugador, descarga del mundo (loot y flush
+        # forzado de sus chunks voxel).
+        if not (session.get("in_world") and session.get("world_name")):
+            return
+        await self._broadcast_world_event(
+            session["world_name"],
+            "world_player_left",
+            {"id": session.get("user_id"), "username": session.get("username")},
+            exclude=websocket,
+        )
+        self._cleanup_world_loot_world(session.get("world_id"), session.get("world_name"))
 
     async def _handler(self, websocket):
         self.clients.add(websocket)
+        self._open_outbound(websocket)
         peer = websocket.remote_address
         self.log(f"[CONN] Cliente conectado: {peer}")
         try:
@@ -1895,17 +2907,11 @@ class SimpleWsServer:
         except websockets.ConnectionClosed:
             pass
         finally:
-            session = self.sessions.pop(websocket, None)
+            self._close_outbound(websocket)
+            session = self._pop_session(websocket)
             self.clients.discard(websocket)
             if session:
-                if session.get("in_world") and session.get("world_name"):
-                    await self._broadcast_world_event(
-                        session["world_name"],
-                        "world_player_left",
-                        {"id": session.get("user_id"), "username": session.get("username")},
-                        exclude=websocket,
-                    )
-                    self._cleanup_world_loot_world(session.get("world_id"), session.get("world_name"))
+                await self._leave_world(websocket, session)
                 self._persist_session_position(session, force=True)
                 try:
                     self.db.set_online_status(session["user_id"], False)
@@ -2117,6 +3123,7 @@ class SimpleWsServer:
                     "moderator": "mage",
                     "user": "rogue",
                 }.get(role_key, "rogue")
+                self._pop_session(websocket)
                 self.sessions[websocket] = {
                     "user_id": user["id"],
                     "username": username,
@@ -2135,7 +3142,10 @@ class SimpleWsServer:
                     "position": {"x": 0.0, "y": 60.0, "z": 0.0},
                     "held_item_model_key": "",
                     "held_item_transform": None,
+                    "protocol_version": str(payload.get("protocol_version") or "").strip()[:32],
+                    "capabilities": self._negotiate_capabilities(payload.get("capabilities")),
                 }
+                self._index_session(websocket, self.sessions[websocket])
                 await self._send_response(
                     websocket,
                     req_id,
@@ -2143,6 +3153,7 @@ class SimpleWsServer:
                     {
                         "ok": True,
                         "network_config": self._network_config_payload(),
+                        "capabilities": sorted(self.sessions[websocket]["capabilities"]),
                         "user": {
                             "id": user["id"],
                             "username": user["username"],
@@ -2161,18 +3172,12 @@ class SimpleWsServer:
                 return
 
             if action == "logout":
-                session = self.sessions.pop(websocket, None)
+                session = self._pop_session(websocket)
                 if not session:
                     await self._send_response(websocket, req_id, action, {"ok": True, "message": "Sin sesión"})
                     return
 
-                if session.get("in_world") and session.get("world_name"):
-                    await self._broadcast_world_event(
-                        session["world_name"],
-                        "world_player_left",
-                        {"id": session.get("user_id"), "username": session.get("username")},
-                        exclude=websocket,
-                    )
+                await self._leave_world(websocket, session)
                 self._persist_session_position(session, force=True)
                 self.db.set_online_status(session["user_id"], False)
                 await self._send_response(websocket, req_id, action, {"ok": True})
@@ -2717,6 +3722,7 @@ class SimpleWsServer:
                 session["world_id"] = int(world["id"])
                 session["in_world"] = True
                 session["is_dead"] = False
+                self._index_session_world(websocket, session)
                 npc_slots = max(0, min(20, int(world.get("npc_slots") or 4)))
                 resolved_world_id, resolved_world, terrain_config, terrain_cells = self._resolve_session_world_and_terrain(session)
                 if not resolved_world or resolved_world_id <= 0:
@@ -2750,8 +3756,13 @@ class SimpleWsServer:
                     self.db.save_world_decor_state(int(world["id"]), decor_config, decor_slots, decor_removed_map)
                 decor_removed = list((decor_removed_map or {}).keys())
                 world_loot = list(self._world_loot_bucket(int(world["id"])).values())
-                voxel_overrides = self._list_voxel_overrides_payload(int(world["id"]))
-                voxel_block_defs = self._list_world_voxel_block_defs(int(world["id"]))
+                voxel_overrides, voxel_sync = self._voxel_sync_payload(int(world["id"]), payload.get("voxel_sync"))
+                # El cliente envia la version de defs que tiene guardada; si
+                # coincide no se reenvia la lista (voxel_block_defs = null).
+                voxel_block_defs_version = self._voxel_block_catalog()["version"]
+                voxel_block_defs = None
+                if str(payload.get("voxel_block_defs_version") or "") != voxel_block_defs_version:
+                    voxel_block_defs = self._list_world_voxel_block_defs(int(world["id"]))
 
                 spawn_hint = terrain_config.get("spawn_hint") or {"x": 0.0, "y": 60.0, "z": 0.0}
                 if user_row.get("last_pos_y") is None or float(spawn_y) > 200:
@@ -2771,6 +3782,9 @@ class SimpleWsServer:
                     session["spawn_hint"],
                 )
                 session["position"] = dict(session_pos)
+                session["view_distance_chunks"] = max(1, int(terrain_config.get("view_distance_chunks") or 3))
+                # El resync de enter_world ya incluye todo lo pendiente.
+                session["voxel_pending_chunks"] = set()
                 self._persist_session_position(session, force=True)
                 session["void_height"] = float(terrain_config.get("void_height") or -90.0)
                 session["fall_death_enabled"] = self._as_bool_flag(world.get("fall_death_enabled"), True)
@@ -2782,15 +3796,18 @@ class SimpleWsServer:
                 session["held_item_model_key"] = ""
                 session["held_item_transform"] = None
 
+                # Reentrada (otro mundo o el mismo): se rehace el AOI desde cero.
+                self._aoi_remove(websocket, session)
+                aoi = self._aoi_refresh(websocket, session)
                 other_players = []
-                for ws, sess in self.sessions.items():
-                    if ws == websocket:
-                        continue
-                    if not sess.get("in_world"):
-                        continue
-                    if sess.get("world_name") != world["world_name"]:
-                        continue
-                    other_players.append(self._session_world_player_payload(sess))
+                if "supports_player_aoi" in (session.get("capabilities") or ()):
+                    for ws in aoi[0]:
+                        other_players.append(self._session_world_player_payload(self.sessions[ws]))
+                else:
+                    for ws in self._world_clients(world["world_name"]):
+                        if ws == websocket:
+                            continue
+                        other_players.append(self._session_world_player_payload(self.sessions[ws]))
 
                 await self._send_response(
                     websocket,
@@ -2842,7 +3859,9 @@ class SimpleWsServer:
                         },
                         "world_loot": world_loot,
                         "voxel_overrides": voxel_overrides,
+                        "voxel_sync": voxel_sync,
                         "voxel_block_defs": voxel_block_defs,
+                        "voxel_block_defs_version": voxel_block_defs_version,
                         "spawn": session_pos,
                         "player": {
                             "id": user_row["id"],
@@ -2870,9 +3889,9 @@ class SimpleWsServer:
                     self._session_world_player_payload(session),
                     exclude=websocket,
                 )
-                await self._broadcast_world_event(
-                    world["world_name"],
-                    "world_player_moved",
+                await self._broadcast_player_moved(
+                    websocket,
+                    session,
                     {
                         "id": session.get("user_id"),
                         "username": session.get("username"),
@@ -2889,7 +3908,8 @@ class SimpleWsServer:
                         "held_item_transform": session.get("held_item_transform"),
                         "position": session_pos,
                     },
-                    exclude=websocket,
+                    aoi=aoi,
+                    notify_self=False,
                 )
                 self.log(
                     f"[WORLD] Entrada al mundo: user={session['username']} world={world['world_name']} "
@@ -3195,9 +4215,10 @@ class SimpleWsServer:
                 z = float(pos_now.get("z") or z)
 
                 await self._send_response(websocket, req_id, action, {"ok": True})
-                await self._broadcast_world_event(
-                    session["world_name"],
-                    "world_player_moved",
+                await self._flush_session_voxel_pending(websocket, session)
+                await self._broadcast_player_moved(
+                    websocket,
+                    session,
                     {
                         "id": session.get("user_id"),
                         "username": session.get("username"),
@@ -3214,7 +4235,6 @@ class SimpleWsServer:
                         "held_item_transform": session.get("held_item_transform"),
                         "position": {"x": x, "y": y, "z": z},
                     },
-                    exclude=websocket,
                 )
                 world_id = int(session.get("world_id") or 0)
                 if world_id > 0:
@@ -3242,6 +4262,71 @@ class SimpleWsServer:
                             )
                 return
 
+            if action == "world_chunk_request":
+                session = self.sessions.get(websocket)
+                if not session or not session.get("in_world") or not session.get("world_name"):
+                    await self._send_error(websocket, req_id, action, "No estas dentro de un mundo")
+                    return
+                chunks_raw = payload.get("chunks")
+                if not isinstance(chunks_raw, list) or len(chunks_raw) <= 0:
+                    await self._send_error(websocket, req_id, action, "Lista de chunks invalida")
+                    return
+                world_id, world, terrain_config, terrain_cells = self._resolve_session_world_and_terrain(session)
+                if not world or world_id <= 0:
+                    await self._send_error(websocket, req_id, action, "Mundo no encontrado")
+                    return
+                ctx = self._terrain_context(world, terrain_config, terrain_cells)
+                wanted: list[tuple[int, int]] = []
+                rejected: list[dict] = []
+                seen: set[tuple[int, int]] = set()
+                for row in chunks_raw[: max(1, int(self.chunk_request_max_per_call))]:
+                    item = row if isinstance(row, dict) else {}
+                    try:
+                        cx = int(item.get("cx"))
+                        cz = int(item.get("cz"))
+                    except Exception:
+                        rejected.append({"cx": item.get("cx"), "cz": item.get("cz"), "error": "Coordenadas invalidas"})
+                        continue
+                    if (cx, cz) in seen:
+                        continue
+                    seen.add((cx, cz))
+                    if not self._session_sees_chunk(session, cx, cz):
+                        rejected.append({"cx": cx, "cz": cz, "error": "Chunk fuera de distancia de vision"})
+                        continue
+                    wanted.append((cx, cz))
+                # Los chunks base que falten se generan fuera del loop (NumPy); sin
+                # NumPy solo chunk_request_max_sync_generate por llamada.
+                cached = self._world_chunk_payload_cache(ctx)["chunks"]
+                if HAS_NUMPY:
+                    await self._prepare_base_chunks(ctx, [key for key in wanted if key not in cached])
+                else:
+                    budget = max(0, int(self.chunk_request_max_sync_generate))
+                    ready = []
+                    for key in wanted:
+                        if key in cached:
+                            ready.append(key)
+                        elif budget > 0:
+                            budget -= 1
+                            ready.append(key)
+                        else:
+                            rejected.append({"cx": key[0], "cz": key[1], "error": "Chunk no disponible todavia", "retry": True})
+                    wanted = ready
+                chunks_out = [self._world_chunk_payload(world_id, ctx, cx, cz) for cx, cz in wanted]
+                await self._send_response(
+                    websocket,
+                    req_id,
+                    action,
+                    {
+                        "ok": True,
+                        "encoding": "u16le-zlib-b64",
+                        "chunk_size": CHUNK_SIZE,
+                        "height": ctx.height,
+                        "chunks": chunks_out,
+                        "rejected": rejected,
+                    },
+                )
+                return
+
             if action == "world_block_batch":
                 session = self.sessions.get(websocket)
                 if not session or not session.get("in_world") or not session.get("world_name"):
@@ -3268,7 +4353,9 @@ class SimpleWsServer:
                 dirty_chunks: set[tuple[int, int]] = set()
                 changes: list[dict] = []
                 results: list[dict] = []
+                ops: list[tuple[int, str, int, int, int, int]] = []
 
+                # Fase 1: validacion sin tocar el terreno.
                 for idx, row in enumerate(actions):
                     item = row if isinstance(row, dict) else {}
                     kind = (item.get("type") or item.get("action") or "").strip().lower()
@@ -3295,18 +4382,7 @@ class SimpleWsServer:
                         continue
 
                     if kind == "break":
-                        current = self._effective_block_id_at(world_id, world, terrain_config, terrain_cells, x, y, z)
-                        if current <= 0:
-                            results.append({"index": idx, "ok": False, "error": "No hay bloque para romper"})
-                            continue
-                        changed, dirty = self._set_voxel_override(
-                            world_id, world, terrain_config, terrain_cells, x, y, z, 0, persist_chunk=False
-                        )
-                        if changed:
-                            if dirty:
-                                dirty_chunks.add((int(dirty[0]), int(dirty[1])))
-                            changes.append({"x": x, "y": y, "z": z, "block_id": 0})
-                        results.append({"index": idx, "ok": True})
+                        ops.append((idx, kind, x, y, z, 0))
                         continue
 
                     block_id = max(1, int(item.get("block_id") or 2))
@@ -3317,24 +4393,37 @@ class SimpleWsServer:
                     ):
                         results.append({"index": idx, "ok": False, "error": "No puedes colocar bloque dentro del jugador"})
                         continue
-                    current = self._effective_block_id_at(world_id, world, terrain_config, terrain_cells, x, y, z)
-                    if current > 0:
+                    ops.append((idx, kind, x, y, z, block_id))
+
+                # Fase 2: bloques base de todos los destinos (un acceso por chunk)
+                # y aplicacion en orden. El estado actual se relee en cada paso
+                # porque varias acciones pueden tocar el mismo voxel.
+                base_ids = self._base_block_ids_at(world, terrain_config, terrain_cells, [op[2:5] for op in ops])
+                for idx, kind, x, y, z, block_id in ops:
+                    base = base_ids[(x, y, z)]
+                    current = self._effective_block_id_at(world_id, world, terrain_config, terrain_cells, x, y, z, base_block_id=base)
+                    if kind == "break" and current <= 0:
+                        results.append({"index": idx, "ok": False, "error": "No hay bloque para romper"})
+                        continue
+                    if kind == "place" and current > 0:
                         results.append({"index": idx, "ok": False, "error": "Destino ocupado"})
                         continue
                     changed, dirty = self._set_voxel_override(
-                        world_id, world, terrain_config, terrain_cells, x, y, z, block_id, persist_chunk=False
+                        world_id, world, terrain_config, terrain_cells, x, y, z, block_id, persist_chunk=False, base_block_id=base
                     )
                     if changed:
                         if dirty:
                             dirty_chunks.add((int(dirty[0]), int(dirty[1])))
                         changes.append({"x": x, "y": y, "z": z, "block_id": block_id})
                     results.append({"index": idx, "ok": True})
+                results.sort(key=lambda r: r["index"])
 
                 for cx, cz in dirty_chunks:
                     try:
                         self._persist_world_voxel_chunk(world_id, cx, cz)
                     except Exception:
                         pass
+                chunk_versions = self._voxel_chunk_versions_payload(world_id, dirty_chunks)
                 rejected_count = 0
                 for row in results:
                     if isinstance(row, dict) and row.get("ok") is False:
@@ -3356,23 +4445,17 @@ class SimpleWsServer:
                         "processed": len(actions),
                         "changes": changes,
                         "results": results,
+                        "chunk_versions": chunk_versions,
                     },
                 )
                 if changes:
-                    await self._broadcast_world_event(
+                    await self._broadcast_voxel_changes(
                         session["world_name"],
-                        "world_chunk_patch",
-                        {"changes": changes, "by": session.get("username")},
+                        changes,
+                        chunk_versions,
+                        session.get("username"),
                         exclude=websocket,
                     )
-                    # Compatibilidad adicional: replica tambien como eventos legacy individuales.
-                    for change in changes:
-                        await self._broadcast_world_event(
-                            session["world_name"],
-                            "world_block_changed",
-                            {"change": change, "by": session.get("username")},
-                            exclude=websocket,
-                        )
                 return
 
             if action == "world_block_break":
@@ -3405,18 +4488,22 @@ class SimpleWsServer:
                 if not world or world_id <= 0:
                     await self._send_error(websocket, req_id, action, "Mundo no encontrado")
                     return
-                current = self._effective_block_id_at(world_id, world, terrain_config, terrain_cells, x, y, z)
+                base = self._base_block_id_at(world, terrain_config, terrain_cells, x, y, z)
+                current = self._effective_block_id_at(world_id, world, terrain_config, terrain_cells, x, y, z, base_block_id=base)
                 if current <= 0:
                     await self._send_error(websocket, req_id, action, "No hay bloque para romper")
                     return
-                self._set_voxel_override(world_id, world, terrain_config, terrain_cells, x, y, z, 0)
+                self._set_voxel_override(world_id, world, terrain_config, terrain_cells, x, y, z, 0, base_block_id=base)
                 change = {"x": x, "y": y, "z": z, "block_id": 0}
-                await self._send_response(websocket, req_id, action, {"ok": True, "change": change})
-                await self._broadcast_world_event(
+                chunk_versions = self._voxel_chunk_versions_payload(world_id, [self._voxel_chunk_index(x, y, z)[:2]])
+                await self._send_response(websocket, req_id, action, {"ok": True, "change": change, "chunk_versions": chunk_versions})
+                await self._broadcast_voxel_changes(
                     session["world_name"],
-                    "world_block_changed",
-                    {"change": change, "by": session.get("username")},
+                    [change],
+                    chunk_versions,
+                    session.get("username"),
                     exclude=websocket,
+                    patch=False,
                 )
                 return
 
@@ -3463,18 +4550,22 @@ class SimpleWsServer:
                 if not world or world_id <= 0:
                     await self._send_error(websocket, req_id, action, "Mundo no encontrado")
                     return
-                current = self._effective_block_id_at(world_id, world, terrain_config, terrain_cells, x, y, z)
+                base = self._base_block_id_at(world, terrain_config, terrain_cells, x, y, z)
+                current = self._effective_block_id_at(world_id, world, terrain_config, terrain_cells, x, y, z, base_block_id=base)
                 if current > 0:
                     await self._send_error(websocket, req_id, action, "Destino ocupado")
                     return
-                self._set_voxel_override(world_id, world, terrain_config, terrain_cells, x, y, z, block_id)
+                self._set_voxel_override(world_id, world, terrain_config, terrain_cells, x, y, z, block_id, base_block_id=base)
                 change = {"x": x, "y": y, "z": z, "block_id": block_id}
-                await self._send_response(websocket, req_id, action, {"ok": True, "change": change})
-                await self._broadcast_world_event(
+                chunk_versions = self._voxel_chunk_versions_payload(world_id, [self._voxel_chunk_index(x, y, z)[:2]])
+                await self._send_response(websocket, req_id, action, {"ok": True, "change": change, "chunk_versions": chunk_versions})
+                await self._broadcast_voxel_changes(
                     session["world_name"],
-                    "world_block_changed",
-                    {"change": change, "by": session.get("username")},
+                    [change],
+                    chunk_versions,
+                    session.get("username"),
                     exclude=websocket,
+                    patch=False,
                 )
                 return
 